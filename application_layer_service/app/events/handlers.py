@@ -1,64 +1,44 @@
-from ..models import db, ApplicationComponent, ApplicationService, ApplicationInterface
-from common_utils.outbox import OutboxEvent
-import json
+from sqlalchemy import select
+from ..models import db, ApplicationComponent, ApplicationService, ApplicationInterface, OutboxEvent, ProcessedEvent
+from common_utils.outbox import bulk_event_handler
 import logging
 
 logger = logging.getLogger(__name__)
 
-def handle_capability_event(event_data):
+def _affected_rows(model, **filters):
+    """Stream the rows of ``model`` matching ``filters`` as dicts, without loading ORM objects"""
+    stmt = select(*model.__table__.columns).filter_by(**filters).execution_options(yield_per=1000)
+    for row in db.session.execute(stmt).mappings():
+        yield dict(row)
+
+def _fan_out(model, aggregate_type, event_type, **filters):
+    for row in _affected_rows(model, **filters):
+        yield {
+            'event_type': event_type,
+            'aggregate_type': aggregate_type,
+            'aggregate_id': row['id'],
+            'payload': row
+        }
+
+@bulk_event_handler(db, OutboxEvent, ProcessedEvent, consumer='application_layer.capability')
+def handle_capability_event(event_data, payload):
     """Handle capability events from the strategy service"""
-    try:
-        payload = json.loads(event_data.payload)
-        capability_id = payload.get('id')
-        
-        # Update application components related to the capability
-        components = ApplicationComponent.query.filter_by(capability_context_id=capability_id).all()
-        for component in components:
-            component.create_outbox_event(
-                event_type="ApplicationComponentCapabilityUpdated",
-                aggregate_type="ApplicationComponent",
-                aggregate_id=str(component.id),
-                payload=component.to_dict()
-            )
-            
-        # Update application services
-        services = ApplicationService.query.filter_by(capability_context_id=capability_id).all()
-        for service in services:
-            service.create_outbox_event(
-                event_type="ApplicationServiceCapabilityUpdated",
-                aggregate_type="ApplicationService",
-                aggregate_id=str(service.id),
-                payload=service.to_dict()
-            )
-        
-        db.session.commit()
-        logger.info(f"Processed capability event for {len(components)} components and {len(services)} services")
-        
-    except Exception as e:
-        logger.error(f"Error handling capability event: {str(e)}")
-        db.session.rollback()
-        raise
+    capability_id = payload.get('id')
 
-def handle_course_of_action_event(event_data):
+    # Re-emit related application components and services
+    yield from _fan_out(ApplicationComponent, "ApplicationComponent",
+                        "ApplicationComponentCapabilityUpdated",
+                        capability_context_id=capability_id)
+    yield from _fan_out(ApplicationService, "ApplicationService",
+                        "ApplicationServiceCapabilityUpdated",
+                        capability_context_id=capability_id)
+
+@bulk_event_handler(db, OutboxEvent, ProcessedEvent, consumer='application_layer.course_of_action')
+def handle_course_of_action_event(event_data, payload):
     """Handle course of action events from the strategy service"""
-    try:
-        payload = json.loads(event_data.payload)
-        coa_id = payload.get('id')
-        
-        # Update application interfaces
-        interfaces = ApplicationInterface.query.filter_by(course_of_action_context_id=coa_id).all()
-        for interface in interfaces:
-            interface.create_outbox_event(
-                event_type="ApplicationInterfaceCourseOfActionUpdated",
-                aggregate_type="ApplicationInterface",
-                aggregate_id=str(interface.id),
-                payload=interface.to_dict()
-            )
-        
-        db.session.commit()
-        logger.info(f"Processed course of action event for {len(interfaces)} interfaces")
-        
-    except Exception as e:
-        logger.error(f"Error handling course of action event: {str(e)}")
-        db.session.rollback()
-        raise
+    coa_id = payload.get('id')
+
+    # Re-emit related application interfaces
+    yield from _fan_out(ApplicationInterface, "ApplicationInterface",
+                        "ApplicationInterfaceCourseOfActionUpdated",
+                        course_of_action_context_id=coa_id)
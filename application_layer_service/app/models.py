@@ -1,6 +1,6 @@
 import uuid
 import datetime
-from common_utils.outbox import OutboxMixin
+from common_utils.outbox import OutboxMixin, OutboxEvent as OutboxEventBase, ProcessedEvent as ProcessedEventBase, OutboxArchive as OutboxArchiveBase
 from . import db
 
 <<<<<<< HEAD
@@ -114,27 +114,15 @@ class DataObject(db.Model):
 
 
 # Outbox Event model for cross-service data consistency
-class OutboxEvent(db.Model):
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    event_type = db.Column(db.String(100), nullable=False, index=True)
-    aggregate_type = db.Column(db.String(100), nullable=False)
-    aggregate_id = db.Column(db.String(36), nullable=False)
-    payload = db.Column(db.Text, nullable=False)
-    status = db.Column(db.String(20), default="pending", index=True)
-    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
-    processed_at = db.Column(db.DateTime, nullable=True)
-    error = db.Column(db.Text, nullable=True)
-    retry_count = db.Column(db.Integer, default=0)
+class OutboxEvent(OutboxEventBase, db.Model):
+    # Keeps the table name the service's outbox was created with
+    __tablename__ = 'outbox_event'
 
-    @classmethod
-    def create_event(cls, session, event_type, aggregate_type, aggregate_id, payload):
-        """Create a new outbox event"""
-        import json
-        event = cls(
-            event_type=event_type,
-            aggregate_type=aggregate_type,
-            aggregate_id=str(aggregate_id),
-            payload=json.dumps(payload)
-        )
-        session.add(event)
-        return event
+class ProcessedEvent(ProcessedEventBase, db.Model):
+    """Events from other services already handled by this service"""
+    pass
+
+class OutboxArchive(OutboxArchiveBase, db.Model):
+    """Completed outbox events moved out of the hot table by retention"""
+    # Replay looks for the archive as <outbox table>_archive
+    __tablename__ = 'outbox_event_archive'
@@ -0,0 +1,26 @@
+"""Add processed_events for idempotent event handling
+
+Revision ID: 5d6e7f8a9b0c
+Revises: 3c4d5e6f7g8h
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '5d6e7f8a9b0c'
+down_revision = '3c4d5e6f7g8h'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('processed_events',
+    sa.Column('consumer', sa.String(length=100), nullable=False),
+    sa.Column('event_id', sa.String(length=36), nullable=False),
+    sa.Column('processed_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('consumer', 'event_id')
+    )
+
+def downgrade():
+    op.drop_table('processed_events')
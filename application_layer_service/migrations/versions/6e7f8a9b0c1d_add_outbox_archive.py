@@ -0,0 +1,39 @@
+"""Add outbox_event_archive for outbox retention
+
+Revision ID: 6e7f8a9b0c1d
+Revises: 5d6e7f8a9b0c
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '6e7f8a9b0c1d'
+down_revision = '5d6e7f8a9b0c'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('outbox_event_archive',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('period', sa.String(length=6), nullable=False),
+    sa.Column('event_type', sa.String(length=100), nullable=False),
+    sa.Column('aggregate_type', sa.String(length=100), nullable=False),
+    sa.Column('aggregate_id', sa.String(length=36), nullable=False),
+    sa.Column('payload', sa.String(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('processed_at', sa.DateTime(), nullable=True),
+    sa.Column('error', sa.String(), nullable=True),
+    sa.Column('retry_count', sa.Integer(), nullable=True),
+    sa.Column('headers', sa.String(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_outbox_event_archive_period', 'outbox_event_archive', ['period'])
+    op.create_index('ix_outbox_event_archive_created_at_id', 'outbox_event_archive', ['created_at', 'id'])
+
+def downgrade():
+    op.drop_index('ix_outbox_event_archive_created_at_id', table_name='outbox_event_archive')
+    op.drop_index('ix_outbox_event_archive_period', table_name='outbox_event_archive')
+    op.drop_table('outbox_event_archive')
@@ -5,6 +5,7 @@ from .utils.versioning import api_version
 from .utils.identity import get_identity
 import logging
 from flask_jwt_extended import jwt_required
+from common_utils.auth_client import publish_auth_invalidation
 
 logger = logging.getLogger(__name__)
 bp = Blueprint('admin', __name__, url_prefix='/v1/admin')
@@ -106,6 +107,7 @@ def update_user(user_id):
         # Update fields
         if 'full_name' in data:
             user.full_name = data['full_name']
+        previous_role, previous_active = user.role, user.is_active
         if 'role' in data and current_user.role == 'vendor_admin':
             user.role = data['role']
         if 'is_active' in data:
@@ -126,6 +128,10 @@ def update_user(user_id):
         db.session.add(activity)
         db.session.commit()
         
+        # Let other services drop cached permissions for this user
+        if user.role != previous_role or user.is_active != previous_active:
+            publish_auth_invalidation(user.id, user.tenant_id)
+        
         return jsonify(user.to_dict()), 200
         
     except Exception as e:
@@ -158,8 +164,10 @@ def delete_user(user_id):
         )
         db.session.add(activity)
         
+        deleted_id, deleted_tenant_id = user.id, user.tenant_id
         db.session.delete(user)
         db.session.commit()
+        publish_auth_invalidation(deleted_id, deleted_tenant_id)
         
         return jsonify({'message': 'User deleted successfully'}), 200
         
@@ -0,0 +1,65 @@
+"""Add lease, retry schedule and trace header columns to outbox_event
+
+Revision ID: 2b3c4d5e6f7a
+Revises: 1a2b3c4d5e6f
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+# revision identifiers, used by Alembic.
+revision = '2b3c4d5e6f7a'
+down_revision = '1a2b3c4d5e6f'
+branch_labels = None
+depends_on = None
+
+UNFINISHED = sa.text("status IN ('pending', 'processing', 'failed')")
+
+def table_exists(table_name):
+    inspector = inspect(op.get_bind())
+    return table_name in inspector.get_table_names()
+
+def upgrade():
+    if not table_exists('outbox_event'):
+        # Outbox tables used to be created by db.create_all() on startup
+        op.create_table('outbox_event',
+        sa.Column('id', sa.String(length=36), nullable=False),
+        sa.Column('event_type', sa.String(length=100), nullable=False),
+        sa.Column('aggregate_type', sa.String(length=100), nullable=False),
+        sa.Column('aggregate_id', sa.String(length=36), nullable=False),
+        sa.Column('payload', sa.String(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('processed_at', sa.DateTime(), nullable=True),
+        sa.Column('error', sa.String(), nullable=True),
+        sa.Column('retry_count', sa.Integer(), nullable=True),
+        sa.Column('locked_by', sa.String(length=100), nullable=True),
+        sa.Column('locked_until', sa.DateTime(), nullable=True),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=True),
+        sa.Column('headers', sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_outbox_event_event_type', 'outbox_event', ['event_type'])
+        op.create_index('ix_outbox_event_status', 'outbox_event', ['status'])
+    else:
+        op.add_column('outbox_event', sa.Column('locked_by', sa.String(length=100), nullable=True))
+        op.add_column('outbox_event', sa.Column('locked_until', sa.DateTime(), nullable=True))
+        op.add_column('outbox_event', sa.Column('next_attempt_at', sa.DateTime(), nullable=True))
+        op.add_column('outbox_event', sa.Column('headers', sa.String(), nullable=True))
+        # Unfinished events are due straight away
+        op.execute("UPDATE outbox_event SET next_attempt_at = COALESCE(created_at, CURRENT_TIMESTAMP)")
+
+    op.create_index('ix_outbox_event_status_next_attempt_at', 'outbox_event', ['status', 'next_attempt_at'],
+                    postgresql_where=UNFINISHED, sqlite_where=UNFINISHED)
+    op.create_index('ix_outbox_event_aggregate_created_at', 'outbox_event', ['aggregate_type', 'aggregate_id', 'created_at'],
+                    postgresql_where=UNFINISHED, sqlite_where=UNFINISHED)
+
+def downgrade():
+    op.drop_index('ix_outbox_event_aggregate_created_at', table_name='outbox_event')
+    op.drop_index('ix_outbox_event_status_next_attempt_at', table_name='outbox_event')
+    op.drop_column('outbox_event', 'headers')
+    op.drop_column('outbox_event', 'next_attempt_at')
+    op.drop_column('outbox_event', 'locked_until')
+    op.drop_column('outbox_event', 'locked_by')
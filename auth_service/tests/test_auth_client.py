@@ -0,0 +1,146 @@
+import time
+import jwt
+import pytest
+from flask import Flask, jsonify, request
+from common_utils import auth_client as auth_client_module
+from common_utils.auth_client import (
+    auth_required, get_auth_cache, invalidate_auth_cache, get_auth_client,
+    publish_auth_invalidation, handle_auth_invalidation,
+)
+
+SECRET = 'local-validation-secret-0123456789'
+
+@pytest.fixture
+def service_app():
+    """Create a downstream service app that validates tokens locally."""
+    app = Flask(__name__)
+    app.config['TESTING'] = True
+    # Unreachable on purpose: no request may hit the auth service
+    app.config['AUTH_SERVICE_URL'] = 'http://127.0.0.1:9'
+    app.config['JWT_SECRET_KEY'] = SECRET
+    app.config['AUTH_CACHE_INVALIDATION'] = False
+
+    @app.route('/protected')
+    @auth_required(permissions=['read'])
+    def protected():
+        return jsonify({'user': request.user['sub']})
+
+    yield app
+    invalidate_auth_cache()
+
+def make_token(secret=SECRET, **claims):
+    claims.setdefault('sub', '1')
+    claims.setdefault('tenant_id', 7)
+    claims.setdefault('exp', int(time.time()) + 60)
+    claims.setdefault('type', 'access')
+    return jwt.encode(claims, secret, algorithm='HS256')
+
+def cache_permissions(permissions, user_id='1', tenant_id='7'):
+    get_auth_cache().set(('permissions', user_id, tenant_id, None), permissions)
+
+def test_token_validated_locally(service_app):
+    """Test valid tokens are accepted without calling the auth service."""
+    client = service_app.test_client()
+    cache_permissions(['read'])
+    token = make_token()
+    response = client.get('/protected', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+    assert response.json['user'] == '1'
+
+def test_auth_service_token_validated_locally(service_app):
+    """Test tokens shaped like auth_service's, with a dict subject, are accepted."""
+    client = service_app.test_client()
+    cache_permissions(['read'])
+    token = make_token(sub={'id': 1, 'tenant_id': 7, 'role': 'user'}, role='user')
+    response = client.get('/protected', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+    assert response.json['user']['id'] == 1
+
+def test_token_with_bad_signature_rejected(service_app):
+    """Test tokens signed with another key are rejected locally."""
+    client = service_app.test_client()
+    cache_permissions(['read'])
+    token = make_token(secret='another-secret-0123456789abcdef')
+    response = client.get('/protected', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 401
+
+def test_refresh_token_rejected(service_app):
+    """Test refresh tokens cannot be used as access tokens."""
+    client = service_app.test_client()
+    cache_permissions(['read'])
+    token = make_token(type='refresh')
+    response = client.get('/protected', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 401
+
+def test_missing_permission_forbidden(service_app):
+    """Test cached permissions are enforced."""
+    client = service_app.test_client()
+    cache_permissions(['write'])
+    token = make_token()
+    response = client.get('/protected', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 403
+
+def test_token_permission_claim_not_trusted(service_app):
+    """Test a stale permissions claim does not bypass the permission lookup."""
+    client = service_app.test_client()
+    cache_permissions([])
+    token = make_token(permissions=['read'])
+    response = client.get('/protected', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 403
+
+def test_invalidate_drops_only_the_users_entries():
+    """Test invalidation drops only the affected user's entries."""
+    cache = get_auth_cache()
+    cache.set(('initiative', '1', '7', '42'), True)
+    cache.set(('permissions', '1', '7', None), ['read'])
+    cache.set(('initiative', '2', '7', '42'), True)
+
+    invalidate_auth_cache(user_id=1, tenant_id=7)
+
+    assert cache.get(('initiative', '1', '7', '42')) is None
+    assert cache.get(('permissions', '1', '7', None)) is None
+    assert cache.get(('initiative', '2', '7', '42')) is True
+    invalidate_auth_cache()
+
+class _Response:
+    status_code = 200
+
+    def json(self):
+        return ['read']
+
+class _HttpClient:
+    def get(self, *args, **kwargs):
+        return _Response()
+
+def test_permissions_cached_per_resolved_user(service_app, monkeypatch):
+    """Test flat identities are cached by their ids and unresolved ones not at all."""
+    monkeypatch.setattr(auth_client_module, 'get_http_client', lambda: _HttpClient())
+    with service_app.app_context():
+        client = get_auth_client()
+        assert client.get_user_permissions('token', {'id': 5, 'tenant_id': 7}) == ['read']
+        assert get_auth_cache().get(('permissions', '5', '7', None)) == ['read']
+        invalidate_auth_cache()
+        assert client.get_user_permissions('token', {'email': 'a@example.com'}) == ['read']
+        assert len(get_auth_cache()) == 0
+
+class _Redis:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, channel, message):
+        self.published.append({'channel': channel, 'data': message})
+
+def test_published_invalidation_drops_the_users_entries():
+    """Test an invalidation published by auth_service is applied by listeners."""
+    cache = get_auth_cache()
+    cache.set(('permissions', '1', '7', None), ['read'])
+    cache.set(('permissions', '2', '7', None), ['read'])
+    redis_client = _Redis()
+
+    publish_auth_invalidation(1, 7, redis_client=redis_client)
+    for message in redis_client.published:
+        handle_auth_invalidation(message)
+
+    assert cache.get(('permissions', '1', '7', None)) is None
+    assert cache.get(('permissions', '2', '7', None)) == ['read']
+    invalidate_auth_cache()
@@ -208,4 +208,84 @@ def test_circuit_breaker_concurrent_operations(circuit_breaker):
     
     # Circuit breaker should be open
     assert circuit_breaker.is_open()
-    assert circuit_breaker.failure_count >= 3 
\ No newline at end of file
+    assert circuit_breaker.failure_count >= 3
+
+
+def test_bulkhead_rejects_when_saturated():
+    """Test bulkhead rejects calls once workers and queue are full."""
+    import threading
+    from common_utils.circuit_breaker import Bulkhead, BulkheadFullError
+
+    bulkhead = Bulkhead('test-saturated', max_concurrent=1, max_queued=1)
+    release = threading.Event()
+    try:
+        futures = [bulkhead.submit(release.wait), bulkhead.submit(release.wait)]
+
+        with pytest.raises(BulkheadFullError):
+            bulkhead.submit(release.wait)
+
+        stats = bulkhead.stats()
+        assert stats['active'] + stats['queued'] == 2
+        assert stats['rejected'] == 1
+        release.set()
+        for future in futures:
+            future.result(timeout=1)
+    finally:
+        release.set()
+        bulkhead.shutdown(wait=True)
+
+    assert bulkhead.stats()['active'] == 0
+    assert bulkhead.stats()['completed'] == 2
+
+
+def test_bulkhead_frees_slots_of_cancelled_queued_calls():
+    """Test timed out calls that never left the queue give their slot back."""
+    import threading
+    from concurrent.futures import TimeoutError as FutureTimeoutError
+    from common_utils.circuit_breaker import Bulkhead
+
+    bulkhead = Bulkhead('test-cancelled', max_concurrent=1, max_queued=2)
+    release = threading.Event()
+    try:
+        running = bulkhead.submit(release.wait)
+        for _ in range(2):
+            with pytest.raises(FutureTimeoutError):
+                bulkhead.execute(release.wait, timeout=0.05)
+
+        stats = bulkhead.stats()
+        assert stats['queued'] == 0
+        assert stats['timed_out'] == 2
+        # Both queue slots are usable again
+        queued = [bulkhead.submit(lambda: 'ok'), bulkhead.submit(lambda: 'ok')]
+        release.set()
+        assert running.result(timeout=1) is True
+        assert [f.result(timeout=1) for f in queued] == ['ok', 'ok']
+        assert bulkhead.stats()['rejected'] == 0
+    finally:
+        release.set()
+        bulkhead.shutdown(wait=True)
+
+
+def test_circuit_breaker_timeout_uses_bounded_workers(app):
+    """Test timed out calls do not spawn a thread per call."""
+    import threading
+    from common_utils.circuit_breaker import Bulkhead, CircuitBreakerError
+
+    bulkhead = Bulkhead('test-timeout', max_concurrent=2, max_queued=0)
+    breaker = CircuitBreaker(failure_threshold=10, name='test-timeout', bulkhead=bulkhead)
+    release = threading.Event()
+    threads_before = threading.active_count()
+    try:
+        with app.app_context():
+            for _ in range(5):
+                with pytest.raises(CircuitBreakerError):
+                    breaker.execute(release.wait, timeout=0.05)
+
+        assert threading.active_count() <= threads_before + 2
+        assert bulkhead.stats()['timed_out'] == 2
+        assert bulkhead.stats()['rejected'] == 3
+        # Only timeouts count as dependency failures
+        assert breaker.failure_count == 2
+    finally:
+        release.set()
+        bulkhead.shutdown(wait=True)
@@ -0,0 +1,142 @@
+import time
+import asyncio
+import httpx
+import pytest
+import requests
+from flask import Flask, g
+from common_utils.http import (
+    ServiceHTTPClient, AsyncServiceHTTPClient, RetryBudget, DeadlineExceeded,
+    DEADLINE_HEADER, TIMEOUT_HEADER, init_deadline_propagation, current_deadline
+)
+
+URL = 'http://inventory:5000/items'
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+def _client(outcomes, calls, **kwargs):
+    """Client whose pooled session returns/raises ``outcomes`` in order"""
+    kwargs.setdefault('backoff_base', 0)
+    client = ServiceHTTPClient(**kwargs)
+    session = client.session_for(URL)
+
+    def fake_request(method, url, headers=None, timeout=None, **kw):
+        calls.append({'method': method, 'headers': dict(headers or {}), 'timeout': timeout})
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return FakeResponse(outcome)
+
+    session.request = fake_request
+    return client
+
+def test_retries_idempotent_requests_on_gateway_errors_and_connect_errors():
+    calls = []
+    client = _client([503, requests.exceptions.ConnectionError('refused'), 200], calls)
+    assert client.get(URL).status_code == 200
+    assert len(calls) == 3
+
+def test_does_not_retry_non_idempotent_requests():
+    calls = []
+    client = _client([503], calls)
+    assert client.post(URL, json={}).status_code == 503
+    assert len(calls) == 1
+    with pytest.raises(requests.exceptions.ConnectionError):
+        _client([requests.exceptions.ConnectionError('refused')], calls).post(URL)
+
+def test_gives_up_after_max_retries():
+    calls = []
+    client = _client([502, 502, 502, 200], calls, max_retries=2)
+    assert client.get(URL).status_code == 502
+    assert len(calls) == 3
+
+def test_retry_budget_limits_retries():
+    budget = RetryBudget(ratio=0, min_per_second=0, max_tokens=1)
+    calls = []
+    client = _client([503, 503, 503, 503], calls, retry_budget=budget, max_retries=5)
+    assert client.get(URL).status_code == 503
+    # One token allows exactly one retry
+    assert len(calls) == 2
+    assert not budget.withdraw()
+
+def test_retry_budget_refills_from_traffic():
+    budget = RetryBudget(ratio=0.5, min_per_second=0, max_tokens=1)
+    budget._tokens = 0
+    budget.deposit()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert budget.withdraw()
+
+def _deadline_app(**config):
+    app = Flask(__name__)
+    app.config.update(config)
+    init_deadline_propagation(app)
+
+    @app.route('/deadline')
+    def deadline():
+        return {'deadline': current_deadline()}
+
+    return app
+
+def test_deadline_read_from_headers():
+    client = _deadline_app().test_client()
+    assert client.get('/deadline', headers={DEADLINE_HEADER: '1234.5'}).json['deadline'] == 1234.5
+    relative = client.get('/deadline', headers={TIMEOUT_HEADER: '2'}).json['deadline']
+    assert 1.5 < relative - time.time() <= 2
+    assert client.get('/deadline', headers={DEADLINE_HEADER: 'soon'}).json['deadline'] is None
+    assert client.get('/deadline').json['deadline'] is None
+
+def test_default_deadline_applies_without_header():
+    client = _deadline_app(REQUEST_DEFAULT_DEADLINE=3).test_client()
+    assert 2.5 < client.get('/deadline').json['deadline'] - time.time() <= 3
+
+def test_outbound_timeout_clamped_to_deadline_and_propagated():
+    app = Flask(__name__)
+    calls = []
+    client = _client([200], calls)
+    with app.test_request_context():
+        g.request_deadline = time.time() + 0.5
+        client.get(URL, timeout=10)
+        assert calls[0]['timeout'] <= 0.5
+        assert float(calls[0]['headers'][DEADLINE_HEADER]) == pytest.approx(g.request_deadline, abs=0.001)
+
+        g.request_deadline = time.time() - 1
+        with pytest.raises(DeadlineExceeded):
+            client.get(URL)
+    assert len(calls) == 1
+
+def _async_client(handler, **kwargs):
+    kwargs.setdefault('backoff_base', 0)
+    client = AsyncServiceHTTPClient(**kwargs)
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+def test_async_client_retries_and_propagates_deadline():
+    statuses = [503, 200]
+    seen = []
+
+    def handler(request):
+        seen.append(request.headers.get(DEADLINE_HEADER))
+        return httpx.Response(statuses.pop(0))
+
+    async def run():
+        client = _async_client(handler)
+        try:
+            return await client.get(URL, deadline=time.time() + 5)
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(run()).status_code == 200
+    assert len(seen) == 2 and all(seen)
+
+def test_async_client_respects_expired_deadline():
+    async def run():
+        client = _async_client(lambda request: httpx.Response(200))
+        try:
+            await client.get(URL, deadline=time.time() - 1)
+        finally:
+            await client.aclose()
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(run())
@@ -0,0 +1,54 @@
+import pytest
+from collections import Counter
+from common_utils.load_balancer import LoadBalancer, NoHealthyInstances
+
+INSTANCES = [{'id': f'svc-{i}', 'address': f'10.0.0.{i}', 'port': 5000} for i in range(3)]
+
+def test_p2c_spreads_load():
+    """Test requests spread over all instances instead of the first one."""
+    balancer = LoadBalancer()
+    counts = Counter(balancer.pick(INSTANCES)['id'] for _ in range(3000))
+    assert set(counts) == {i['id'] for i in INSTANCES}
+    assert min(counts.values()) > 700
+
+def test_p2c_prefers_faster_instance():
+    """Test instances with lower latency get more traffic."""
+    balancer = LoadBalancer()
+    for _ in range(20):
+        for instance, latency in zip(INSTANCES, (0.01, 0.5, 0.5)):
+            balancer.acquire(instance)
+            balancer.release(instance, latency, True, len(INSTANCES))
+    counts = Counter(balancer.pick(INSTANCES)['id'] for _ in range(900))
+    assert counts['svc-0'] > counts['svc-1'] + counts['svc-2']
+
+def test_least_outstanding_avoids_busy_instance():
+    """Test least-outstanding never picks an instance with more requests in flight."""
+    balancer = LoadBalancer(strategy='least_outstanding')
+    balancer.acquire(INSTANCES[0])
+    assert {balancer.pick(INSTANCES)['id'] for _ in range(50)} == {'svc-1', 'svc-2'}
+
+def test_failing_instance_is_ejected():
+    """Test consecutive failures eject an instance, but never most of the pool."""
+    balancer = LoadBalancer(consecutive_failures=3)
+    for instance in INSTANCES[:2]:
+        for _ in range(3):
+            balancer.acquire(instance)
+            balancer.release(instance, 0.01, False, len(INSTANCES))
+    stats = balancer.stats()
+    # Only one third of 3 instances fits within the 50% ejection limit
+    assert stats['svc-0']['ejected'] and not stats['svc-1']['ejected']
+    assert 'svc-0' not in {balancer.pick(INSTANCES)['id'] for _ in range(100)}
+
+def test_no_instances():
+    with pytest.raises(NoHealthyInstances):
+        LoadBalancer().pick([])
+
+def test_call_records_exceptions_as_failures():
+    """Test the call context manager tracks outstanding requests and failures."""
+    balancer = LoadBalancer()
+    with pytest.raises(RuntimeError):
+        with balancer.call(INSTANCES[:1]) as outcome:
+            assert balancer.stats()['svc-0']['outstanding'] == 1
+            raise RuntimeError('connection refused')
+    stats = balancer.stats()['svc-0']
+    assert stats['outstanding'] == 0 and stats['ewma_error'] > 0
@@ -0,0 +1,92 @@
+import io
+import json
+import queue
+import logging
+import time
+from common_utils.logging import QueueLogHandler, LogWriter, configure_logging, shutdown_logging
+
+def _logger(name, handler):
+    logger = logging.getLogger(name)
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    return logger
+
+class SlowStream(io.StringIO):
+    def write(self, data):
+        time.sleep(0.2)
+        return super().write(data)
+
+def test_slow_stream_does_not_block_logging():
+    """Test logging returns immediately and drops records once the queue is full."""
+    log_queue = queue.Queue(maxsize=10)
+    handler = QueueLogHandler(log_queue)
+    stream = SlowStream()
+    writer = LogWriter(log_queue, handler, stream=stream)
+    writer.start()
+    logger = _logger('test.slow', handler)
+
+    started = time.monotonic()
+    for i in range(100):
+        logger.info('record %s', i)
+    assert time.monotonic() - started < 0.1
+    writer.stop()
+
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    written = [line for line in lines if line['message'].startswith('record')]
+    assert 10 <= len(written) < 100
+    report = [line for line in lines if line['message'] == 'log_records_dropped']
+    assert report[0]['dropped']['test.slow']['queue_full'] == 100 - len(written)
+
+def test_rate_limits_and_sampling_spare_warnings():
+    """Test per-logger limits apply below WARNING only."""
+    log_queue = queue.Queue()
+    handler = QueueLogHandler(log_queue, rate_limits={'test.limited': 5}, sample_rates={'test.sampled': 0.0})
+    limited = _logger('test.limited.child', handler)
+    sampled = _logger('test.sampled', handler)
+    for _ in range(20):
+        limited.info('chatty')
+        sampled.debug('noise')
+    sampled.error('important')
+    messages = [log_queue.get_nowait().getMessage() for _ in range(log_queue.qsize())]
+    assert messages.count('chatty') == 5
+    assert messages == ['chatty'] * 5 + ['important']
+    assert handler.take_dropped() == {('test.limited.child', 'rate_limited'): 15,
+                                      ('test.sampled', 'sampled'): 20}
+
+def test_structlog_events_render_as_json():
+    """Test structlog key/values and stdlib extras end up as JSON fields."""
+    stream = io.StringIO()
+    # Importing a service app already set up the pipeline on stdout
+    shutdown_logging()
+    configure_logging(stream=stream)
+    try:
+        import structlog
+        structlog.get_logger('test.audit').info('audit_event', event_type='node_created', user_id=7)
+        logging.getLogger('test.plain').warning('plain %s', 'message', extra={'node_id': 3})
+    finally:
+        shutdown_logging()
+    lines = {line['logger']: line for line in map(json.loads, stream.getvalue().splitlines())}
+    assert lines['test.audit']['message'] == 'audit_event'
+    assert lines['test.audit']['event_type'] == 'node_created' and lines['test.audit']['user_id'] == 7
+    assert lines['test.plain'] == {**lines['test.plain'], 'message': 'plain message', 'level': 'warning', 'node_id': 3}
+
+def test_records_are_prepared_before_queueing():
+    """Test queued records hold the message as logged and the exception as text."""
+    log_queue = queue.Queue()
+    handler = QueueLogHandler(log_queue)
+    logger = _logger('test.prepared', handler)
+    items = ['a']
+    logger.info('items %s', items)
+    items.append('b')
+    try:
+        raise ValueError('boom')
+    except ValueError:
+        logger.exception('failed')
+    logger.info({'event': 'structured', 'count': 2})
+
+    logged, failed, structured = [log_queue.get_nowait() for _ in range(3)]
+    assert logged.msg == "items ['a']" and logged.args is None
+    assert failed.exc_info is None and 'ValueError: boom' in failed.exc_text
+    assert json.loads(LogWriter(log_queue, handler).formatter.format(failed))['exception'] == failed.exc_text
+    assert structured.msg == {'event': 'structured', 'count': 2}
@@ -0,0 +1,61 @@
+import json
+import datetime
+import pytest
+from flask import Flask
+from opentelemetry.sdk.trace import TracerProvider
+from app import db
+from app.models import OutboxEvent
+from common_utils.outbox import OutboxProcessor, EventStatus, emit_events
+
+@pytest.fixture
+def outbox_app(tmp_path):
+    """Create a minimal app with the service's outbox table on SQLite."""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'outbox.db'}"
+    db.init_app(app)
+    with app.app_context():
+        OutboxEvent.__table__.create(db.engine)
+        yield app
+        db.session.remove()
+        OutboxEvent.__table__.drop(db.engine)
+
+def test_events_of_crashed_worker_are_reclaimed(outbox_app):
+    """Test an event whose lease expired is claimed and processed by another worker."""
+    OutboxEvent.create_event(db.session, 'user_updated', 'user', 1, {'id': 1})
+    db.session.commit()
+    crashed = OutboxProcessor(db, OutboxEvent, worker_id='worker-1')
+    assert len(crashed.claim_batch(limit=10)) == 1
+
+    handled = []
+    survivor = OutboxProcessor(db, OutboxEvent, {'user_updated': lambda *args: handled.append(args[0])},
+                               worker_id='worker-2')
+    assert survivor.process_pending_events(limit=10) == 0
+
+    event = OutboxEvent.query.one()
+    event.locked_until = datetime.datetime.utcnow() - datetime.timedelta(seconds=1)
+    db.session.commit()
+    try:
+        assert survivor.process_pending_events(limit=10) == 1
+    finally:
+        survivor.stop()
+
+    assert handled == ['1']
+    event = db.session.get(OutboxEvent, event.id)
+    assert event.status == EventStatus.COMPLETED.value
+    assert event.locked_by is None
+
+def test_events_carry_trace_context_of_the_write(outbox_app):
+    """Test single and bulk events store the writer's trace context and origin."""
+    tracer = TracerProvider().get_tracer(__name__)
+    with tracer.start_as_current_span('write') as span:
+        OutboxEvent.create_event(db.session, 'user_updated', 'user', 1, {'id': 1})
+        emit_events(db.session, OutboxEvent, [
+            {'event_type': 'user_updated', 'aggregate_type': 'user', 'aggregate_id': 2, 'payload': {'id': 2}},
+        ])
+        db.session.commit()
+    trace_id = format(span.get_span_context().trace_id, '032x')
+
+    for event in OutboxEvent.query.all():
+        headers = json.loads(event.headers)
+        assert trace_id in headers['traceparent']
+        assert 'origin_ts' in headers
@@ -0,0 +1,40 @@
+import threading
+from flask import Flask
+from common_utils.profiling import init_debug_endpoints, sample_stacks
+
+def _busy_loop(stop):
+    while not stop.is_set():
+        sum(i * i for i in range(1000))
+
+def test_sample_stacks_finds_busy_thread():
+    """Test the sampler attributes samples to the function burning CPU."""
+    stop = threading.Event()
+    worker = threading.Thread(target=_busy_loop, args=(stop,), name='busy')
+    worker.start()
+    try:
+        stacks = sample_stacks(0.3, interval=0.005)
+    finally:
+        stop.set()
+        worker.join()
+    busy = sum(n for stack, n in stacks.items() if stack.startswith('busy;') and '_busy_loop' in stack)
+    assert busy > 10
+
+def test_debug_endpoints():
+    """Test profile and heap endpoints return collapsed stacks and allocation diffs."""
+    app = Flask(__name__)
+    app.config['DEBUG_ENDPOINTS_ENABLED'] = True
+    init_debug_endpoints(app)
+    client = app.test_client()
+
+    response = client.get('/debug/profile?seconds=0.2&idle=1')
+    assert response.mimetype == 'text/plain'
+    assert all(line.rsplit(' ', 1)[1].isdigit() for line in response.get_data(as_text=True).splitlines())
+
+    report = client.get('/debug/heap?seconds=0.1&limit=5').get_json()
+    assert report['group_by'] == 'lineno' and len(report['top']) <= 5
+    assert client.get('/debug/heap?group_by=bogus').status_code == 400
+
+def test_debug_endpoints_need_protection_by_default():
+    app = Flask(__name__)
+    init_debug_endpoints(app)
+    assert app.test_client().get('/debug/profile?seconds=0.1').status_code == 404
@@ -0,0 +1,63 @@
+import pytest
+from flask import Flask, jsonify
+from sqlalchemy import create_engine, text
+from common_utils.query_budget import (
+    init_query_budget, query_budget, track_queries, normalize_statement, QueryBudgetExceeded, QueryStats
+)
+
+def _app(**config):
+    app = Flask(__name__)
+    app.config.update(TESTING=True, QUERY_REPEAT_THRESHOLD=5, **config)
+    init_query_budget(app)
+    engine = create_engine('sqlite://')
+
+    @app.route('/n-plus-one')
+    def n_plus_one():
+        with engine.connect() as conn:
+            rows = [conn.execute(text('SELECT :id'), {'id': i}).scalar() for i in range(10)]
+        return jsonify(rows)
+
+    @app.route('/budgeted')
+    @query_budget(1)
+    def budgeted():
+        with engine.connect() as conn:
+            conn.execute(text('SELECT 1')).all()
+            conn.execute(text('SELECT 2')).all()
+        return jsonify([])
+
+    return app
+
+def test_normalize_statement():
+    assert normalize_statement("SELECT * FROM t WHERE id IN (1, 2, 3) AND name = 'x''y'") == \
+        "SELECT * FROM t WHERE id IN (?) AND name = ?"
+    assert normalize_statement("SELECT a\n  FROM t WHERE b = :b_1") == "SELECT a FROM t WHERE b = ?"
+
+def test_repeated_statement_raises_in_test_mode():
+    """Test a query per row fails the request under TESTING."""
+    with pytest.raises(QueryBudgetExceeded, match='possible N\\+1'):
+        _app().test_client().get('/n-plus-one')
+
+def test_budget_exceeded_only_logs_in_production(caplog):
+    """Test budgets log instead of raising when QUERY_BUDGET_RAISE is off."""
+    response = _app(QUERY_BUDGET_RAISE=False).test_client().get('/budgeted')
+    assert response.status_code == 200
+    assert 'issued 2 queries, budget is 1' in caplog.text
+
+def test_track_queries_outside_requests():
+    engine = create_engine('sqlite://')
+    with track_queries() as stats:
+        with engine.connect() as conn:
+            for i in range(3):
+                conn.execute(text('SELECT :id'), {'id': i}).all()
+    assert stats.count == 3
+    assert stats.repeated(3) == [('SELECT ?', 3)]
+
+def test_statements_are_normalized_when_reported():
+    """Test raw statements are counted and only grouped into shapes on report."""
+    stats = QueryStats()
+    for i in range(3):
+        stats.record(f"SELECT * FROM nodes WHERE id = {i}")
+    stats.record('SELECT * FROM nodes WHERE id = 0')
+    assert stats.statements['SELECT * FROM nodes WHERE id = 0'] == 2
+    assert stats.repeated(4) == [('SELECT * FROM nodes WHERE id = ?', 4)]
+    assert stats.repeated(5) == []
@@ -0,0 +1,51 @@
+import re
+import time
+from flask import Flask, jsonify
+from sqlalchemy import create_engine, text
+from common_utils.server_timing import init_server_timing, timed
+
+def _timings(response):
+    header = response.headers['Server-Timing']
+    return {name: float(dur) for name, dur in re.findall(r'(\w+);dur=([\d.]+)', header)}
+
+def _app():
+    app = Flask(__name__)
+    init_server_timing(app)
+    engine = create_engine('sqlite://')
+
+    @app.route('/items')
+    def items():
+        with engine.connect() as conn:
+            conn.execute(text('SELECT 1')).all()
+            conn.execute(text('SELECT 2')).all()
+        with timed('cache'):
+            time.sleep(0.02)
+        return jsonify({'items': list(range(10))})
+
+    return app
+
+def test_server_timing_header_breaks_down_request():
+    """Test each component shows up in the header and they add up to the total."""
+    response = _app().test_client().get('/items')
+    timings = _timings(response)
+    assert {'db', 'cache', 'serialize', 'app', 'total'} <= set(timings)
+    assert timings['cache'] >= 20
+    assert '"2 calls"' in response.headers['Server-Timing']
+    parts = sum(v for k, v in timings.items() if k != 'total')
+    assert abs(parts - timings['total']) < 1
+
+def test_nested_components_are_exclusive():
+    """Test time in a nested component is not counted twice."""
+    app = Flask(__name__)
+    init_server_timing(app)
+
+    @app.route('/nested')
+    def nested():
+        with timed('serialize'):
+            with timed('db'):
+                time.sleep(0.03)
+        return 'ok'
+
+    timings = _timings(app.test_client().get('/nested'))
+    assert timings['db'] >= 30
+    assert timings['serialize'] < 10
@@ -0,0 +1,243 @@
+import pytest
+from collections import Counter
+from common_utils.service_registry import ServiceDiscoveryCache, ServiceRegistry, diff_snapshots, KV_PREFIX
+
+def entry(service, instance_id, status='passing'):
+    return {
+        'Node': {'Node': 'node-1', 'Address': '10.0.0.1'},
+        'Service': {'ID': instance_id, 'Service': service, 'Address': '', 'Port': 5000,
+                    'Tags': [], 'Meta': {}},
+        'Checks': [{'CheckID': f'check-{instance_id}', 'Name': 'HTTP Health',
+                    'Status': status, 'Output': ''}],
+    }
+
+class FakeHealth:
+    def __init__(self, consul_client):
+        self.consul = consul_client
+
+    def service(self, name, passing=False):
+        self.consul.fetches[name] += 1
+        if self.consul.down:
+            raise ConnectionError('consul down')
+        entries = self.consul.services.get(name, [])
+        if passing:
+            entries = [e for e in entries if e['Checks'][0]['Status'] == 'passing']
+        return 1, entries
+
+    def state(self, check_state, index=None, wait=None):
+        if not self.consul.states:
+            # Script exhausted: end the watch loop without a new index
+            self.consul.cache.stop()
+            return index, []
+        return self.consul.states.pop(0)
+
+class FakeCatalog:
+    def __init__(self, consul_client):
+        self.consul = consul_client
+        self.calls = 0
+
+    def services(self):
+        self.calls += 1
+        if self.consul.down:
+            raise ConnectionError('consul down')
+        return 1, {name: [] for name in self.consul.services}
+
+class StopWatching(BaseException):
+    """Ends the KV watch loop, which only stops on BaseException"""
+
+class FakeKV:
+    """Consul KV answering blocking queries from a script of (index, entries)"""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.requests = []
+
+    def get(self, key, recurse=False, index=None, wait=None):
+        self.requests.append((key, recurse, index))
+        if not self.responses:
+            raise StopWatching()
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+def kv_entry(key, value, modify_index):
+    return {'Key': key, 'Value': value.encode('utf-8') if value is not None else None,
+            'ModifyIndex': modify_index}
+
+class FakeConsul:
+    """Consul client serving ``services`` and a scripted sequence of health states"""
+
+    def __init__(self, services):
+        self.services = services
+        self.fetches = Counter()
+        self.states = []
+        self.down = False
+        self.cache = None
+        self.health = FakeHealth(self)
+        self.catalog = FakeCatalog(self)
+
+    def checks(self, node_status='passing'):
+        """The current health.state result"""
+        checks = [{'Node': 'node-1', 'CheckID': 'serfHealth', 'ServiceID': '', 'ServiceName': '',
+                   'Status': node_status}]
+        for name, entries in self.services.items():
+            for e in entries:
+                checks.append({'Node': 'node-1', 'CheckID': e['Checks'][0]['CheckID'],
+                               'ServiceID': e['Service']['ID'], 'ServiceName': name,
+                               'Status': e['Checks'][0]['Status']})
+        return checks
+
+def make_cache(consul_client):
+    cache = ServiceDiscoveryCache(consul_client, retry_interval=0)
+    cache._ensure_watcher = lambda: None
+    consul_client.cache = cache
+    return cache
+
+def test_lookups_are_served_from_memory():
+    """Test only the first lookup of a service reaches Consul."""
+    consul_client = FakeConsul({'orders': [entry('orders', 'orders-1')]})
+    cache = make_cache(consul_client)
+    for _ in range(3):
+        (instance,) = cache.get_instances('orders')
+    assert instance['address'] == '10.0.0.1'
+    assert consul_client.fetches == {'orders': 1}
+
+def test_watch_refreshes_only_changed_services():
+    """Test a health change re-reads the affected service, not every known one."""
+    consul_client = FakeConsul({
+        'orders': [entry('orders', 'orders-1'), entry('orders', 'orders-2')],
+        'billing': [entry('billing', 'billing-1')],
+    })
+    cache = make_cache(consul_client)
+    cache.get_instances('orders')
+    cache.get_instances('billing')
+    consul_client.states.append((10, consul_client.checks()))
+    cache._watch()
+    # The first state has nothing to compare with, so everything is re-read
+    assert consul_client.fetches == {'orders': 2, 'billing': 2}
+
+    consul_client.services['orders'][1]['Checks'][0]['Status'] = 'critical'
+    consul_client.states.append((11, consul_client.checks()))
+    cache._stop.clear()
+    cache._watch()
+    assert consul_client.fetches == {'orders': 3, 'billing': 2}
+    assert [i['id'] for i in cache.get_instances('orders')] == ['orders-1']
+
+    # A node check affects every service on the node
+    consul_client.states.append((12, consul_client.checks(node_status='critical')))
+    cache._stop.clear()
+    cache._watch()
+    assert consul_client.fetches == {'orders': 4, 'billing': 3}
+
+def test_listeners_get_incremental_membership_changes():
+    """Test listeners see joins, leaves and deregistrations from incremental refreshes."""
+    consul_client = FakeConsul({
+        'orders': [entry('orders', 'orders-1')],
+        'billing': [entry('billing', 'billing-1')],
+    })
+    cache = make_cache(consul_client)
+    diffs = []
+    cache.add_listener(diffs.append)
+    consul_client.states.append((10, consul_client.checks()))
+    cache._watch()
+    assert diffs == []
+
+    consul_client.services['orders'].append(entry('orders', 'orders-2'))
+    consul_client.states.append((11, consul_client.checks()))
+    del consul_client.services['billing']
+    consul_client.states.append((12, consul_client.checks()))
+    fetched = dict(consul_client.fetches)
+    cache._stop.clear()
+    cache._watch()
+    assert diffs == [
+        {'added': [], 'removed': [], 'changed': {'orders': {'added': ['orders-2'], 'removed': []}}},
+        {'added': [], 'removed': ['billing'], 'changed': {}},
+    ]
+    assert consul_client.fetches['orders'] == fetched['orders'] + 1
+    assert consul_client.fetches['billing'] == fetched['billing']
+    assert sorted(cache.snapshot()) == ['orders']
+
+def test_consul_errors_keep_cached_instances():
+    """Test instances are still served while Consul fails."""
+    consul_client = FakeConsul({'orders': [entry('orders', 'orders-1')]})
+    cache = make_cache(consul_client)
+    cache.get_instances('orders')
+    consul_client.down = True
+    cache.refresh()
+    assert [i['id'] for i in cache.get_instances('orders')] == ['orders-1']
+    assert cache.stats()['consul_available'] is False
+
+def test_diff_snapshots_reports_services_and_instances():
+    """Test diffs list added and removed services and instance changes per service."""
+    previous = {
+        'orders': [{'id': 'orders-1'}, {'id': 'orders-2'}],
+        'billing': [{'id': 'billing-1'}],
+        'legacy': [{'id': 'legacy-1'}],
+    }
+    current = {
+        'orders': [{'id': 'orders-2'}, {'id': 'orders-3'}],
+        'billing': [{'id': 'billing-1'}],
+        'search': [],
+    }
+    assert diff_snapshots(previous, current) == {
+        'added': ['search'],
+        'removed': ['legacy'],
+        'changed': {'orders': {'added': ['orders-3'], 'removed': ['orders-1']}},
+    }
+    assert diff_snapshots(current, current) == {'added': [], 'removed': [], 'changed': {}}
+
+def test_snapshot_is_reused_and_survives_consul_errors():
+    """Test snapshots are cached for their ttl and the last one is served on errors."""
+    consul_client = FakeConsul({
+        'orders': [entry('orders', 'orders-1'), entry('orders', 'orders-2', status='critical')],
+        'billing': [entry('billing', 'billing-1')],
+    })
+    cache = make_cache(consul_client)
+    snapshot = cache.snapshot()
+    assert {name: [i['id'] for i in instances] for name, instances in snapshot.items()} == {
+        'orders': ['orders-1'], 'billing': ['billing-1'],
+    }
+    assert cache.snapshot() is snapshot
+    assert consul_client.catalog.calls == 1
+    # Building a snapshot also warms lookups
+    cache.get_instances('billing')
+    assert consul_client.fetches['billing'] == 1
+
+    consul_client.down = True
+    assert cache.snapshot(max_age=0) is snapshot
+    assert consul_client.catalog.calls == 2
+
+def test_kv_watch_calls_back_once_per_change(monkeypatch):
+    """Test watched keys trigger their callback once per modification."""
+    registry = ServiceRegistry()
+    seen = []
+    registry.watching_keys = {
+        'reqarchitect/cache/redis_endpoints': lambda v: seen.append(('cache', v)),
+        'reqarchitect/services/orders/config': lambda v: seen.append(('config', v)),
+        # A failing callback must not stop the others
+        'reqarchitect/services/broken/config': lambda v: 1 / 0,
+    }
+    registry.consul_client = FakeConsul({})
+    registry.consul_client.kv = FakeKV([
+        (5, [kv_entry('reqarchitect/cache/redis_endpoints', 'redis:6379', 3),
+             kv_entry('reqarchitect/services/orders/config', '{"A": 1}', 4),
+             kv_entry('reqarchitect/services/broken/config', '{}', 4),
+             kv_entry('reqarchitect/unwatched', 'x', 5)]),
+        # Only the config changed; the unchanged cache key is not reported again
+        (6, [kv_entry('reqarchitect/cache/redis_endpoints', 'redis:6379', 3),
+             kv_entry('reqarchitect/services/orders/config', '{"A": 2}', 6)]),
+        ConnectionError('consul down'),
+        (7, [kv_entry('reqarchitect/cache/redis_endpoints', None, 7)]),
+    ])
+    sleeps = []
+    monkeypatch.setattr('common_utils.service_registry.time.sleep', sleeps.append)
+    with pytest.raises(StopWatching):
+        registry._watch_keys()
+
+    assert seen == [('cache', 'redis:6379'), ('config', '{"A": 1}'), ('config', '{"A": 2}')]
+    requests = registry.consul_client.kv.requests
+    assert all(key == KV_PREFIX and recurse for key, recurse, _ in requests)
+    # Each query blocks on the index of the previous one; errors start over
+    assert [index for _, _, index in requests] == [None, 5, 6, None, 7]
+    assert sleeps == [10]
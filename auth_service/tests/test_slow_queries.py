@@ -0,0 +1,70 @@
+import time
+from flask import Flask
+from sqlalchemy import create_engine, text
+from common_utils.slow_queries import SlowQueryLog, init_slow_query_log, parameters_shape, is_read_only_select
+
+def _wait_for_plan(log, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        entries = log.top()
+        if entries and entries[0]['plan'] is not None:
+            return entries
+        time.sleep(0.01)
+    return log.top()
+
+def test_slow_statements_are_aggregated_and_explained():
+    """Test slow statements are grouped by shape and get a plan captured."""
+    engine = create_engine('sqlite://')
+    log = SlowQueryLog(threshold=0)
+    log.install()
+    try:
+        with engine.connect() as conn:
+            conn.execute(text('CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)'))
+            for i in range(3):
+                conn.execute(text('SELECT * FROM items WHERE id = :id'), {'id': i}).all()
+    finally:
+        log.uninstall()
+    entries = {e['statement']: e for e in _wait_for_plan(log)}
+    select = entries['SELECT * FROM items WHERE id = ?']
+    assert select['count'] == 3
+    assert select['parameters'] == ['int']
+    assert select['routes'] == {'background': 3}
+    assert any('items' in line for line in select['plan'])
+
+def test_parameters_shape():
+    assert parameters_shape({'id': 1, 'name': 'x'}) == {'id': 'int', 'name': 'str'}
+    assert parameters_shape([(1,), (2,)], executemany=True) == {'rows': 2, 'row': ['int']}
+
+def test_admin_endpoint_lists_and_resets():
+    app = Flask(__name__)
+    app.config.update(SLOW_QUERY_LOG_ENABLED=True, SLOW_QUERY_THRESHOLD_MS=0, SLOW_QUERY_EXPLAIN=False)
+    log = init_slow_query_log(app)
+    engine = create_engine('sqlite://')
+
+    @app.route('/items')
+    def items():
+        with engine.connect() as conn:
+            conn.execute(text('SELECT 1')).all()
+        return 'ok'
+
+    try:
+        client = app.test_client()
+        client.get('/items')
+        report = client.get('/admin/slow-queries?limit=5').get_json()
+        assert report['queries'][0]['routes'] == {'GET /items': 1}
+        client.delete('/admin/slow-queries')
+        assert client.get('/admin/slow-queries').get_json()['queries'] == []
+    finally:
+        log.uninstall()
+
+def test_only_read_only_selects_are_analyzed():
+    """Test locking, writing and side-effecting SELECTs are never run again."""
+    assert is_read_only_select('SELECT * FROM items WHERE id = %(id)s')
+    assert not is_read_only_select('SELECT * FROM outbox_events LIMIT 10 FOR UPDATE SKIP LOCKED')
+    assert not is_read_only_select('select id from items for no key update')
+    assert not is_read_only_select('SELECT * FROM items FOR KEY SHARE')
+    assert not is_read_only_select('SELECT * INTO items_copy FROM items')
+    assert not is_read_only_select("SELECT nextval('items_id_seq')")
+    assert not is_read_only_select('SELECT pg_advisory_xact_lock(42)')
+    assert not is_read_only_select('UPDATE items SET name = NULL')
+    assert is_read_only_select('SELECT information, format FROM items')
@@ -0,0 +1,113 @@
+import time
+import threading
+from opentelemetry.trace import StatusCode, Status, set_span_in_context
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.sdk.trace.sampling import Decision
+from common_utils.tracing import RouteSampler, TailSamplingSpanProcessor, SerializedSpanExporter
+
+LOW_TRACE_ID = 1
+HIGH_TRACE_ID = (1 << 64) - 1
+
+def _decision(sampler, trace_id, path='/api'):
+    return sampler.should_sample(None, trace_id, 'GET', attributes={'url.path': path}).decision
+
+def _tracer(latency_threshold=1.0, **kwargs):
+    exporter = InMemorySpanExporter()
+    processor = TailSamplingSpanProcessor(exporter, latency_threshold=latency_threshold, schedule_delay=0.05, **kwargs)
+    provider = TracerProvider(sampler=RouteSampler(ratio=0.0, tail=True))
+    provider.add_span_processor(processor)
+    return provider.get_tracer(__name__), processor, exporter
+
+def _names(exporter):
+    return sorted(span.name for span in exporter.get_finished_spans())
+
+def test_route_sampler_uses_longest_route_prefix():
+    """Test route ratios override the default ratio by longest prefix."""
+    sampler = RouteSampler(ratio=1.0, route_ratios={'/api': 0.0, '/api/orders': 1.0})
+    assert _decision(sampler, HIGH_TRACE_ID, '/api/users') == Decision.DROP
+    assert _decision(sampler, HIGH_TRACE_ID, '/api/orders/1') == Decision.RECORD_AND_SAMPLE
+    assert _decision(sampler, HIGH_TRACE_ID, '/other') == Decision.RECORD_AND_SAMPLE
+
+def test_route_sampler_records_dropped_traces_for_the_tail():
+    """Test the tail records a trace id ratio of dropped traces, never zero-ratio routes."""
+    sampler = RouteSampler(ratio=0.0, route_ratios={'/health': 0.0}, tail=True, tail_ratio=0.5)
+    assert _decision(sampler, LOW_TRACE_ID) == Decision.RECORD_ONLY
+    assert _decision(sampler, HIGH_TRACE_ID) == Decision.DROP
+    assert _decision(sampler, LOW_TRACE_ID, '/health') == Decision.DROP
+    assert _decision(RouteSampler(ratio=0.0), LOW_TRACE_ID) == Decision.DROP
+
+def test_tail_keeps_slow_and_failed_traces_only():
+    """Test fast traces are discarded and slow or failed ones exported."""
+    tracer, processor, exporter = _tracer()
+    with tracer.start_as_current_span('fast'):
+        with tracer.start_as_current_span('fast-child'):
+            pass
+    with tracer.start_as_current_span('failed'):
+        with tracer.start_as_current_span('failed-child') as child:
+            child.set_status(Status(StatusCode.ERROR))
+    slow = tracer.start_span('slow', start_time=time.time_ns() - 2 * 10 ** 9)
+    slow.end()
+    processor.force_flush()
+    assert _names(exporter) == ['failed', 'failed-child', 'slow']
+    assert processor.stats()['kept'] == 2
+    assert processor.stats()['discarded'] == 1
+    processor.shutdown()
+
+def test_tail_late_spans_follow_trace_decision():
+    """Test spans ending after their root open no buffer and follow its decision."""
+    tracer, processor, exporter = _tracer(latency_threshold=0)
+    root = tracer.start_span('root')
+    late = tracer.start_span('late', context=set_span_in_context(root))
+    root.end()
+    late.end()
+    processor.force_flush()
+    stats = processor.stats()
+    assert 'late' in _names(exporter)
+    assert stats['open_traces'] == 0
+    assert stats['late'] == 1
+    processor.shutdown()
+
+def test_tail_evicts_oldest_open_trace():
+    """Test the buffer of open traces is bounded."""
+    tracer, processor, exporter = _tracer(max_traces=2)
+    roots = [tracer.start_span(f"root-{i}") for i in range(3)]
+    for root in roots:
+        tracer.start_span('child', context=set_span_in_context(root)).end()
+    stats = processor.stats()
+    assert stats['open_traces'] == 2
+    assert stats['dropped'] == 1
+    processor.shutdown()
+
+class _ConcurrencyCheckingExporter(SpanExporter):
+    def __init__(self):
+        self.active = 0
+        self.overlapped = False
+        self.shutdowns = 0
+
+    def export(self, spans):
+        self.active += 1
+        if self.active > 1:
+            self.overlapped = True
+        time.sleep(0.005)
+        self.active -= 1
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        self.shutdowns += 1
+
+def test_serialized_exporter_never_exports_concurrently():
+    """Test a shared exporter is called by one thread at a time and shut down once."""
+    inner = _ConcurrencyCheckingExporter()
+    shared = SerializedSpanExporter(inner, users=2)
+    threads = [threading.Thread(target=lambda: [shared.export([]) for _ in range(5)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not inner.overlapped
+    shared.shutdown()
+    assert inner.shutdowns == 0
+    shared.shutdown()
+    assert inner.shutdowns == 1
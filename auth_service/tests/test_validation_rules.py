@@ -0,0 +1,118 @@
+from flask import Flask
+from common_utils.validation import RuleBundle, LocalValidator
+
+RULES = [
+    {'field': 'name', 'required': True, 'type': 'string', 'min_length': 3, 'max_length': 10},
+    {'field': 'priority', 'enum': ['low', 'high']},
+    {'field': 'weight', 'min': 0, 'max': 1},
+    {'field': 'code', 'pattern': r'[A-Z]{2}-\d+'},
+]
+
+class FakeResponse:
+    def __init__(self, status_code, data=None):
+        self.status_code = status_code
+        self.data = data
+
+    def json(self):
+        return self.data
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+class FakeHTTP:
+    def __init__(self, bundles, remote=(True, [])):
+        self.bundles = bundles
+        self.remote = remote
+        self.gets = []
+        self.posts = []
+
+    def get(self, url, headers=None, timeout=None):
+        self.gets.append({'url': url, 'headers': dict(headers or {})})
+        model_type = url.rsplit('/', 1)[-1]
+        bundle = self.bundles.get(model_type)
+        if bundle is None:
+            return FakeResponse(503)
+        if (headers or {}).get('If-None-Match') == f'"{bundle["version"]}"':
+            return FakeResponse(304)
+        return FakeResponse(200, bundle)
+
+    def post(self, url, json=None, headers=None, timeout=None, idempotent=False):
+        self.posts.append({'json': json, 'headers': dict(headers or {})})
+        valid, errors = self.remote
+        return FakeResponse(200, {'valid': valid, 'errors': errors})
+
+def _validator(monkeypatch, http, **kwargs):
+    monkeypatch.setattr('common_utils.validation.get_http_client', lambda: http)
+    validator = LocalValidator(rules_url='http://validation/api/rules', refresh_interval=3600, **kwargs)
+    validator._ensure_refresher = lambda: None
+    return validator
+
+def test_bundle_reports_every_violation():
+    bundle = RuleBundle('component', 'v1', RULES)
+    assert bundle.evaluate({'name': 'ok-name', 'priority': 'low', 'weight': 0.5, 'code': 'AB-12'}) == (True, [])
+    valid, errors = bundle.evaluate({'name': 'x', 'priority': 'urgent', 'weight': 2, 'code': 'ab'})
+    assert not valid
+    assert errors == [
+        'name must have at least 3 characters',
+        "priority must be one of ['high', 'low']",
+        'weight must be at most 1',
+        'code has an invalid format',
+    ]
+    assert bundle.evaluate({})[1] == ['name is required']
+
+def test_bundle_rejects_mistyped_values_instead_of_raising():
+    bundle = RuleBundle('component', 'v1', [
+        {'field': 'title', 'min_length': 2},
+        {'field': 'score', 'min': 0},
+        {'field': 'kind', 'enum': ['a']},
+    ])
+    valid, errors = bundle.evaluate({'title': 5, 'score': 'high', 'kind': ['a']})
+    assert not valid
+    assert errors == [
+        'title must be a string, array or object',
+        'score must be a number',
+        "kind must be one of ['a']",
+    ]
+    assert bundle.evaluate({'score': True})[1] == ['score must be a number']
+
+def test_bool_is_not_accepted_as_integer():
+    bundle = RuleBundle('component', 'v1', [{'field': 'count', 'type': 'integer'}])
+    assert bundle.evaluate({'count': True}) == (False, ['count must be of type integer'])
+    assert bundle.evaluate({'count': 3}) == (True, [])
+
+def test_validates_locally_and_revalidates_with_etag(monkeypatch):
+    http = FakeHTTP({'component': {'version': 'v1', 'rules': RULES, 'remote_required': False}})
+    validator = _validator(monkeypatch, http, token='svc-token')
+    assert validator.validate({'name': 'x'}, 'component')[0] is False
+    assert validator.validate({'name': 'valid'}, 'component') == (True, [])
+    assert len(http.gets) == 1 and not http.posts
+    assert http.gets[0]['headers'] == {'Authorization': 'Bearer svc-token'}
+
+    validator.refresh()
+    assert http.gets[1]['headers']['If-None-Match'] == '"v1"'
+    assert validator.get_bundle('component').version == 'v1'
+
+def test_defers_to_remote_when_bundle_cannot_decide(monkeypatch):
+    http = FakeHTTP({
+        'rego': {'version': 'v1', 'rules': RULES, 'remote_required': True},
+        'unknown': {'version': 'v2', 'rules': [], 'remote_required': False},
+    }, remote=(False, ['denied by policy']))
+    validator = _validator(monkeypatch, http)
+    assert validator.validate({'name': 'valid'}, 'rego') == (False, ['denied by policy'])
+    assert validator.validate({'anything': 1}, 'unknown') == (False, ['denied by policy'])
+    # Local failures are final; OPA is not consulted
+    assert validator.validate({'name': 'x'}, 'rego')[0] is False
+    assert len(http.posts) == 2
+
+def test_falls_back_to_remote_and_forwards_caller_token(monkeypatch):
+    http = FakeHTTP({})
+    validator = _validator(monkeypatch, http)
+    app = Flask(__name__)
+    with app.test_request_context(headers={'Authorization': 'Bearer user-token'}):
+        assert validator.validate({'name': 'valid'}, 'component') == (True, [])
+    assert http.gets[0]['headers'] == {'Authorization': 'Bearer user-token'}
+    assert http.posts[0]['headers'] == {'Authorization': 'Bearer user-token'}
+    # A failed fetch is not retried on every write
+    validator.validate({'name': 'valid'}, 'component')
+    assert len(http.gets) == 1
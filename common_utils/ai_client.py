@@ -2,7 +2,7 @@
 AI integration utilities for ReqArchitect services
 """
 import os
-import requests
+from .http import get_http_client
 import json
 import logging
 from functools import wraps
@@ -51,7 +51,7 @@ class AIServiceClient:
             payload['context'] = context
             
         try:
-            response = requests.post(url, headers=headers, json=payload, timeout=30)
+            response = get_http_client().post(url, headers=headers, json=payload, timeout=30)
             response.raise_for_status()
             return response.json()
         except Exception as e:
@@ -90,7 +90,7 @@ class AIServiceClient:
             payload['context'] = context
             
         try:
-            response = requests.post(url, headers=headers, json=payload, timeout=60)
+            response = get_http_client().post(url, headers=headers, json=payload, timeout=60)
             response.raise_for_status()
             return response.json()
         except Exception as e:
@@ -1,52 +1,245 @@
+import json
+import time
+import logging
+import threading
+import jwt
+import redis
 import requests
 from functools import wraps
 from flask import current_app, request, jsonify
+from .cache import LocalTTLCache, get_redis
 from .circuit_breaker import CircuitBreaker, CircuitBreakerError
+from .http import get_http_client
+
+logger = logging.getLogger(__name__)
+
+# Shared across requests so cached decisions outlive a single call.
+# Keys are (kind, user_id, tenant_id, resource). auth_service publishes
+# role changes on AUTH_INVALIDATION_CHANNEL; entries also expire after
+# AUTH_CACHE_TTL, which bounds staleness if an invalidation is missed.
+_auth_cache = LocalTTLCache(maxsize=50000, ttl=60)
+
+def get_auth_cache():
+    """Get the process-wide permission/access cache."""
+    return _auth_cache
+
+def invalidate_auth_cache(user_id=None, tenant_id=None):
+    """
+    Drop cached permissions and access decisions.
+
+    Args:
+        user_id: Only drop entries for this user
+        tenant_id: Only drop entries for this tenant
+
+    Returns:
+        Number of entries removed
+    """
+    if user_id is None and tenant_id is None:
+        count = len(_auth_cache)
+        _auth_cache.clear()
+        return count
+    return _auth_cache.invalidate(lambda key: (
+        (user_id is None or key[1] == str(user_id))
+        and (tenant_id is None or key[2] == str(tenant_id))
+    ))
+
+# Redis pub/sub channel auth_service announces role and status changes on.
+# Unlike a stream consumer group, pub/sub reaches every process and so
+# every copy of the cache above.
+AUTH_INVALIDATION_CHANNEL = 'auth:invalidate'
+
+def publish_auth_invalidation(user_id=None, tenant_id=None, redis_client=None):
+    """
+    Ask every service process to drop cached decisions for a user.
+
+    Best effort: a process that misses the message keeps its entries until
+    AUTH_CACHE_TTL expires them.
+    """
+    message = json.dumps({'user_id': user_id, 'tenant_id': tenant_id})
+    try:
+        (redis_client or get_redis()).publish(AUTH_INVALIDATION_CHANNEL, message)
+    except redis.RedisError as e:
+        logger.warning(f"Failed to publish auth cache invalidation: {str(e)}")
+
+def handle_auth_invalidation(message):
+    """Pub/sub handler applying an invalidation published by auth_service."""
+    try:
+        data = json.loads(message['data'])
+        removed = invalidate_auth_cache(data.get('user_id'), data.get('tenant_id'))
+    except (ValueError, TypeError, AttributeError) as e:
+        logger.warning(f"Ignoring malformed auth cache invalidation: {str(e)}")
+        return
+    logger.info(f"Invalidated {removed} auth cache entries for user {data.get('user_id')}")
+
+def _listener_error(error, pubsub, thread):
+    # Keep listening; the next get_message reconnects and resubscribes
+    logger.warning(f"Auth cache invalidation listener error: {str(error)}")
+    time.sleep(1.0)
+
+_listener_lock = threading.Lock()
+_listener = None
+
+def subscribe_auth_cache_invalidation(redis_client=None):
+    """
+    Start this process's listener for auth_service's invalidations, once.
+
+    Returns:
+        The listener thread, or None if Redis is unreachable
+    """
+    global _listener
+    with _listener_lock:
+        if _listener is None:
+            try:
+                pubsub = (redis_client or get_redis()).pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(**{AUTH_INVALIDATION_CHANNEL: handle_auth_invalidation})
+                _listener = pubsub.run_in_thread(sleep_time=1.0, daemon=True,
+                                                 exception_handler=_listener_error)
+            except redis.RedisError as e:
+                logger.warning(f"Auth cache invalidation unavailable, relying on AUTH_CACHE_TTL: {str(e)}")
+        return _listener
 
 class AuthServiceClient:
     def __init__(self, base_url=None):
-        self.base_url = base_url or current_app.config['AUTH_SERVICE_URL']
+        config = current_app.config
+        self.base_url = base_url or config['AUTH_SERVICE_URL']
+        self.timeout = config.get('AUTH_SERVICE_TIMEOUT', 5)
+        self.cache_ttl = config.get('AUTH_CACHE_TTL', 60)
+        self.local_validation = config.get('AUTH_LOCAL_VALIDATION', True)
+        # Public key for RS*/ES* tokens, otherwise the shared HMAC secret
+        self.verification_key = config.get('AUTH_JWT_PUBLIC_KEY') or config.get('JWT_SECRET_KEY')
+        self.algorithms = config.get('AUTH_JWT_ALGORITHMS') or [config.get('JWT_ALGORITHM', 'HS256')]
+        self.identity_claim = config.get('JWT_IDENTITY_CLAIM', 'sub')
         self.circuit_breaker = CircuitBreaker(
-            failure_threshold=current_app.config.get('CIRCUIT_BREAKER_FAILURE_THRESHOLD', 5),
-            recovery_timeout=current_app.config.get('CIRCUIT_BREAKER_RECOVERY_TIMEOUT', 60)
+            failure_threshold=config.get('CIRCUIT_BREAKER_FAILURE_THRESHOLD', 5),
+            recovery_timeout=config.get('CIRCUIT_BREAKER_RECOVERY_TIMEOUT', 60),
+            name='auth_service'
         )
 
+    def _headers(self, token):
+        return {"Authorization": f"Bearer {token}"}
+
+    def decode_token(self, token):
+        """
+        Verify a JWT locally without calling the auth service.
+
+        Returns:
+            Decoded claims, or None if local validation is disabled or no key
+            is configured.
+
+        Raises:
+            jwt.InvalidTokenError if the token is invalid or expired.
+        """
+        if not self.local_validation or not self.verification_key:
+            return None
+        # auth_service puts a {'id', 'tenant_id', 'role'} dict in 'sub',
+        # which PyJWT's string check would reject; _identity reads it
+        claims = jwt.decode(token, self.verification_key, algorithms=self.algorithms,
+                            options={'verify_sub': False})
+        # Refresh tokens are signed with the same key but must not authorize requests
+        if claims.get('type') != 'access':
+            raise jwt.InvalidTokenError("Not an access token")
+        return claims
+
+    def _identity(self, claims):
+        """
+        Extract (user_id, tenant_id) from token claims or a validated user.
+
+        Returns:
+            The ids as strings, or None if the user id cannot be resolved
+        """
+        identity = claims.get(self.identity_claim, claims.get('sub'))
+        if isinstance(identity, dict):
+            user_id = identity.get('id')
+            tenant_id = identity.get('tenant_id', claims.get('tenant_id'))
+        else:
+            # Flat claims, or the user returned by remote validation
+            user_id = identity if identity is not None else claims.get('id')
+            tenant_id = claims.get('tenant_id')
+        if user_id is None:
+            return None
+        return str(user_id), str(tenant_id)
+
     def validate_token(self, token):
-        """Validate JWT token with auth service."""
+        """Validate JWT token locally, falling back to the auth service."""
+        claims = self.decode_token(token)
+        if claims is not None:
+            return claims
+
         def _validate():
-            response = requests.post(
+            response = get_http_client().post(
                 f"{self.base_url}/api/v1/auth/validate",
-                headers={"Authorization": f"Bearer {token}"}
+                headers=self._headers(token),
+                timeout=self.timeout,
+                idempotent=True
             )
             if response.status_code != 200:
                 raise CircuitBreakerError(f"Token validation failed: {response.status_code}")
             return response.json()
         return self.circuit_breaker(_validate)()
 
-    def get_user_permissions(self, token):
-        """Get user permissions from auth service."""
+    def get_user_permissions(self, token, user_info=None):
+        """
+        Get user permissions from the cache or the auth service.
+
+        The token's own permissions claim is not trusted: it was fixed when
+        the token was issued and would outlive a role change.
+        """
+        cache_key = None
+        identity = self._identity(user_info) if user_info else None
+        if identity:
+            cache_key = ('permissions', *identity, None)
+            cached = _auth_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
         def _get_permissions():
-            response = requests.get(
+            response = get_http_client().get(
                 f"{self.base_url}/api/v1/auth/permissions",
-                headers={"Authorization": f"Bearer {token}"}
+                headers=self._headers(token),
+                timeout=self.timeout
             )
             if response.status_code != 200:
                 raise CircuitBreakerError(f"Permission fetch failed: {response.status_code}")
             return response.json()
-        return self.circuit_breaker(_get_permissions)()
+        permissions = self.circuit_breaker(_get_permissions)()
+        if cache_key:
+            _auth_cache.set(cache_key, permissions, ttl=self.cache_ttl)
+        return permissions
+
+    def validate_initiative_access(self, token, initiative_id, user_info=None):
+        """Validate user access to a specific initiative, caching the decision per user."""
+        cache_key = None
+        identity = self._identity(user_info) if user_info else None
+        if identity:
+            cache_key = ('initiative', *identity, str(initiative_id))
+            cached = _auth_cache.get(cache_key)
+            if cached is not None:
+                return {'has_access': cached}
 
-    def validate_initiative_access(self, token, initiative_id):
-        """Validate user access to a specific initiative."""
         def _validate_access():
-            response = requests.post(
+            response = get_http_client().post(
                 f"{self.base_url}/api/v1/auth/validate-access",
-                headers={"Authorization": f"Bearer {token}"},
-                json={"initiative_id": initiative_id}
+                headers=self._headers(token),
+                json={"initiative_id": initiative_id},
+                timeout=self.timeout,
+                idempotent=True
             )
             if response.status_code != 200:
                 raise CircuitBreakerError(f"Initiative access validation failed: {response.status_code}")
             return response.json()
-        return self.circuit_breaker(_validate_access)()
+        result = self.circuit_breaker(_validate_access)()
+        if cache_key:
+            _auth_cache.set(cache_key, bool(result.get('has_access')), ttl=self.cache_ttl)
+        return result
+
+def get_auth_client():
+    """Get the auth client shared by all requests of the current app."""
+    client = current_app.extensions.get('auth_client')
+    if client is None:
+        client = current_app.extensions['auth_client'] = AuthServiceClient()
+        if current_app.config.get('AUTH_CACHE_INVALIDATION', True):
+            subscribe_auth_cache_invalidation()
+    return client
 
 def auth_required(permissions=None, validate_initiative=False):
     """Decorator to check if user is authenticated and has required permissions."""
@@ -58,17 +251,19 @@ def auth_required(permissions=None, validate_initiative=False):
                 return jsonify({"error": "No authorization header"}), 401
             try:
                 token = auth_header.split(' ')[1]
-                auth_client = AuthServiceClient()
+                auth_client = get_auth_client()
                 # Validate token
                 user_info = auth_client.validate_token(token)
                 # Check permissions if required
                 if permissions:
-                    user_permissions = auth_client.get_user_permissions(token)
+                    user_permissions = auth_client.get_user_permissions(token, user_info)
                     if not all(perm in user_permissions for perm in permissions):
                         return jsonify({"error": "Insufficient permissions"}), 403
                 # Optionally validate initiative access
                 if validate_initiative and 'initiative_id' in kwargs:
-                    access = auth_client.validate_initiative_access(token, kwargs['initiative_id'])
+                    access = auth_client.validate_initiative_access(
+                        token, kwargs['initiative_id'], user_info
+                    )
                     if not access.get('has_access'):
                         return jsonify({"error": "No access to initiative"}), 403
                 # Add user info to request context
@@ -81,4 +276,4 @@ def auth_required(permissions=None, validate_initiative=False):
             except Exception:
                 return jsonify({"error": "Invalid token"}), 401
         return decorated_function
-    return decorator 
\ No newline at end of file
+    return decorator
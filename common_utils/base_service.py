@@ -15,8 +15,13 @@ from werkzeug.middleware.proxy_fix import ProxyFix
 from common_utils.service_registry import register_service
 from common_utils.tracing import init_tracer
 from common_utils.logging import configure_logging
+from common_utils.http import init_deadline_propagation
+from common_utils.server_timing import init_server_timing
+from common_utils.query_budget import init_query_budget
+from common_utils.slow_queries import init_slow_query_log
+from common_utils.profiling import init_debug_endpoints
 from common_utils.outbox import init_outbox_processor, OutboxEvent
-from common_utils.auth import get_user_and_tenant
+from common_utils.auth import get_user_and_tenant, rbac_required
 from common_utils.tenant import tenant_required
 
 logger = logging.getLogger(__name__)
@@ -34,6 +39,8 @@ class BaseService:
     - API documentation
     - Health check endpoints
     - Metrics
+    - Per-request latency breakdown (Server-Timing)
+    - Profiling endpoints (/debug/profile, /debug/heap)
     """
     def __init__(self, service_name, config_module, enable_auth=True, 
                  enable_tracing=True, enable_service_registry=True,
@@ -69,6 +76,25 @@ class BaseService:
         # Configure logging
         configure_logging(self.app)
         
+        # Propagate caller deadlines to outbound service calls
+        init_deadline_propagation(self.app)
+        
+        # Break request latency down into SQL, HTTP, cache and serialization
+        init_server_timing(self.app)
+        
+        # Count queries per request to catch N+1s and budget overruns
+        init_query_budget(self.app)
+        
+        # Opt-in slow-query log, served to admins
+        self.slow_queries = init_slow_query_log(
+            self.app, protect=rbac_required(roles=['admin']) if enable_auth else None
+        )
+        
+        # On-demand CPU and heap profiling for admins
+        init_debug_endpoints(
+            self.app, protect=rbac_required(roles=['admin']) if enable_auth else None
+        )
+        
         # Initialize tracing if enabled
         if enable_tracing:
             self.tracer = init_tracer(self.app, service_name)
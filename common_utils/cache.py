@@ -1,5 +1,9 @@
 import os
+import threading
+import time
+from collections import OrderedDict
 import redis
+from .server_timing import timed
 
 def get_redis():
     redis_url = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
@@ -7,8 +11,65 @@ def get_redis():
 
 def cache_set(key, value, ex=60):
     r = get_redis()
-    r.set(key, value, ex=ex)
+    with timed('cache'):
+        r.set(key, value, ex=ex)
 
 def cache_get(key):
     r = get_redis()
-    return r.get(key) 
\ No newline at end of file
+    with timed('cache'):
+        return r.get(key)
+
+class LocalTTLCache:
+    """
+    Thread-safe in-process cache with per-entry expiry and LRU eviction.
+
+    Use for small, hot lookups where a Redis round-trip would cost more than
+    the value is worth (permissions, access decisions, rule bundles).
+    """
+
+    def __init__(self, maxsize=10000, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def invalidate(self, predicate):
+        """Remove every entry whose key matches ``predicate``; returns the count."""
+        with self._lock:
+            keys = [k for k in self._data if predicate(k)]
+            for k in keys:
+                del self._data[k]
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
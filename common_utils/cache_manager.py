@@ -7,6 +7,7 @@ from flask import Flask
 from flask_caching import Cache
 import json
 from datetime import datetime
+from .server_timing import timed
 
 class CacheManager:
     """Centralized cache management for ReqArchitect microservices."""
@@ -58,12 +59,14 @@ class CacheManager:
                         cache_key = f"{cache_key}:v{version}"
                 
                 if not force_update:
-                    rv = self.cache.get(cache_key)
+                    with timed('cache'):
+                        rv = self.cache.get(cache_key)
                     if rv is not None:
                         return rv
                 
                 rv = f(*args, **kwargs)
-                self.cache.set(cache_key, rv, timeout=timeout)
+                with timed('cache'):
+                    self.cache.set(cache_key, rv, timeout=timeout)
                 return rv
             return decorated_function
         return decorator
@@ -80,21 +83,25 @@ class CacheManager:
                 if version is not None:
                     cache_key = f"{cache_key}:v{version}"
                 
-                rv = self.cache.get(cache_key)
+                with timed('cache'):
+                    rv = self.cache.get(cache_key)
                 if rv is None:
                     rv = f(*args, **kwargs)
-                    self.cache.set(cache_key, rv, timeout=timeout)
+                    with timed('cache'):
+                        self.cache.set(cache_key, rv, timeout=timeout)
                 return rv
             return wrapper
         return memoize_decorator
     
     def cache_multi(self, keys: List[str], timeout: int = None) -> Dict[str, Any]:
         """Get multiple cache keys at once."""
-        return self.cache.get_many(*keys)
+        with timed('cache'):
+            return self.cache.get_many(*keys)
     
     def cache_set_multi(self, mapping: Dict[str, Any], timeout: int = None) -> bool:
         """Set multiple cache keys at once."""
-        return self.cache.set_many(mapping, timeout=timeout)
+        with timed('cache'):
+            return self.cache.set_many(mapping, timeout=timeout)
     
     def delete_pattern(self, pattern: str):
         """Delete all keys matching pattern."""
@@ -1,15 +1,208 @@
 import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from functools import wraps
-from typing import Callable, Any, Optional, Tuple, Type
+from typing import Callable, Any, Dict, Optional, Tuple, Type
 import logging
-from flask import current_app
+from flask import current_app, has_app_context
 
 logger = logging.getLogger(__name__)
 
+try:
+    from prometheus_client import Counter, Gauge
+    BULKHEAD_ACTIVE = Gauge(
+        'bulkhead_active_calls', 'Calls currently running in a bulkhead', ['bulkhead']
+    )
+    BULKHEAD_QUEUED = Gauge(
+        'bulkhead_queued_calls', 'Calls waiting for a bulkhead worker', ['bulkhead']
+    )
+    BULKHEAD_REJECTED = Counter(
+        'bulkhead_rejected_calls_total', 'Calls rejected by a saturated bulkhead', ['bulkhead']
+    )
+    BULKHEAD_TIMED_OUT = Counter(
+        'bulkhead_timed_out_calls_total', 'Calls that exceeded their timeout', ['bulkhead']
+    )
+except ImportError:
+    BULKHEAD_ACTIVE = BULKHEAD_QUEUED = BULKHEAD_REJECTED = BULKHEAD_TIMED_OUT = None
+
 class CircuitBreakerError(Exception):
     """Raised when the circuit breaker is open or operation fails."""
     pass
 
+class BulkheadFullError(CircuitBreakerError):
+    """Raised when a bulkhead has no free worker or queue slot."""
+    pass
+
+class Bulkhead:
+    """
+    Bounded executor isolating calls to a single dependency.
+
+    At most ``max_concurrent`` calls run at once and at most ``max_queued``
+    wait for a worker; anything beyond that is rejected immediately instead
+    of spawning another thread. A call that times out keeps its worker until
+    it finishes, so a hung dependency can only ever pin ``max_concurrent``
+    threads.
+    """
+
+    def __init__(self, name: str, max_concurrent: int = 10, max_queued: int = 20):
+        """
+        Initialize bulkhead.
+        Args:
+            name: Name of the protected dependency
+            max_concurrent: Number of worker threads
+            max_queued: Number of calls allowed to wait for a worker
+        """
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrent,
+            thread_name_prefix=f"bulkhead-{name}",
+        )
+        self._slots = threading.BoundedSemaphore(max_concurrent + max_queued)
+        self._lock = threading.Lock()
+        self.active = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.completed = 0
+
+    def submit(self, func: Callable):
+        """
+        Submit a call to the bulkhead.
+        Args:
+            func: The function to execute
+        Returns:
+            A Future for the call
+        Raises:
+            BulkheadFullError if all workers and queue slots are taken.
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            if BULKHEAD_REJECTED is not None:
+                BULKHEAD_REJECTED.labels(self.name).inc()
+            logger.warning(f"Bulkhead {self.name} is full, rejecting call")
+            raise BulkheadFullError(f"Bulkhead {self.name} is full")
+
+        with self._lock:
+            self.queued += 1
+        self._update_gauges()
+
+        def run():
+            with self._lock:
+                self.queued -= 1
+                self.active += 1
+            self._update_gauges()
+            try:
+                return func()
+            finally:
+                with self._lock:
+                    self.active -= 1
+                    self.completed += 1
+                self._slots.release()
+                self._update_gauges()
+
+        # Run in a copy of the caller's context so Flask's app context and
+        # the current trace span are visible to the worker.
+        ctx = contextvars.copy_context()
+        try:
+            future = self._executor.submit(ctx.run, run)
+        except RuntimeError:
+            self._release_queued()
+            raise
+        # A call cancelled while queued never runs, so free its slot here
+        future.add_done_callback(lambda f: self._release_queued() if f.cancelled() else None)
+        return future
+
+    def _release_queued(self):
+        with self._lock:
+            self.queued -= 1
+        self._slots.release()
+        self._update_gauges()
+
+    def execute(self, func: Callable, timeout: Optional[float] = None) -> Any:
+        """
+        Execute a function in the bulkhead and wait for its result.
+        Args:
+            func: The function to execute
+            timeout: Optional timeout in seconds
+        Returns:
+            The result of the function.
+        Raises:
+            BulkheadFullError if the bulkhead is saturated,
+            concurrent.futures.TimeoutError if the call did not finish in time.
+        """
+        future = self.submit(func)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            # Drop the call if it never left the queue
+            future.cancel()
+            with self._lock:
+                self.timed_out += 1
+            if BULKHEAD_TIMED_OUT is not None:
+                BULKHEAD_TIMED_OUT.labels(self.name).inc()
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        """Return a snapshot of bulkhead metrics."""
+        with self._lock:
+            return {
+                'name': self.name,
+                'max_concurrent': self.max_concurrent,
+                'max_queued': self.max_queued,
+                'active': self.active,
+                'queued': self.queued,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+                'completed': self.completed,
+            }
+
+    def shutdown(self, wait: bool = False):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _update_gauges(self):
+        if BULKHEAD_ACTIVE is not None:
+            BULKHEAD_ACTIVE.labels(self.name).set(self.active)
+            BULKHEAD_QUEUED.labels(self.name).set(self.queued)
+
+_bulkheads: Dict[str, Bulkhead] = {}
+_bulkheads_lock = threading.Lock()
+
+def get_bulkhead(
+    name: str,
+    max_concurrent: Optional[int] = None,
+    max_queued: Optional[int] = None,
+) -> Bulkhead:
+    """
+    Get the shared bulkhead for a dependency, creating it on first use.
+    Args:
+        name: Name of the dependency
+        max_concurrent: Worker count (defaults to BULKHEAD_MAX_CONCURRENT)
+        max_queued: Queue limit (defaults to BULKHEAD_MAX_QUEUED)
+    Returns:
+        Bulkhead instance
+    """
+    with _bulkheads_lock:
+        bulkhead = _bulkheads.get(name)
+        if bulkhead is None:
+            config = current_app.config if has_app_context() else {}
+            bulkhead = Bulkhead(
+                name,
+                max_concurrent=max_concurrent or config.get('BULKHEAD_MAX_CONCURRENT', 10),
+                max_queued=max_queued if max_queued is not None else config.get('BULKHEAD_MAX_QUEUED', 20),
+            )
+            _bulkheads[name] = bulkhead
+        return bulkhead
+
+def bulkhead_stats() -> Dict[str, Dict[str, Any]]:
+    """Return metrics for every bulkhead created in this process."""
+    with _bulkheads_lock:
+        bulkheads = list(_bulkheads.values())
+    return {b.name: b.stats() for b in bulkheads}
+
 class CircuitBreaker:
     """Circuit breaker implementation for handling service failures."""
     
@@ -19,6 +212,7 @@ class CircuitBreaker:
         recovery_timeout: int = 60,
         name: str = "default",
         ignore_exceptions: Tuple[Type[Exception], ...] = (),
+        bulkhead: Optional[Bulkhead] = None,
     ):
         """
         Initialize circuit breaker.
@@ -27,6 +221,8 @@ class CircuitBreaker:
             recovery_timeout: Time in seconds before attempting recovery
             name: Name of the circuit breaker
             ignore_exceptions: Tuple of exception types to ignore
+            bulkhead: Bulkhead used to enforce timeouts (defaults to the
+                shared bulkhead registered under ``name``)
         """
         self.failure_threshold = failure_threshold
         self.recovery_timeout = recovery_timeout
@@ -35,6 +231,7 @@ class CircuitBreaker:
         self.last_failure_time = None
         self.is_open_flag = False
         self.ignore_exceptions = ignore_exceptions
+        self.bulkhead = bulkhead
 
     def __call__(self, func: Callable) -> Callable:
         """
@@ -69,28 +266,18 @@ class CircuitBreaker:
 
         try:
             if timeout is not None:
-                import threading
-                result = [None]
-                exc = [None]
-                def target():
-                    try:
-                        result[0] = func()
-                    except Exception as e:
-                        exc[0] = e
-                thread = threading.Thread(target=target)
-                thread.start()
-                thread.join(timeout)
-                if thread.is_alive():
-                    self._record_failure()
+                bulkhead = self.bulkhead or get_bulkhead(self.name)
+                try:
+                    res = bulkhead.execute(func, timeout)
+                except FutureTimeoutError:
                     raise CircuitBreakerError("Operation timed out")
-                if exc[0]:
-                    raise exc[0]
-                self._reset_failures()
-                return result[0]
             else:
                 res = func()
-                self._reset_failures()
-                return res
+            self._reset_failures()
+            return res
+        except BulkheadFullError:
+            # Saturation is local back-pressure, not a dependency failure
+            raise
         except self.ignore_exceptions as e:
             raise
         except Exception as e:
@@ -98,6 +285,8 @@ class CircuitBreaker:
             if self.failures >= self.failure_threshold:
                 self.is_open_flag = True
                 logger.error(f"Circuit breaker {self.name} opened after {self.failures} failures")
+            if isinstance(e, CircuitBreakerError):
+                raise
             raise CircuitBreakerError(str(e)) from e
 
     def _record_failure(self):
@@ -0,0 +1,320 @@
+"""
+Domain event consumers for ReqArchitect services.
+
+Services declare what they consume with ``EventConsumer.subscribe`` and the
+consumer takes care of fetching from the broker, fanning events out to
+worker threads partitioned by aggregate (so events of one aggregate are
+always handled in order by the same worker), batching, retries and
+backpressure. Brokers are pluggable: ``InMemoryBroker`` for tests and
+single-process setups, ``event_stream.RedisStreamBroker`` in production.
+"""
+import time
+import queue
+import threading
+import zlib
+import logging
+from collections import deque
+from flask import current_app
+from .outbox import handling_event
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+class Event:
+    """A domain event as delivered to handlers"""
+
+    def __init__(self, event_type, aggregate_type, aggregate_id, payload,
+                 event_id=None, headers=None, delivery_id=None):
+        """
+        Initialize the event
+
+        Args:
+            event_type: Type of event (e.g., 'node_created')
+            aggregate_type: Type of aggregate; also the topic the event is published on
+            aggregate_id: ID of the aggregate; events are ordered per aggregate
+            payload: Event data
+            event_id: Unique id of the event, if known
+            headers: Trace context and origin timestamp
+            delivery_id: Broker specific id used to acknowledge the event
+        """
+        self.event_type = event_type
+        self.aggregate_type = aggregate_type
+        self.aggregate_id = None if aggregate_id is None else str(aggregate_id)
+        self.payload = payload
+        self.event_id = event_id
+        self.headers = headers or {}
+        self.delivery_id = delivery_id
+
+    @property
+    def partition_key(self):
+        return f"{self.aggregate_type}:{self.aggregate_id}"
+
+    def __repr__(self):
+        return f"<Event {self.event_type} {self.partition_key}>"
+
+class InMemoryBroker:
+    """
+    Broker keeping events in process memory
+
+    Like Redis consumer groups, every group gets its own copy of each event
+    published to a topic it subscribed to.
+    """
+
+    def __init__(self):
+        self._groups = {}
+        self._cond = threading.Condition()
+        self.acked = {}
+        self.dead_letters = []
+
+    def subscribe(self, group, topics):
+        with self._cond:
+            state = self._groups.setdefault(group, {'topics': set(), 'queue': deque()})
+            state['topics'].update(topics)
+
+    def publish(self, event):
+        with self._cond:
+            for state in self._groups.values():
+                if event.aggregate_type in state['topics']:
+                    state['queue'].append(event)
+            self._cond.notify_all()
+
+    def fetch(self, group, max_count=100, timeout=1.0):
+        """Wait up to ``timeout`` seconds for events; returns at most ``max_count``"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            pending = self._groups[group]['queue']
+            while not pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self._cond.wait(remaining)
+            return [pending.popleft() for _ in range(min(max_count, len(pending)))]
+
+    def ack(self, group, events):
+        with self._cond:
+            self.acked[group] = self.acked.get(group, 0) + len(events)
+
+    def dead_letter(self, group, events, error):
+        with self._cond:
+            self.dead_letters.extend((group, event, str(error)) for event in events)
+
+class Subscription:
+    """A handler and the events it consumes"""
+
+    def __init__(self, aggregate_type, event_types, handler, batch=False):
+        self.aggregate_type = aggregate_type
+        self.event_types = frozenset(event_types) if event_types else None
+        self.handler = handler
+        self.batch = batch
+
+    def matches(self, event):
+        return (event.aggregate_type == self.aggregate_type
+                and (self.event_types is None or event.event_type in self.event_types))
+
+class EventConsumer:
+    """
+    Consumes events for one consumer group with partitioned parallelism
+
+    A dispatcher thread fetches events and routes each to one of
+    ``workers`` bounded queues by a hash of its aggregate, so ordering per
+    aggregate is preserved while different aggregates are handled in
+    parallel. When a worker lags, its queue fills up and the dispatcher
+    stops fetching until it drains. Workers drain up to ``batch_size``
+    queued events at a time; batch subscriptions receive them as a list.
+    """
+
+    def __init__(self, group, broker=None, workers=4, batch_size=100, max_pending=1000,
+                 max_retries=3, retry_backoff=0.5, poll_timeout=1.0):
+        """
+        Initialize the consumer
+
+        Args:
+            group: Consumer group name, usually the service name
+            broker: Broker to consume from (defaults to the app's broker on start)
+            workers: Number of worker threads / partitions
+            batch_size: Maximum events handled per worker iteration
+            max_pending: Events buffered across all workers before
+                fetching pauses
+            max_retries: Retries of a failing handler call before dead-lettering
+            retry_backoff: Base delay in seconds between retries
+            poll_timeout: Seconds a fetch waits for new events
+        """
+        self.group = group
+        self.broker = broker
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.poll_timeout = poll_timeout
+        self.subscriptions = []
+        self._queues = []
+        self._threads = []
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._processed = 0
+        self._failed = 0
+
+    def subscribe(self, aggregate_type, event_types=None, batch=False):
+        """
+        Decorator registering a handler
+
+        Args:
+            aggregate_type: Topic to consume
+            event_types: Event types to handle (default: all on the topic)
+            batch: Call the handler with a list of events instead of one event
+        """
+        def decorator(func):
+            self.subscriptions.append(Subscription(aggregate_type, event_types, func, batch))
+            return func
+        return decorator
+
+    @property
+    def topics(self):
+        return sorted({s.aggregate_type for s in self.subscriptions})
+
+    def partition(self, event):
+        return zlib.crc32(event.partition_key.encode('utf-8')) % self.workers
+
+    def _call(self, subscription, events):
+        if subscription.batch:
+            subscription.handler(events)
+            return
+        event = events[0]
+        with handling_event(event.event_type, event.headers, f"consumer:{self.group}"):
+            subscription.handler(event)
+
+    def _deliver(self, subscription, events):
+        calls = [events] if subscription.batch else [[event] for event in events]
+        for call in calls:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    self._call(subscription, call)
+                    break
+                except Exception as e:
+                    if attempt >= self.max_retries:
+                        logger.error(f"{self.group}: giving up on {call[0]!r} "
+                                     f"({len(call)} events) after {attempt + 1} attempts: {str(e)}")
+                        self.broker.dead_letter(self.group, call, e)
+                        with self._lock:
+                            self._failed += len(call)
+                        break
+                    time.sleep(self.retry_backoff * (2 ** attempt))
+
+    def handle_batch(self, events):
+        """Deliver events, in order, to every matching subscription and ack them"""
+        for subscription in self.subscriptions:
+            matched = [event for event in events if subscription.matches(event)]
+            if matched:
+                self._deliver(subscription, matched)
+        self.broker.ack(self.group, events)
+        with self._lock:
+            self._processed += len(events)
+
+    def _work(self, index):
+        pending = self._queues[index]
+        stopping = False
+        while not stopping:
+            item = pending.get()
+            if item is _STOP:
+                break
+            events = [item]
+            while len(events) < self.batch_size:
+                try:
+                    item = pending.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                events.append(item)
+            try:
+                self.handle_batch(events)
+            except Exception as e:
+                logger.error(f"{self.group}: error handling batch on worker {index}: {str(e)}")
+
+    def _dispatch(self):
+        self.broker.subscribe(self.group, self.topics)
+        while not self._stop.is_set():
+            try:
+                events = self.broker.fetch(self.group, self.batch_size, self.poll_timeout)
+            except Exception as e:
+                logger.error(f"{self.group}: error fetching events: {str(e)}")
+                self._stop.wait(1)
+                continue
+            for event in events:
+                # Blocks while the worker is behind: backpressure on the broker
+                self._queues[self.partition(event)].put(event)
+
+    def start(self, app=None):
+        """Start the dispatcher and worker threads, inside ``app``'s context if given"""
+        if self._threads:
+            return
+        app = app or current_app._get_current_object()
+        if self.broker is None:
+            self.broker = get_event_broker(app)
+        self._stop.clear()
+        per_worker = max(1, self.max_pending // self.workers)
+        self._queues = [queue.Queue(maxsize=per_worker) for _ in range(self.workers)]
+
+        def in_context(target, *args):
+            def run():
+                with app.app_context():
+                    target(*args)
+            return run
+
+        self._threads = [
+            threading.Thread(target=in_context(self._work, i), name=f'{self.group}-worker-{i}', daemon=True)
+            for i in range(self.workers)
+        ]
+        self._threads.append(threading.Thread(
+            target=in_context(self._dispatch), name=f'{self.group}-dispatcher', daemon=True))
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"Event consumer {self.group} started with {self.workers} workers on {self.topics}")
+
+    def stop(self, timeout=None):
+        """Stop fetching, finish queued events and join the threads"""
+        self._stop.set()
+        dispatcher = self._threads[-1] if self._threads else None
+        if dispatcher is not None:
+            dispatcher.join(timeout)
+        for pending in self._queues:
+            pending.put(_STOP)
+        for thread in self._threads[:-1]:
+            thread.join(timeout)
+        self._threads = []
+
+    def stats(self):
+        with self._lock:
+            return {
+                'group': self.group,
+                'queued': [pending.qsize() for pending in self._queues],
+                'processed': self._processed,
+                'failed': self._failed,
+            }
+
+def init_event_broker(app):
+    """
+    Create the app's event broker from configuration
+
+    Configuration:
+        EVENT_BROKER: 'redis' (Redis Streams) or 'memory' (default)
+        EVENT_STREAM_PREFIX: Stream name prefix for the Redis broker
+
+    Returns:
+        The broker, also stored in ``app.extensions['event_broker']``
+    """
+    if app.config.get('EVENT_BROKER', 'memory') == 'redis':
+        from .event_stream import RedisStreamBroker, STREAM_PREFIX
+        broker = RedisStreamBroker(prefix=app.config.get('EVENT_STREAM_PREFIX', STREAM_PREFIX))
+    else:
+        broker = InMemoryBroker()
+    app.extensions['event_broker'] = broker
+    return broker
+
+def get_event_broker(app=None):
+    """Get the app's event broker, creating it on first use"""
+    app = app or current_app._get_current_object()
+    return app.extensions.get('event_broker') or init_event_broker(app)
@@ -0,0 +1,372 @@
+"""
+Redis Streams transport for outbox events.
+
+``OutboxRelay`` publishes every committed outbox event to a stream per
+aggregate type (``outbox:<aggregate_type>``). ``StreamConsumer`` reads those
+streams through a consumer group, acknowledges handled messages and reclaims
+messages left pending by crashed consumers, so downstream services consume
+in parallel at their own pace instead of being called synchronously.
+``RedisStreamBroker`` exposes the same streams to ``consumer.EventConsumer``.
+"""
+import json
+import socket
+import threading
+import time
+import uuid
+import logging
+from flask import current_app
+from .cache import get_redis
+from .outbox import init_outbox_processor, handling_event, parse_event_headers
+from .consumer import Event
+
+logger = logging.getLogger(__name__)
+
+STREAM_PREFIX = 'outbox'
+
+# Publishes at most once per event id: a relay that crashes between XADD and
+# marking the outbox row completed will skip the XADD on its next attempt.
+_PUBLISH_ONCE = """
+if redis.call('SET', KEYS[2], '1', 'NX', 'EX', ARGV[1]) then
+    return redis.call('XADD', KEYS[1], 'MAXLEN', '~', ARGV[2], '*', unpack(ARGV, 3))
+end
+return false
+"""
+
+def stream_name(aggregate_type, prefix=STREAM_PREFIX):
+    return f"{prefix}:{aggregate_type}"
+
+class OutboxRelay:
+    """Publishes outbox events to Redis Streams"""
+
+    def __init__(self, redis_client=None, prefix=STREAM_PREFIX, maxlen=100000, dedupe_ttl=86400):
+        """
+        Initialize the relay
+
+        Args:
+            redis_client: Redis client (defaults to ``get_redis()``)
+            prefix: Stream name prefix
+            maxlen: Approximate maximum length of each stream
+            dedupe_ttl: Seconds a published event id is remembered
+        """
+        self.redis = redis_client or get_redis()
+        self.prefix = prefix
+        self.maxlen = maxlen
+        self.dedupe_ttl = dedupe_ttl
+        self._publish = self.redis.register_script(_PUBLISH_ONCE)
+
+    def message_fields(self, event):
+        created_at = event.created_at.isoformat() if event.created_at else ''
+        return {
+            'event_id': event.id,
+            'event_type': event.event_type,
+            'aggregate_type': event.aggregate_type,
+            'aggregate_id': event.aggregate_id,
+            'payload': event.payload,
+            'created_at': created_at,
+            # Producer trace context and origin, so consumers can link to it
+            'headers': event.headers or '',
+        }
+
+    def publish(self, event):
+        """
+        Publish one outbox event
+
+        Returns:
+            The stream message id, or None if the event was already published
+        """
+        stream = stream_name(event.aggregate_type, self.prefix)
+        args = [self.dedupe_ttl, self.maxlen]
+        for key, value in self.message_fields(event).items():
+            args.extend([key, '' if value is None else str(value)])
+        return self._publish(keys=[stream, f"{stream}:published:{event.id}"], args=args)
+
+    def handle(self, aggregate_id, payload, event):
+        """OutboxProcessor handler signature"""
+        message_id = self.publish(event)
+        if message_id is None:
+            logger.info(f"Outbox event {event.id} already relayed, skipping")
+
+def init_outbox_relay(app, db, outbox_model=None, redis_client=None):
+    """
+    Relay every outbox event to Redis Streams
+
+    The relay is added as a stage of the app's single OutboxProcessor
+    (created with ``init_outbox_processor`` if there is none yet), so
+    events are claimed once and relayed after their in-process handlers.
+    Starting the processor is left to ``init_outbox_processor``.
+
+    Configuration:
+        OUTBOX_RELAY_STREAM_PREFIX: Stream name prefix (default 'outbox')
+        OUTBOX_RELAY_MAXLEN: Approximate stream length cap (default 100000)
+
+    Returns:
+        The OutboxRelay
+    """
+    relay = OutboxRelay(
+        redis_client,
+        prefix=app.config.get('OUTBOX_RELAY_STREAM_PREFIX', STREAM_PREFIX),
+        maxlen=app.config.get('OUTBOX_RELAY_MAXLEN', 100000),
+    )
+    processor = app.extensions.get('outbox_processor')
+    if processor is None:
+        processor = init_outbox_processor(app, db, outbox_model)
+    elif outbox_model is not None and processor.outbox_model is None:
+        processor.outbox_model = outbox_model
+    processor.add_stage(relay.handle)
+    app.extensions['outbox_relay'] = relay
+    return relay
+
+class StreamConsumer:
+    """
+    Consumes outbox streams through a Redis consumer group
+
+    Handlers have the same signature as outbox handlers:
+    ``handler(aggregate_id, payload, message)`` where ``message`` is the dict
+    of stream fields. A message is acknowledged once its handler returns; a
+    message whose handler raised stays pending and is retried after
+    ``claim_idle_ms``, and after ``max_deliveries`` attempts it is moved to
+    ``<stream>:dead`` and acknowledged.
+    """
+
+    def __init__(self, group, aggregate_types, handlers=None, redis_client=None,
+                 consumer_name=None, prefix=STREAM_PREFIX, batch_size=100,
+                 block_ms=5000, claim_idle_ms=60000, max_deliveries=5, start_id='$'):
+        """
+        Initialize the consumer
+
+        Args:
+            group: Consumer group name, usually the consuming service
+            aggregate_types: Aggregate types whose streams to read
+            handlers: Dict mapping event_type to handler functions
+            redis_client: Redis client (defaults to ``get_redis()``)
+            consumer_name: Unique name of this consumer within the group
+            prefix: Stream name prefix
+            batch_size: Messages read per call
+            block_ms: How long a read blocks waiting for messages
+            claim_idle_ms: Idle time after which pending messages of other
+                consumers are reclaimed
+            max_deliveries: Attempts before a message is dead-lettered
+            start_id: Where a newly created group starts ('$' = new only,
+                '0' = whole stream)
+        """
+        self.group = group
+        self.streams = [stream_name(t, prefix) for t in aggregate_types]
+        self.handlers = handlers or {}
+        self.redis = redis_client or get_redis()
+        self.consumer_name = consumer_name or f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+        self.max_deliveries = max_deliveries
+        self.start_id = start_id
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_reclaim = 0
+
+    def register_handler(self, event_type, handler=None):
+        """Register a handler for an event type; usable as a decorator"""
+        if handler is None:
+            def decorator(func):
+                self.handlers[event_type] = func
+                return func
+            return decorator
+        self.handlers[event_type] = handler
+        return handler
+
+    def ensure_groups(self):
+        for stream in self.streams:
+            try:
+                self.redis.xgroup_create(stream, self.group, id=self.start_id, mkstream=True)
+            except Exception as e:
+                if 'BUSYGROUP' not in str(e):
+                    raise
+
+    def _handle(self, stream, message_id, fields):
+        """Run the handler for one message; returns True if it can be acked"""
+        handler = self.handlers.get(fields.get('event_type'))
+        if handler is None:
+            # Not interesting to this consumer
+            return True
+        # Stream ids start with the millisecond the message was added
+        enqueued_at = int(message_id.split('-')[0]) / 1000
+        try:
+            with handling_event(fields.get('event_type'), parse_event_headers(fields.get('headers')),
+                                f"stream:{self.group}", enqueued_at):
+                handler(fields.get('aggregate_id'), json.loads(fields.get('payload') or '{}'), fields)
+            return True
+        except Exception as e:
+            logger.error(f"Error handling {stream} message {message_id}: {str(e)}")
+            return False
+
+    def _process(self, stream, messages):
+        acked = [message_id for message_id, fields in messages
+                 if fields is not None and self._handle(stream, message_id, fields)]
+        if acked:
+            self.redis.xack(stream, self.group, *acked)
+        return len(acked)
+
+    def poll(self):
+        """Read and handle one batch of new messages; returns messages acked"""
+        response = self.redis.xreadgroup(
+            self.group, self.consumer_name,
+            {stream: '>' for stream in self.streams},
+            count=self.batch_size, block=self.block_ms,
+        )
+        return sum(self._process(stream, messages) for stream, messages in response or [])
+
+    def reclaim(self):
+        """
+        Take over messages left pending by this or other consumers for longer
+        than ``claim_idle_ms`` and retry or dead-letter them
+        """
+        handled = 0
+        for stream in self.streams:
+            pending = self.redis.xpending_range(
+                stream, self.group, min='-', max='+',
+                count=self.batch_size, idle=self.claim_idle_ms,
+            )
+            if not pending:
+                continue
+            exhausted = [p['message_id'] for p in pending
+                         if p['times_delivered'] >= self.max_deliveries]
+            retry = [p['message_id'] for p in pending
+                     if p['times_delivered'] < self.max_deliveries]
+            if exhausted:
+                self._dead_letter(stream, exhausted)
+            if retry:
+                messages = self.redis.xclaim(stream, self.group, self.consumer_name,
+                                             self.claim_idle_ms, retry)
+                handled += self._process(stream, messages)
+        return handled
+
+    def _dead_letter(self, stream, message_ids):
+        pipe = self.redis.pipeline()
+        for message_id in message_ids:
+            for _, fields in self.redis.xrange(stream, min=message_id, max=message_id, count=1):
+                pipe.xadd(f"{stream}:dead", dict(fields, original_id=message_id, group=self.group))
+        pipe.xack(stream, self.group, *message_ids)
+        pipe.execute()
+        logger.error(f"Dead-lettered {len(message_ids)} messages from {stream} for {self.group}")
+
+    def run(self):
+        """Consume until ``stop()`` is called"""
+        self.ensure_groups()
+        while not self._stop.is_set():
+            try:
+                # Pending entries cannot become reclaimable faster than this
+                if time.monotonic() - self._last_reclaim >= self.claim_idle_ms / 2000:
+                    self._last_reclaim = time.monotonic()
+                    self.reclaim()
+                self.poll()
+            except Exception as e:
+                logger.error(f"Error in stream consumer {self.group}: {str(e)}")
+                self._stop.wait(1)
+
+    def start(self, app=None):
+        """Consume in a background daemon thread, inside ``app``'s context if given"""
+        if self._thread is not None and self._thread.is_alive():
+            return self._thread
+        app = app or current_app._get_current_object()
+        self._stop.clear()
+
+        def target():
+            with app.app_context():
+                self.run()
+
+        self._thread = threading.Thread(target=target, name=f'stream-consumer-{self.group}', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+class RedisStreamBroker:
+    """
+    ``consumer.EventConsumer`` broker backed by the outbox streams
+
+    Topics are aggregate types, so events published by ``OutboxRelay`` are
+    consumed as-is. Pending messages of crashed consumers are not reclaimed
+    here; use ``StreamConsumer`` where that matters.
+    """
+
+    def __init__(self, redis_client=None, prefix=STREAM_PREFIX, consumer_name=None,
+                 maxlen=100000, start_id='$'):
+        self.redis = redis_client or get_redis()
+        self.prefix = prefix
+        self.consumer_name = consumer_name or f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+        self.maxlen = maxlen
+        self.start_id = start_id
+        self._streams = {}
+
+    def subscribe(self, group, topics):
+        streams = [stream_name(topic, self.prefix) for topic in topics]
+        for stream in streams:
+            try:
+                self.redis.xgroup_create(stream, group, id=self.start_id, mkstream=True)
+            except Exception as e:
+                if 'BUSYGROUP' not in str(e):
+                    raise
+        self._streams[group] = streams
+
+    def publish(self, event):
+        fields = {
+            'event_id': event.event_id or str(uuid.uuid4()),
+            'event_type': event.event_type,
+            'aggregate_type': event.aggregate_type,
+            'aggregate_id': event.aggregate_id or '',
+            'payload': json.dumps(event.payload, default=str),
+            'headers': json.dumps(event.headers),
+        }
+        return self.redis.xadd(stream_name(event.aggregate_type, self.prefix), fields,
+                               maxlen=self.maxlen, approximate=True)
+
+    def fetch(self, group, max_count=100, timeout=1.0):
+        response = self.redis.xreadgroup(
+            group, self.consumer_name,
+            {stream: '>' for stream in self._streams[group]},
+            count=max_count, block=int(timeout * 1000),
+        )
+        events = []
+        for stream, messages in response or []:
+            for message_id, fields in messages:
+                events.append(Event(
+                    fields.get('event_type'),
+                    fields.get('aggregate_type'),
+                    fields.get('aggregate_id'),
+                    json.loads(fields.get('payload') or '{}'),
+                    event_id=fields.get('event_id'),
+                    headers=parse_event_headers(fields.get('headers')),
+                    delivery_id=(stream, message_id),
+                ))
+        return events
+
+    def _by_stream(self, events):
+        grouped = {}
+        for event in events:
+            stream, message_id = event.delivery_id
+            grouped.setdefault(stream, []).append(message_id)
+        return grouped
+
+    def ack(self, group, events):
+        pipe = self.redis.pipeline()
+        for stream, message_ids in self._by_stream(events).items():
+            pipe.xack(stream, group, *message_ids)
+        pipe.execute()
+
+    def dead_letter(self, group, events, error):
+        pipe = self.redis.pipeline()
+        for event in events:
+            stream, message_id = event.delivery_id
+            pipe.xadd(f"{stream}:dead", {
+                'event_id': event.event_id or '',
+                'event_type': event.event_type,
+                'aggregate_type': event.aggregate_type,
+                'aggregate_id': event.aggregate_id or '',
+                'payload': json.dumps(event.payload, default=str),
+                'original_id': message_id,
+                'group': group,
+                'error': str(error),
+            })
+        pipe.execute()
@@ -1,7 +1,335 @@
+"""
+Pooled HTTP client for service-to-service calls in ReqArchitect services.
+
+All internal calls should go through ``get_http_client()`` so that they share
+keep-alive connection pools per host, retry idempotent requests with jittered
+backoff under a global retry budget, and honour the deadline of the incoming
+request.
+"""
+import random
+import threading
+import time
+import logging
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
 import requests
+from requests.adapters import HTTPAdapter
+from flask import g, has_request_context, request
+
+from .server_timing import timed
+
+logger = logging.getLogger(__name__)
+
+# Absolute deadline (epoch seconds) propagated between services
+DEADLINE_HEADER = 'X-Request-Deadline'
+# Relative timeout (seconds) accepted from edge clients
+TIMEOUT_HEADER = 'X-Request-Timeout'
+
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'})
+RETRYABLE_STATUS_CODES = frozenset({502, 503, 504})
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """Raised when the propagated request deadline has already passed."""
+    pass
+
+class RetryBudget:
+    """
+    Token bucket limiting retries to a fraction of regular traffic.
+
+    Every request deposits ``ratio`` tokens and every retry withdraws one, so
+    retries can never amplify load by more than ``ratio`` during an outage.
+    ``min_per_second`` tokens are refilled over time so low-traffic callers
+    can still retry.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_per_second: float = 5.0, max_tokens: float = 100.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._tokens = min(self.max_tokens, self._tokens + elapsed * self.min_per_second)
+
+def current_deadline() -> Optional[float]:
+    """Return the deadline of the incoming request, if any."""
+    if has_request_context():
+        return getattr(g, 'request_deadline', None)
+    return None
+
+def init_deadline_propagation(app, default_timeout: Optional[float] = None):
+    """
+    Read the caller's deadline from incoming requests so outbound calls
+    made while handling them inherit it.
+
+    Args:
+        app: Flask application
+        default_timeout: Deadline in seconds applied when the caller sent none
+    """
+    default_timeout = default_timeout or app.config.get('REQUEST_DEFAULT_DEADLINE')
+
+    @app.before_request
+    def read_request_deadline():
+        deadline = None
+        try:
+            if DEADLINE_HEADER in request.headers:
+                deadline = float(request.headers[DEADLINE_HEADER])
+            elif TIMEOUT_HEADER in request.headers:
+                deadline = time.time() + float(request.headers[TIMEOUT_HEADER])
+        except ValueError:
+            logger.warning("Ignoring malformed request deadline header")
+        if deadline is None and default_timeout:
+            deadline = time.time() + float(default_timeout)
+        g.request_deadline = deadline
+
+def _pool_key(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+def _backoff(attempt: int, base: float, cap: float) -> float:
+    """Full-jitter exponential backoff."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+def _is_idempotent(method: str, idempotent: Optional[bool]) -> bool:
+    if idempotent is not None:
+        return idempotent
+    return method.upper() in IDEMPOTENT_METHODS
+
+def _resolve_timeout(timeout: float, headers: Dict[str, str]) -> float:
+    """Clamp ``timeout`` to the propagated deadline and forward it downstream."""
+    deadline = current_deadline()
+    if deadline is None:
+        return timeout
+    remaining = deadline - time.time()
+    if remaining <= 0:
+        raise DeadlineExceeded("Request deadline exceeded before outbound call")
+    headers.setdefault(DEADLINE_HEADER, f"{deadline:.3f}")
+    return min(timeout, remaining)
+
+class ServiceHTTPClient:
+    """Synchronous HTTP client with per-host pooled sessions and retries."""
+
+    def __init__(self, pool_connections: int = 10, pool_maxsize: int = 20,
+                 max_retries: int = 2, backoff_base: float = 0.05,
+                 backoff_max: float = 1.0, default_timeout: float = 5,
+                 retry_budget: Optional[RetryBudget] = None):
+        """
+        Initialize the client
+
+        Args:
+            pool_connections: Number of connection pools cached per session
+            pool_maxsize: Maximum keep-alive connections per host
+            max_retries: Retries for idempotent requests
+            backoff_base: Base delay in seconds for exponential backoff
+            backoff_max: Maximum delay in seconds between retries
+            default_timeout: Timeout in seconds when the caller passes none
+            retry_budget: Shared RetryBudget (a new one is created if omitted)
+        """
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.default_timeout = default_timeout
+        self.retry_budget = retry_budget or RetryBudget()
+        self._sessions: Dict[str, requests.Session] = {}
+        self._lock = threading.Lock()
+
+    def session_for(self, url: str) -> requests.Session:
+        """Get the pooled session for the host of ``url``"""
+        key = _pool_key(url)
+        session = self._sessions.get(key)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(key)
+                if session is None:
+                    session = requests.Session()
+                    # Retries are handled here so they respect the budget
+                    adapter = HTTPAdapter(
+                        pool_connections=self.pool_connections,
+                        pool_maxsize=self.pool_maxsize,
+                        max_retries=0,
+                    )
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    self._sessions[key] = session
+        return session
+
+    def request(self, method: str, url: str, timeout: Optional[float] = None,
+                idempotent: Optional[bool] = None, headers: Optional[Dict[str, str]] = None,
+                **kwargs: Any) -> requests.Response:
+        """
+        Send a request, retrying idempotent calls on connection errors and
+        gateway failures.
+
+        Args:
+            method: HTTP method
+            url: Target URL
+            timeout: Timeout in seconds, clamped to the request deadline
+            idempotent: Override whether the call is safe to retry
+            headers: Request headers
+            **kwargs: Passed through to ``requests.Session.request``
+
+        Returns:
+            requests.Response
+        """
+        session = self.session_for(url)
+        retryable = _is_idempotent(method, idempotent)
+        headers = dict(headers or {})
+        timeout = timeout or self.default_timeout
+        self.retry_budget.deposit()
+
+        with timed('http'):
+            attempt = 0
+            while True:
+                call_timeout = _resolve_timeout(timeout, headers)
+                try:
+                    response = session.request(method, url, headers=headers,
+                                               timeout=call_timeout, **kwargs)
+                    if response.status_code not in RETRYABLE_STATUS_CODES:
+                        return response
+                    error = None
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                    response, error = None, e
+
+                delay = _backoff(attempt, self.backoff_base, self.backoff_max)
+                deadline = current_deadline()
+                if (not retryable or attempt >= self.max_retries
+                        or (deadline is not None and time.time() + delay >= deadline)
+                        or not self.retry_budget.withdraw()):
+                    if error is not None:
+                        raise error
+                    return response
+                logger.debug(f"Retrying {method} {url} in {delay:.3f}s (attempt {attempt + 1})")
+                time.sleep(delay)
+                attempt += 1
+
+    def get(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request('PUT', url, **kwargs)
+
+    def delete(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request('DELETE', url, **kwargs)
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+class AsyncServiceHTTPClient:
+    """asyncio counterpart of ServiceHTTPClient built on httpx"""
+
+    def __init__(self, max_connections: int = 100, max_keepalive_connections: int = 20,
+                 max_retries: int = 2, backoff_base: float = 0.05,
+                 backoff_max: float = 1.0, default_timeout: float = 5,
+                 retry_budget: Optional[RetryBudget] = None):
+        import httpx
+
+        self._httpx = httpx
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.default_timeout = default_timeout
+        self.retry_budget = retry_budget or RetryBudget()
+        # httpx pools connections per host inside a single client
+        self._client = httpx.AsyncClient(limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+        ))
+
+    async def request(self, method: str, url: str, timeout: Optional[float] = None,
+                      idempotent: Optional[bool] = None, headers: Optional[Dict[str, str]] = None,
+                      deadline: Optional[float] = None, **kwargs: Any):
+        """
+        Send a request with the same retry and deadline rules as
+        ``ServiceHTTPClient.request``. ``deadline`` must be passed explicitly
+        because coroutines may outlive the Flask request context.
+        """
+        import asyncio
+
+        retryable = _is_idempotent(method, idempotent)
+        headers = dict(headers or {})
+        timeout = timeout or self.default_timeout
+        deadline = deadline or current_deadline()
+        if deadline is not None:
+            headers.setdefault(DEADLINE_HEADER, f"{deadline:.3f}")
+        self.retry_budget.deposit()
+
+        attempt = 0
+        while True:
+            call_timeout = timeout
+            if deadline is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise DeadlineExceeded("Request deadline exceeded before outbound call")
+                call_timeout = min(timeout, remaining)
+            try:
+                response = await self._client.request(method, url, headers=headers,
+                                                      timeout=call_timeout, **kwargs)
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    return response
+                error = None
+            except self._httpx.TransportError as e:
+                response, error = None, e
+
+            delay = _backoff(attempt, self.backoff_base, self.backoff_max)
+            if (not retryable or attempt >= self.max_retries
+                    or (deadline is not None and time.time() + delay >= deadline)
+                    or not self.retry_budget.withdraw()):
+                if error is not None:
+                    raise error
+                return response
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def get(self, url: str, **kwargs: Any):
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url: str, **kwargs: Any):
+        return await self.request('POST', url, **kwargs)
+
+    async def aclose(self):
+        await self._client.aclose()
+
+_client: Optional[ServiceHTTPClient] = None
+_client_lock = threading.Lock()
+
+def get_http_client() -> ServiceHTTPClient:
+    """Get the process-wide pooled HTTP client"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = ServiceHTTPClient()
+    return _client
 
 def post_with_jwt(url, json, jwt_token, timeout=5):
     headers = {'Authorization': jwt_token} if jwt_token else {}
-    resp = requests.post(url, json=json, headers=headers, timeout=timeout)
+    resp = get_http_client().post(url, json=json, headers=headers, timeout=timeout)
     resp.raise_for_status()
-    return resp.json() 
\ No newline at end of file
+    return resp.json()
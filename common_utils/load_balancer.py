@@ -0,0 +1,197 @@
+"""
+Client-side load balancing for service-to-service calls.
+
+``LoadBalancer`` picks one of the instances returned by service discovery
+using power-of-two-choices over a latency/load cost (or plain
+least-outstanding-requests), tracks per-instance latency and error rate as
+exponentially weighted moving averages, and temporarily ejects instances
+that keep failing.
+"""
+import random
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+class NoHealthyInstances(Exception):
+    """Raised when there is no instance to send a request to."""
+    pass
+
+class InstanceStats:
+    """Load and health of one instance as seen by this process"""
+
+    def __init__(self, initial_latency: float):
+        self.outstanding = 0
+        self.ewma_latency = initial_latency
+        self.ewma_error = 0.0
+        self.requests = 0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'outstanding': self.outstanding,
+            'ewma_latency': round(self.ewma_latency, 6),
+            'ewma_error': round(self.ewma_error, 4),
+            'requests': self.requests,
+            'ejected': self.ejected_until > time.monotonic(),
+            'ejections': self.ejections,
+        }
+
+class LoadBalancer:
+    """Picks instances of one service and learns from call outcomes"""
+
+    def __init__(self, strategy: str = 'p2c', decay: float = 0.3,
+                 initial_latency: float = 0.05, error_penalty: float = 10.0,
+                 consecutive_failures: int = 5, error_rate_threshold: float = 0.5,
+                 min_requests: int = 20, base_ejection_time: float = 30.0,
+                 max_ejection_time: float = 300.0, max_ejection_percent: float = 50.0):
+        """
+        Initialize the balancer
+
+        Args:
+            strategy: 'p2c' (power of two choices on cost) or 'least_outstanding'
+            decay: Weight of the newest sample in the moving averages
+            initial_latency: Latency assumed for instances without samples
+            error_penalty: How much the error rate inflates an instance's cost
+            consecutive_failures: Failures in a row that eject an instance
+            error_rate_threshold: Smoothed error rate that ejects an instance
+            min_requests: Requests seen before the error rate is trusted
+            base_ejection_time: Seconds of the first ejection; doubles on
+                every repeated ejection
+            max_ejection_time: Upper bound of an ejection in seconds
+            max_ejection_percent: Never eject more than this share of instances
+        """
+        if strategy not in ('p2c', 'least_outstanding'):
+            raise ValueError(f"Unknown load balancing strategy: {strategy}")
+        self.strategy = strategy
+        self.decay = decay
+        self.initial_latency = initial_latency
+        self.error_penalty = error_penalty
+        self.consecutive_failures = consecutive_failures
+        self.error_rate_threshold = error_rate_threshold
+        self.min_requests = min_requests
+        self.base_ejection_time = base_ejection_time
+        self.max_ejection_time = max_ejection_time
+        self.max_ejection_percent = max_ejection_percent
+        self._stats: Dict[str, InstanceStats] = {}
+        self._lock = threading.Lock()
+
+    def _stats_for(self, instance_id: str) -> InstanceStats:
+        stats = self._stats.get(instance_id)
+        if stats is None:
+            stats = self._stats[instance_id] = InstanceStats(self.initial_latency)
+        return stats
+
+    def _cost(self, stats: InstanceStats) -> float:
+        # Expected wait if we add one more request, inflated by recent errors
+        return stats.ewma_latency * (stats.outstanding + 1) * (1 + self.error_penalty * stats.ewma_error)
+
+    def _available(self, instances: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        available = [i for i in instances if self._stats_for(i['id']).ejected_until <= now]
+        # If everything is ejected, a possibly bad instance beats none
+        return available or instances
+
+    def pick(self, instances: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Choose the instance for the next request"""
+        if not instances:
+            raise NoHealthyInstances("No instances available")
+        with self._lock:
+            self._forget_missing(instances)
+            candidates = self._available(instances)
+            if len(candidates) == 1:
+                return candidates[0]
+            if self.strategy == 'p2c':
+                first, second = random.sample(candidates, 2)
+                if self._cost(self._stats_for(first['id'])) <= self._cost(self._stats_for(second['id'])):
+                    return first
+                return second
+            least = min(self._stats_for(i['id']).outstanding for i in candidates)
+            return random.choice([i for i in candidates
+                                  if self._stats_for(i['id']).outstanding == least])
+
+    def _forget_missing(self, instances: List[Dict[str, Any]]):
+        """Drop stats of instances that left the service"""
+        if len(self._stats) > 2 * len(instances):
+            current = {i['id'] for i in instances}
+            for instance_id in [k for k in self._stats if k not in current]:
+                del self._stats[instance_id]
+
+    def acquire(self, instance: Dict[str, Any]):
+        with self._lock:
+            self._stats_for(instance['id']).outstanding += 1
+
+    def release(self, instance: Dict[str, Any], latency: float, success: bool, total_instances: int = 1):
+        """Record the outcome of a request started with ``acquire``"""
+        with self._lock:
+            stats = self._stats_for(instance['id'])
+            stats.outstanding = max(0, stats.outstanding - 1)
+            stats.requests += 1
+            stats.ewma_latency += self.decay * (latency - stats.ewma_latency)
+            stats.ewma_error += self.decay * ((0.0 if success else 1.0) - stats.ewma_error)
+            stats.consecutive_failures = 0 if success else stats.consecutive_failures + 1
+            if not success and self._is_outlier(stats):
+                self._eject(instance['id'], stats, total_instances)
+
+    def _is_outlier(self, stats: InstanceStats) -> bool:
+        if stats.consecutive_failures >= self.consecutive_failures:
+            return True
+        return stats.requests >= self.min_requests and stats.ewma_error >= self.error_rate_threshold
+
+    def _eject(self, instance_id: str, stats: InstanceStats, total_instances: int):
+        now = time.monotonic()
+        if stats.ejected_until > now:
+            return
+        ejected = sum(1 for s in self._stats.values() if s.ejected_until > now)
+        if (ejected + 1) * 100 > self.max_ejection_percent * total_instances:
+            return
+        duration = min(self.max_ejection_time, self.base_ejection_time * (2 ** stats.ejections))
+        stats.ejections += 1
+        stats.ejected_until = now + duration
+        # Start over once it is back in rotation
+        stats.consecutive_failures = 0
+        stats.ewma_error = 0.0
+        stats.requests = 0
+        logger.warning(f"Ejecting instance {instance_id} for {duration:.0f}s")
+
+    @contextmanager
+    def call(self, instances: List[Dict[str, Any]]):
+        """
+        Pick an instance and track the request made to it
+
+        Yields a dict with the chosen ``instance``; set its ``success`` key to
+        False for failed responses (exceptions count as failures).
+        """
+        instance = self.pick(instances)
+        outcome = {'instance': instance, 'success': True}
+        self.acquire(instance)
+        started = time.monotonic()
+        try:
+            yield outcome
+        except Exception:
+            outcome['success'] = False
+            raise
+        finally:
+            self.release(instance, time.monotonic() - started, outcome['success'], len(instances))
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {instance_id: s.as_dict() for instance_id, s in self._stats.items()}
+
+_balancers: Dict[str, LoadBalancer] = {}
+_balancers_lock = threading.Lock()
+
+def get_load_balancer(service_name: str, **kwargs: Any) -> LoadBalancer:
+    """Get the process-wide balancer of a service"""
+    balancer = _balancers.get(service_name)
+    if balancer is None:
+        with _balancers_lock:
+            balancer = _balancers.get(service_name)
+            if balancer is None:
+                balancer = _balancers[service_name] = LoadBalancer(**kwargs)
+    return balancer
@@ -1,16 +1,372 @@
-import structlog
+"""
+Structured, non-blocking logging for ReqArchitect services.
+
+Records (from stdlib loggers and structlog alike) are put on a bounded
+in-memory queue by ``QueueLogHandler`` and rendered to JSON and written by
+a single background thread, so a slow stdout never adds latency to
+requests. When the queue is full records are dropped rather than waiting.
+Chatty loggers can be rate limited or sampled; records at WARNING and
+above are never limited. Dropped records are counted per logger and
+reason, and reported periodically by the writer.
+"""
+import sys
+import copy
+import json
+import time
+import queue
+import atexit
+import random
+import datetime
+import threading
 import logging
 import os
+import structlog
 
-def setup_logging():
-    logging.basicConfig(level=logging.INFO)
-    structlog.configure(
-        processors=[
-            structlog.processors.add_log_level,
-            structlog.processors.TimeStamper(fmt="iso"),
-            structlog.processors.JSONRenderer()
-        ]
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from prometheus_client import Counter
+    LOG_RECORDS_DROPPED = Counter(
+        'log_records_dropped_total',
+        'Log records dropped before being written',
+        ['logger', 'reason']
     )
+except ImportError:
+    LOG_RECORDS_DROPPED = None
+
+_STOP = object()
+
+# Attributes of every LogRecord; anything else was passed as ``extra``
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_exception_formatter = logging.Formatter()
+
+def _dumps(fields):
+    if orjson is not None:
+        return orjson.dumps(fields, default=str).decode('utf-8')
+    return json.dumps(fields, default=str)
+
+class JSONFormatter(logging.Formatter):
+    """Renders a record as one JSON line, merging structlog event dicts and extras"""
+
+    def format(self, record):
+        fields = {
+            'timestamp': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+        }
+        if isinstance(record.msg, dict):
+            event = dict(record.msg)
+            fields['message'] = event.pop('event', None)
+            fields.update(event)
+        else:
+            fields['message'] = record.getMessage()
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                fields[key] = value
+        if record.exc_info:
+            fields['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            fields['exception'] = record.exc_text
+        return _dumps(fields)
+
+class _RateLimit:
+    """Token bucket of one logger"""
+
+    def __init__(self, per_second):
+        self.per_second = per_second
+        self.burst = max(1.0, per_second)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def allow(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.per_second)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+def _match(rules, name):
+    """Value of the longest logger name prefix in ``rules`` matching ``name``"""
+    best = None
+    for prefix, value in rules.items():
+        if (name == prefix or name.startswith(prefix + '.') or prefix == '') and \
+                (best is None or len(prefix) > len(best[0])):
+            best = (prefix, value)
+    return best[1] if best else None
+
+class QueueLogHandler(logging.Handler):
+    """
+    Puts records on a bounded queue for ``LogWriter``
+
+    Only cheap work happens on the logging thread: level, rate limit and
+    sampling checks and capturing request context. Rendering and I/O are
+    left to the writer. Like ``logging.handlers.QueueHandler.prepare``,
+    the queued copy has its message merged with its arguments and its
+    exception formatted to text, so it holds no references to mutable
+    arguments or traceback frames; structlog event dicts are kept as is.
+    """
+
+    def __init__(self, log_queue, rate_limits=None, sample_rates=None, context=None):
+        """
+        Initialize the handler
+
+        Args:
+            log_queue: Bounded queue shared with the writer
+            rate_limits: Dict mapping logger name prefixes to records per second
+                ('' matches every logger)
+            sample_rates: Dict mapping logger name prefixes to the fraction
+                of records kept
+            context: Callable returning fields to attach to every record,
+                evaluated on the logging thread
+        """
+        super().__init__()
+        self.queue = log_queue
+        self.rate_limits = rate_limits or {}
+        self.sample_rates = sample_rates or {}
+        self.context = context
+        self.dropped = {}
+        self._policies = {}
+        self._lock = threading.Lock()
+
+    def _policy(self, name):
+        policy = self._policies.get(name)
+        if policy is None:
+            limit = _match(self.rate_limits, name)
+            policy = self._policies[name] = (
+                _RateLimit(limit) if limit else None,
+                _match(self.sample_rates, name),
+            )
+        return policy
+
+    def _drop(self, record, reason):
+        key = (record.name, reason)
+        with self._lock:
+            self.dropped[key] = self.dropped.get(key, 0) + 1
+        if LOG_RECORDS_DROPPED is not None:
+            LOG_RECORDS_DROPPED.labels(logger=record.name, reason=reason).inc()
+
+    def emit(self, record):
+        if record.levelno < logging.WARNING:
+            bucket, sample_rate = self._policy(record.name)
+            if sample_rate is not None and random.random() >= sample_rate:
+                self._drop(record, 'sampled')
+                return
+            if bucket is not None:
+                with self._lock:
+                    allowed = bucket.allow()
+                if not allowed:
+                    self._drop(record, 'rate_limited')
+                    return
+        try:
+            record = self.prepare(record)
+        except Exception:
+            self.handleError(record)
+            return
+        if self.context is not None:
+            try:
+                for key, value in self.context().items():
+                    if value is not None and not hasattr(record, key):
+                        setattr(record, key, value)
+            except Exception:
+                pass
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self._drop(record, 'queue_full')
+
+    def prepare(self, record):
+        """Copy of ``record`` safe to render later on another thread"""
+        record = copy.copy(record)
+        if not isinstance(record.msg, dict):
+            record.msg = record.message = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def take_dropped(self):
+        """Return and reset the drop counters"""
+        with self._lock:
+            dropped, self.dropped = self.dropped, {}
+        return dropped
+
+class LogWriter:
+    """Background thread rendering queued records and writing them in batches"""
+
+    def __init__(self, log_queue, handler, stream=None, formatter=None,
+                 batch_size=256, report_interval=10.0):
+        self.queue = log_queue
+        self.handler = handler
+        self.stream = stream or sys.stdout
+        self.formatter = formatter or JSONFormatter()
+        self.batch_size = batch_size
+        self.report_interval = report_interval
+        self.written = 0
+        self._thread = None
+
+    def _render(self, record):
+        try:
+            return self.formatter.format(record)
+        except Exception as e:
+            return _dumps({'level': 'error', 'logger': __name__,
+                           'message': f"Could not render log record from {record.name}: {str(e)}"})
+
+    def _report_drops(self):
+        dropped = self.handler.take_dropped()
+        if not dropped:
+            return []
+        counts = {}
+        for (name, reason), count in dropped.items():
+            counts.setdefault(name, {})[reason] = count
+        return [_dumps({
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'level': 'warning',
+            'logger': __name__,
+            'message': 'log_records_dropped',
+            'dropped': counts,
+        })]
+
+    def _write(self, lines):
+        try:
+            self.stream.write('\n'.join(lines) + '\n')
+            self.stream.flush()
+        except Exception:
+            pass
+        self.written += len(lines)
+
+    def _run(self):
+        next_report = time.monotonic() + self.report_interval
+        stopping = False
+        while not stopping:
+            lines = []
+            try:
+                record = self.queue.get(timeout=self.report_interval)
+                while True:
+                    if record is _STOP:
+                        stopping = True
+                        break
+                    lines.append(self._render(record))
+                    if len(lines) >= self.batch_size:
+                        break
+                    record = self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            if stopping or time.monotonic() >= next_report:
+                lines.extend(self._report_drops())
+                next_report = time.monotonic() + self.report_interval
+            if lines:
+                self._write(lines)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """Write everything queued so far and stop the thread"""
+        if self._thread is None:
+            return
+        try:
+            self.queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        self._thread = None
+
+def _request_context():
+    """Request fields worth attaching to every record logged during a request"""
+    from flask import g, has_request_context, request
+    if not has_request_context():
+        return {}
+    return {
+        'request_id': request.headers.get('X-Request-ID'),
+        'tenant_id': g.get('tenant'),
+    }
+
+def _defer_rendering(logger, method_name, event_dict):
+    """Last structlog processor: hand the event dict to stdlib unrendered"""
+    kwargs = {}
+    if 'exc_info' in event_dict:
+        kwargs['exc_info'] = event_dict.pop('exc_info')
+    return (event_dict,), kwargs
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+def configure_logging(app=None, level=None, queue_size=None, rate_limits=None, sample_rates=None, stream=None):
+    """
+    Route all logging through the queue and background writer
+
+    Safe to call more than once; the pipeline is created by the first call.
+
+    Configuration (from ``app.config`` or the environment):
+        LOG_LEVEL: Root log level (default INFO)
+        LOG_QUEUE_SIZE: Records buffered before dropping (default 10000)
+        LOG_RATE_LIMITS: Dict mapping logger name prefixes to records per second
+        LOG_SAMPLE_RATES: Dict mapping logger name prefixes to the fraction kept
+
+    Returns:
+        The ``QueueLogHandler`` installed on the root logger
+    """
+    global _pipeline
+    config = app.config if app is not None else {}
+    with _pipeline_lock:
+        if _pipeline is None:
+            level = level or config.get('LOG_LEVEL') or os.environ.get('LOG_LEVEL', 'INFO')
+            queue_size = queue_size or int(config.get('LOG_QUEUE_SIZE') or os.environ.get('LOG_QUEUE_SIZE', 10000))
+            log_queue = queue.Queue(maxsize=queue_size)
+            handler = QueueLogHandler(
+                log_queue,
+                rate_limits=rate_limits if rate_limits is not None else config.get('LOG_RATE_LIMITS'),
+                sample_rates=sample_rates if sample_rates is not None else config.get('LOG_SAMPLE_RATES'),
+                context=_request_context,
+            )
+            writer = LogWriter(log_queue, handler, stream=stream)
+            writer.start()
+            atexit.register(writer.stop)
+
+            root = logging.getLogger()
+            for existing in list(root.handlers):
+                root.removeHandler(existing)
+            root.addHandler(handler)
+            root.setLevel(level)
+
+            structlog.configure(
+                processors=[
+                    structlog.contextvars.merge_contextvars,
+                    structlog.stdlib.filter_by_level,
+                    _defer_rendering,
+                ],
+                logger_factory=structlog.stdlib.LoggerFactory(),
+                wrapper_class=structlog.stdlib.BoundLogger,
+                cache_logger_on_first_use=True,
+            )
+            _pipeline = (handler, writer)
+    if app is not None:
+        app.extensions['log_pipeline'] = _pipeline[0]
+    return _pipeline[0]
+
+def shutdown_logging():
+    """Flush queued records and remove the pipeline (mainly for tests)"""
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            return
+        handler, writer = _pipeline
+        writer.stop()
+        logging.getLogger().removeHandler(handler)
+        _pipeline = None
+
+def setup_logging(app=None):
+    configure_logging(app)
     logger = structlog.get_logger()
     return logger
 
@@ -19,4 +375,4 @@ def log_with_context(logger, message, **kwargs):
     trace_id = kwargs.get('trace_id') or os.environ.get('TRACE_ID')
     tenant_id = kwargs.get('tenant_id') or os.environ.get('TENANT_ID')
     user_id = kwargs.get('user_id') or os.environ.get('USER_ID')
-    logger.info(message, trace_id=trace_id, tenant_id=tenant_id, user_id=user_id, **kwargs) 
\ No newline at end of file
+    logger.info(message, trace_id=trace_id, tenant_id=tenant_id, user_id=user_id, **kwargs)
\ No newline at end of file
@@ -1,29 +1,90 @@
 # Data consistency utilities for microservices
+import os
+import gzip
 import json
 import uuid
+import time
+import socket
 import datetime
+import threading
+import contextvars
+import zlib
+import random
+import select as select_module
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
+from functools import wraps
+from contextlib import contextmanager, nullcontext
 from sqlalchemy.ext.declarative import declared_attr
-from sqlalchemy import Column, String, DateTime, Boolean, event
-from sqlalchemy.orm import Session
+from sqlalchemy import (
+    Column, String, DateTime, Boolean, Integer, Index, event, or_, and_,
+    select, update, insert, delete, literal, bindparam, func,
+)
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy.sql import text
 from flask import current_app
 import logging
 
 logger = logging.getLogger(__name__)
 
+try:
+    from opentelemetry import trace as otel_trace, propagate as otel_propagate
+    from opentelemetry.context import Context as OtelContext
+    _otel_tracer = otel_trace.get_tracer(__name__)
+except ImportError:
+    otel_trace = None
+
+try:
+    from prometheus_client import Histogram
+    _LAG_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+    OUTBOX_EVENT_LAG = Histogram(
+        'outbox_event_lag_seconds',
+        'Time from the write that started an event chain to handling this event',
+        ['event_type', 'stage'], buckets=_LAG_BUCKETS
+    )
+    OUTBOX_EVENT_WAIT = Histogram(
+        'outbox_event_wait_seconds',
+        'Time an event waited in a single hop before being handled',
+        ['event_type', 'stage'], buckets=_LAG_BUCKETS
+    )
+except ImportError:
+    OUTBOX_EVENT_LAG = OUTBOX_EVENT_WAIT = None
+
 class EventStatus(Enum):
     """Status of an outbox event"""
     PENDING = "pending"
     PROCESSING = "processing"
     COMPLETED = "completed"
     FAILED = "failed"
+    DEAD_LETTER = "dead_letter"
 
 class OutboxEvent:
-    """Base class for implementing the Outbox pattern"""
+    """
+    Base class for implementing the Outbox pattern
+
+    Service outbox models subclass it together with ``db.Model`` so they
+    get the lease, retry schedule and header columns ``OutboxProcessor``
+    relies on; a service whose table predates the base class keeps its
+    name by setting ``__tablename__``.
+    """
     
     @declared_attr
     def __tablename__(cls):
         return "outbox_events"
+
+    @declared_attr
+    def __table_args__(cls):
+        # Lets the processor find due events without scanning the table.
+        # Partial, so completed rows waiting for archiving never enter it.
+        unfinished = text("status IN ('pending', 'processing', 'failed')")
+        return (
+            Index(f"ix_{cls.__tablename__}_status_next_attempt_at", 'status', 'next_attempt_at',
+                  postgresql_where=unfinished, sqlite_where=unfinished),
+            # Finds earlier unfinished events of an aggregate when claiming
+            Index(f"ix_{cls.__tablename__}_aggregate_created_at", 'aggregate_type', 'aggregate_id', 'created_at',
+                  postgresql_where=unfinished, sqlite_where=unfinished),
+        )
     
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     event_type = Column(String(100), nullable=False, index=True)
@@ -35,6 +96,14 @@ class OutboxEvent:
     processed_at = Column(DateTime, nullable=True)
     error = Column(String, nullable=True)
     retry_count = Column(Integer, default=0)
+    # Lease held by the worker processing the event; expired leases are
+    # reclaimed so events claimed by a crashed worker are not lost.
+    locked_by = Column(String(100), nullable=True)
+    locked_until = Column(DateTime, nullable=True)
+    # Failed events are retried with exponential backoff from this time
+    next_attempt_at = Column(DateTime, default=datetime.datetime.utcnow)
+    # JSON trace context and origin timestamp of the write that caused the event
+    headers = Column(String, nullable=True, default=lambda: json.dumps(capture_event_headers()))
     
     @classmethod
     def create_event(cls, session, event_type, aggregate_type, aggregate_id, payload):
@@ -54,7 +123,7 @@ class OutboxEvent:
         event = cls(
             event_type=event_type,
             aggregate_type=aggregate_type,
-            aggregate_id=aggregate_id,
+            aggregate_id=str(aggregate_id),
             payload=json.dumps(payload)
         )
         session.add(event)
@@ -78,105 +147,890 @@ class OutboxEvent:
         self.retry_count += 1
         session.add(self)
 
+# Columns OutboxProcessor needs beyond the original outbox table
+REQUIRED_OUTBOX_COLUMNS = ('locked_by', 'locked_until', 'next_attempt_at', 'headers')
+
+def check_outbox_model(model):
+    """
+    Fail fast on an outbox model without the processor's columns
+
+    Without them failed events would be retried on every poll and events
+    of crashed workers never reclaimed.
+
+    Raises:
+        ValueError: If a required column is missing
+    """
+    missing = [name for name in REQUIRED_OUTBOX_COLUMNS if name not in model.__table__.c]
+    if missing:
+        raise ValueError(
+            f"Outbox model {model.__name__} lacks columns {', '.join(missing)}; subclass "
+            f"common_utils.outbox.OutboxEvent and run the service's migrations"
+        )
+    return model
+
+# Postgres channel notified whenever outbox events are committed
+OUTBOX_NOTIFY_CHANNEL = 'outbox_events'
+
+# Epoch seconds of the write that started the chain of events
+ORIGIN_HEADER = 'origin_ts'
+
+# Headers of the event being handled; events it causes inherit its origin
+_handling_headers = contextvars.ContextVar('outbox_handling_headers', default=None)
+
+def capture_event_headers():
+    """
+    Headers stored with a new event: the current trace context (W3C
+    ``traceparent``/``tracestate``) and the origin timestamp, inherited
+    from the event being handled if any
+    """
+    headers = {}
+    if otel_trace is not None:
+        otel_propagate.inject(headers)
+    parent = _handling_headers.get()
+    headers[ORIGIN_HEADER] = parent[ORIGIN_HEADER] if parent and ORIGIN_HEADER in parent else time.time()
+    return headers
+
+def parse_event_headers(raw):
+    """Decode stored event headers, tolerating rows written without them"""
+    if not raw:
+        return {}
+    if isinstance(raw, dict):
+        return raw
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return {}
+
+@contextmanager
+def handling_event(event_type, headers, stage, enqueued_at=None):
+    """
+    Handle one event in a consumer span linked to the producer's trace
+
+    Records the end-to-end lag since the origin and, given
+    ``enqueued_at`` (epoch seconds), the wait in this hop once the block
+    completes without error.
+
+    Args:
+        event_type: Type of the event being handled
+        headers: Decoded event headers
+        stage: Name of the hop, e.g. 'outbox' or 'stream:<group>'
+        enqueued_at: When the event entered this hop
+    """
+    token = _handling_headers.set(headers)
+    span = nullcontext()
+    if otel_trace is not None:
+        producer = otel_trace.get_current_span(otel_propagate.extract(headers)).get_span_context()
+        # A new trace linked to the producer: the hop may happen much later
+        span = _otel_tracer.start_as_current_span(
+            f"{stage} {event_type}",
+            context=OtelContext(),
+            kind=otel_trace.SpanKind.CONSUMER,
+            links=[otel_trace.Link(producer)] if producer.is_valid else [],
+            attributes={'messaging.event_type': event_type, 'messaging.stage': stage},
+        )
+    try:
+        with span:
+            yield
+    finally:
+        _handling_headers.reset(token)
+    now = time.time()
+    if OUTBOX_EVENT_LAG is not None and ORIGIN_HEADER in headers:
+        OUTBOX_EVENT_LAG.labels(event_type, stage).observe(now - float(headers[ORIGIN_HEADER]))
+    if OUTBOX_EVENT_WAIT is not None and enqueued_at is not None:
+        OUTBOX_EVENT_WAIT.labels(event_type, stage).observe(now - enqueued_at)
+
+# Set after any in-process commit that wrote outbox events; wakes
+# processors in this process when the database cannot push (SQLite)
+_local_wakeup = threading.Event()
+
+_hooked_event_classes = set()
+
+def _signal_outbox_write(session, notify_channel):
+    """Arrange for processors to be woken once the transaction commits"""
+    session.info['outbox_events_written'] = True
+    if not notify_channel or session.info.get('outbox_notified'):
+        return
+    connection = session.connection()
+    if connection.dialect.name == 'postgresql':
+        # Queued by Postgres and delivered only if the transaction
+        # commits; issued once per transaction
+        connection.execute(text("SELECT pg_notify(:channel, '')"), {'channel': notify_channel})
+        session.info['outbox_notified'] = True
+
 # SQLAlchemy hooks for automatic outbox event creation
-def configure_outbox_hooks(outbox_event_cls):
+def configure_outbox_hooks(outbox_event_cls, notify_channel=OUTBOX_NOTIFY_CHANNEL):
     """
     Configure SQLAlchemy hooks for automatic outbox event creation
     
     Args:
         outbox_event_cls: OutboxEvent class or subclass
+        notify_channel: Postgres channel to NOTIFY when outbox events are
+            committed, or None to disable push wakeups
     """
+    # Hooks are global to Session; installing them twice would duplicate events
+    if outbox_event_cls in _hooked_event_classes:
+        return
+    _hooked_event_classes.add(outbox_event_cls)
+
+    @event.listens_for(Session, 'after_flush')
+    def notify_outbox_listeners(session, context):
+        if any(isinstance(obj, outbox_event_cls) for obj in session.new):
+            _signal_outbox_write(session, notify_channel)
+
+    @event.listens_for(Session, 'after_commit')
+    def wake_local_processors(session):
+        session.info.pop('outbox_notified', None)
+        session.info.pop('outbox_captured', None)
+        session.info.pop('outbox_new', None)
+        if session.info.pop('outbox_events_written', None):
+            _local_wakeup.set()
+
+    @event.listens_for(Session, 'after_rollback')
+    def reset_outbox_notify(session):
+        session.info.pop('outbox_notified', None)
+        session.info.pop('outbox_captured', None)
+        session.info.pop('outbox_new', None)
+        session.info.pop('outbox_events_written', None)
+
     @event.listens_for(Session, 'before_flush')
     def capture_model_changes(session, context, instances):
+        captured = session.info.setdefault('outbox_captured', {})
         for obj in session.new:
-            if hasattr(obj, '__outbox_enabled__') and obj.__outbox_enabled__:
-                # New object being inserted
-                payload = obj.to_dict() if hasattr(obj, 'to_dict') else {
-                    c.name: getattr(obj, c.name) 
-                    for c in obj.__table__.columns
-                }
-                
-                aggregate_type = obj.__tablename__
-                event_type = f"{aggregate_type}_created"
-                
-                outbox_event_cls.create_event(
+            if _outbox_enabled(obj):
+                # Serialized once the flush has assigned the primary key
+                session.info.setdefault('outbox_new', []).append(obj)
+
+        for obj in session.dirty:
+            if not _outbox_enabled(obj):
+                continue
+            changes = _changed_columns(obj)
+            if not changes:
+                continue
+            entry = captured.get(id(obj))
+            if entry is None:
+                entry = captured[id(obj)] = _CapturedChange(obj, 'updated', changes)
+                entry.event = outbox_event_cls.create_event(
                     session=session,
-                    event_type=event_type,
-                    aggregate_type=aggregate_type,
+                    event_type=f"{obj.__tablename__}_updated",
+                    aggregate_type=obj.__tablename__,
                     aggregate_id=str(getattr(obj, 'id')),
-                    payload=payload
+                    payload={}
                 )
-        
-        for obj in session.dirty:
-            if hasattr(obj, '__outbox_enabled__') and obj.__outbox_enabled__:
-                # Changed attributes
-                changed = {}
-                for attr in session.attrs:
-                    if attr.key != 'id' and attr.history.has_changes():
-                        changed[attr.key] = getattr(obj, attr.key)
-                
-                if changed:
-                    payload = {
-                        'changes': changed,
-                        'full_object': obj.to_dict() if hasattr(obj, 'to_dict') else {
-                            c.name: getattr(obj, c.name) 
-                            for c in obj.__table__.columns
-                        }
-                    }
-                    
-                    aggregate_type = obj.__tablename__
-                    event_type = f"{aggregate_type}_updated"
-                    
-                    outbox_event_cls.create_event(
-                        session=session,
-                        event_type=event_type,
-                        aggregate_type=aggregate_type,
-                        aggregate_id=str(getattr(obj, 'id')),
-                        payload=payload
-                    )
-        
+            else:
+                # Coalesce with the event captured by an earlier flush
+                entry.changes.update(changes)
+            entry.write_payload()
+
         for obj in session.deleted:
-            if hasattr(obj, '__outbox_enabled__') and obj.__outbox_enabled__:
-                payload = {'id': getattr(obj, 'id')}
-                
-                aggregate_type = obj.__tablename__
-                event_type = f"{aggregate_type}_deleted"
-                
-                outbox_event_cls.create_event(
+            if not _outbox_enabled(obj):
+                continue
+            entry = captured.pop(id(obj), None)
+            if entry is not None and entry.kind == 'created':
+                # Never visible outside this transaction
+                _discard(session, entry.event)
+                continue
+            if entry is None:
+                event_obj = outbox_event_cls.create_event(
                     session=session,
-                    event_type=event_type,
-                    aggregate_type=aggregate_type,
+                    event_type=f"{obj.__tablename__}_deleted",
+                    aggregate_type=obj.__tablename__,
                     aggregate_id=str(getattr(obj, 'id')),
-                    payload=payload
+                    payload={}
                 )
+            else:
+                event_obj = entry.event
+                event_obj.event_type = f"{obj.__tablename__}_deleted"
+            event_obj.payload = json.dumps({'id': getattr(obj, 'id')}, default=str)
+
+    @event.listens_for(Session, 'after_flush_postexec')
+    def capture_created_models(session, context):
+        new_objects = session.info.pop('outbox_new', None)
+        if not new_objects:
+            return
+        captured = session.info.setdefault('outbox_captured', {})
+        for obj in new_objects:
+            if obj not in session or id(obj) in captured:
+                continue
+            # The flush has assigned the primary key; the events themselves
+            # are inserted by the next flush (commit flushes until clean)
+            entry = captured[id(obj)] = _CapturedChange(obj, 'created', _loaded_columns(obj))
+            entry.event = outbox_event_cls.create_event(
+                session=session,
+                event_type=f"{obj.__tablename__}_created",
+                aggregate_type=obj.__tablename__,
+                aggregate_id=str(getattr(obj, 'id')),
+                payload={}
+            )
+            entry.write_payload()
+
+def _outbox_enabled(obj):
+    return getattr(obj, '__outbox_enabled__', False)
+
+def _column_keys(obj):
+    return [attr.key for attr in sa_inspect(obj).mapper.column_attrs]
+
+def _changed_columns(obj):
+    """Current values of the columns changed since the last flush"""
+    state = sa_inspect(obj)
+    return {
+        key: getattr(obj, key) for key in _column_keys(obj)
+        if state.attrs[key].history.has_changes()
+    }
+
+def _loaded_columns(obj):
+    """Non-null column values already loaded, without triggering refreshes"""
+    loaded = sa_inspect(obj).dict
+    return {key: loaded[key] for key in _column_keys(obj) if loaded.get(key) is not None}
+
+def _snapshot(obj):
+    """
+    Columns a model opts into sending with every event via
+    ``__outbox_snapshot__``: True for the whole object, or a tuple of
+    column names consumers need for routing.
+    """
+    snapshot = getattr(obj, '__outbox_snapshot__', False)
+    if snapshot is True:
+        return obj.to_dict() if hasattr(obj, 'to_dict') else {
+            key: getattr(obj, key) for key in _column_keys(obj)
+        }
+    return {key: getattr(obj, key) for key in snapshot or ()}
+
+def _discard(session, obj):
+    if obj in session.new:
+        session.expunge(obj)
+    else:
+        session.delete(obj)
+
+class _CapturedChange:
+    """Change to one object in the current transaction and its outbox event"""
+
+    def __init__(self, obj, kind, changes):
+        self.obj = obj
+        self.kind = kind
+        self.changes = changes
+        self.event = None
+
+    def write_payload(self):
+        snapshot = _snapshot(self.obj)
+        if self.kind == 'created':
+            payload = dict(self.changes, **snapshot) if snapshot else self.changes
+        else:
+            payload = {'id': getattr(self.obj, 'id'), 'changes': self.changes}
+            if snapshot:
+                payload['full_object'] = snapshot
+        self.event.payload = json.dumps(payload, default=str)
 
 class OutboxMixin:
-    """Mixin to enable outbox pattern on a model"""
+    """
+    Mixin to enable outbox pattern on a model
+
+    Events carry only the columns that changed. Set ``__outbox_snapshot__``
+    to True to also send the whole object, or to a tuple of column names
+    that every event should include.
+    """
     __outbox_enabled__ = True
+    __outbox_snapshot__ = False
+
+class ProcessedEvent:
+    """
+    Base class for the table recording which events a consumer has handled
+
+    One row per (consumer, event_id); inserting the row in the same
+    transaction as the handler's writes makes redelivered events no-ops.
+    """
+
+    @declared_attr
+    def __tablename__(cls):
+        return "processed_events"
+
+    consumer = Column(String(100), primary_key=True)
+    event_id = Column(String(36), primary_key=True)
+    processed_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class OutboxArchive:
+    """
+    Base class for the table ``OutboxRetention`` moves completed events to
+
+    One table for all periods, created by the service's migrations like
+    any other table; ``period`` (YYYYMM of processing) lets old periods be
+    exported or deleted with one indexed statement.
+    """
+
+    @declared_attr
+    def __tablename__(cls):
+        return "outbox_events_archive"
+
+    @declared_attr
+    def __table_args__(cls):
+        # Replay reads the archive in (created_at, id) order
+        return (Index(f"ix_{cls.__tablename__}_created_at_id", 'created_at', 'id'),)
+
+    id = Column(String(36), primary_key=True)
+    period = Column(String(6), nullable=False, index=True)
+    event_type = Column(String(100), nullable=False)
+    aggregate_type = Column(String(100), nullable=False)
+    aggregate_id = Column(String(36), nullable=False)
+    payload = Column(String, nullable=False)
+    status = Column(String(20))
+    created_at = Column(DateTime)
+    processed_at = Column(DateTime, nullable=True)
+    error = Column(String, nullable=True)
+    retry_count = Column(Integer, default=0)
+    headers = Column(String, nullable=True)
+
+def mark_event_processed(session, processed_model, consumer, event_id):
+    """
+    Record that ``consumer`` handled ``event_id`` in the current transaction
+
+    Returns:
+        False if the event was already recorded as processed
+    """
+    table = processed_model.__table__
+    values = {'consumer': consumer, 'event_id': event_id,
+              'processed_at': datetime.datetime.utcnow()}
+    dialect = session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        stmt = dialect_insert(table).values(**values).on_conflict_do_nothing()
+        return session.execute(stmt).rowcount == 1
+    exists = session.execute(
+        select(literal(1)).where(table.c.consumer == consumer, table.c.event_id == event_id)
+    ).first()
+    if exists:
+        return False
+    session.execute(insert(table).values(**values))
+    return True
+
+def emit_events(session, outbox_model, events, chunk_size=1000,
+                notify_channel=OUTBOX_NOTIFY_CHANNEL):
+    """
+    Insert many outbox events with multi-row INSERTs instead of one ORM
+    object per event
+
+    Args:
+        session: SQLAlchemy session
+        outbox_model: OutboxEvent model class
+        events: Iterable of dicts with event_type, aggregate_type,
+            aggregate_id and payload (serialized to JSON); may be a generator
+        chunk_size: Rows per INSERT
+        notify_channel: Postgres channel to NOTIFY on commit
+
+    Returns:
+        Number of events inserted
+    """
+    table = outbox_model.__table__
+    count = 0
+    chunk = []
+    headers = json.dumps(capture_event_headers())
+
+    def flush_chunk():
+        # executemany; column defaults (id, status, timestamps) are applied per row
+        session.execute(insert(table), chunk)
+        chunk.clear()
+
+    for spec in events:
+        chunk.append({
+            'event_type': spec['event_type'],
+            'aggregate_type': spec['aggregate_type'],
+            'aggregate_id': str(spec['aggregate_id']),
+            'payload': json.dumps(spec['payload'], default=str),
+            'headers': headers,
+        })
+        count += 1
+        if len(chunk) >= chunk_size:
+            flush_chunk()
+    if chunk:
+        flush_chunk()
+    if count:
+        _signal_outbox_write(session, notify_channel)
+    return count
+
+def bulk_event_handler(db, outbox_model, processed_model=None, consumer=None, chunk_size=1000):
+    """
+    Decorator for set-based event handlers
+
+    The decorated function receives ``(event, payload)`` and returns (or
+    yields) the outbox events to emit as dicts for ``emit_events``. The
+    wrapper runs it in one transaction, inserts the emitted events in bulk
+    and, when ``processed_model`` is given, skips events ``consumer`` has
+    already handled. The wrapper can be called with the event alone or
+    registered on an OutboxProcessor, which passes
+    ``(aggregate_id, payload, event)``.
+
+    Args:
+        db: Flask-SQLAlchemy instance
+        outbox_model: OutboxEvent model events are emitted to
+        processed_model: ProcessedEvent model used for idempotency
+        consumer: Name recorded in processed_model (defaults to the
+            function's qualified name)
+        chunk_size: Rows per INSERT
+    """
+    def decorator(func):
+        name = consumer or f"{func.__module__}.{func.__qualname__}"
+
+        @wraps(func)
+        def wrapper(*args):
+            event = args[-1]
+            try:
+                payload = json.loads(event.payload)
+                if (processed_model is not None and event.id is not None
+                        and not mark_event_processed(db.session, processed_model, name, event.id)):
+                    logger.info(f"Event {event.id} already processed by {name}, skipping")
+                    db.session.rollback()
+                    return 0
+                handling = nullcontext()
+                if _handling_headers.get() is None:
+                    # Called directly rather than by an OutboxProcessor
+                    handling = handling_event(event.event_type,
+                                              parse_event_headers(getattr(event, 'headers', None)), name)
+                with handling:
+                    count = emit_events(db.session, outbox_model, func(event, payload) or (),
+                                        chunk_size=chunk_size)
+                db.session.commit()
+                logger.info(f"{name} emitted {count} events for {event.event_type}")
+                return count
+            except Exception as e:
+                logger.error(f"Error handling {event.event_type} in {name}: {str(e)}")
+                db.session.rollback()
+                raise
+        return wrapper
+    return decorator
+
+class OutboxListener:
+    """
+    Blocks until outbox events are committed
+
+    On PostgreSQL this LISTENs on ``channel`` over a dedicated connection
+    and wakes as soon as a NOTIFY from ``configure_outbox_hooks`` arrives.
+    On other databases it falls back to in-process commit signals plus
+    polling.
+    """
+
+    def __init__(self, engine=None, channel=OUTBOX_NOTIFY_CHANNEL):
+        self.engine = engine
+        self.channel = channel
+        self._conn = None
+
+    @property
+    def push_enabled(self):
+        return self.engine is not None and self.engine.dialect.name == 'postgresql'
+
+    def _connect(self):
+        conn = self.engine.raw_connection()
+        dbapi_conn = conn.driver_connection
+        dbapi_conn.autocommit = True
+        cursor = dbapi_conn.cursor()
+        cursor.execute(f'LISTEN "{self.channel}"')
+        cursor.close()
+        self._conn = conn
+        return dbapi_conn
+
+    def wait(self, timeout, stop_event=None):
+        """
+        Wait up to ``timeout`` seconds for a notification
+
+        Returns:
+            True if woken by a notification, False on timeout
+        """
+        if not self.push_enabled:
+            woken = _local_wakeup.wait(timeout)
+            _local_wakeup.clear()
+            return woken
+
+        deadline = time.monotonic() + timeout
+        try:
+            dbapi_conn = self._conn.driver_connection if self._conn else self._connect()
+            while True:
+                if dbapi_conn.notifies:
+                    dbapi_conn.notifies.clear()
+                    return True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or (stop_event is not None and stop_event.is_set()):
+                    return False
+                # Short slices so stop() is honoured promptly
+                readable, _, _ = select_module.select([dbapi_conn], [], [], min(remaining, 1.0))
+                if readable:
+                    dbapi_conn.poll()
+        except Exception as e:
+            logger.warning(f"Outbox listener error, falling back to polling: {str(e)}")
+            self.close()
+            if stop_event is not None:
+                stop_event.wait(max(0, deadline - time.monotonic()))
+            return False
+
+    def close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
 
 # Outbox processor for background processing of events
 class OutboxProcessor:
-    """Process outbox events in background"""
+    """
+    Process outbox events in background
+
+    Events are claimed in batches with ``SELECT ... FOR UPDATE SKIP LOCKED``
+    and leased to this processor, so several processors (threads, processes
+    or replicas) can drain the same table without double delivery. A claimed
+    batch is partitioned by ``aggregate_id`` across a pool of workers: events
+    of one aggregate are handled in order by a single worker while different
+    aggregates run in parallel.
+    """
     
-    def __init__(self, db, outbox_model, handlers=None, max_retries=3):
+    def __init__(self, db, outbox_model, handlers=None, max_retries=3,
+                 workers=1, lease_seconds=60, worker_id=None,
+                 on_complete='update', archive_model=None,
+                 retry_backoff_base=5, retry_backoff_max=600,
+                 stages=None):
         """
         Initialize outbox processor
         
         Args:
             db: SQLAlchemy DB instance
             outbox_model: OutboxEvent model class
-            handlers: Dict mapping event_type to handler functions
+            handlers: Dict mapping event_type to handler functions; their
+                session writes are committed once the handler returns
             max_retries: Maximum retry attempts for failed events
+            workers: Number of concurrent worker threads
+            lease_seconds: How long a claimed event stays invisible to
+                other processors before it is considered abandoned; the
+                lease is renewed every third of it while a batch runs
+            worker_id: Identifier recorded on claimed events
+            on_complete: What to do with processed events: 'update' marks
+                them completed, 'delete' removes them and 'move' copies
+                them into ``archive_model`` before removing them
+            archive_model: Model with the outbox columns, for 'move'
+            retry_backoff_base: Delay in seconds before the first retry;
+                doubled on each further attempt
+            retry_backoff_max: Upper bound in seconds for the retry delay
+            stages: Callables with the handler signature run for every
+                event after its handler (e.g. a relay publishing every
+                event); an event fails if any of them raises
         """
+        if on_complete not in ('update', 'delete', 'move'):
+            raise ValueError(f"Unknown on_complete action: {on_complete}")
+        if on_complete == 'move' and archive_model is None:
+            raise ValueError("on_complete='move' requires an archive_model")
         self.db = db
         self.outbox_model = outbox_model
         self.handlers = handlers or {}
         self.max_retries = max_retries
+        self.workers = max(1, workers)
+        self.lease_seconds = lease_seconds
+        self.worker_id = worker_id or f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+        self.on_complete = on_complete
+        self.archive_model = archive_model
+        self.retry_backoff_base = retry_backoff_base
+        self.retry_backoff_max = retry_backoff_max
+        self.stages = list(stages or [])
+        self._executor = None
+        self._thread = None
+        self._stop = threading.Event()
         
-    def register_handler(self, event_type, handler):
-        """Register a handler for an event type"""
+    def register_handler(self, event_type, handler=None):
+        """
+        Register a handler for an event type
+
+        Can also be used as a decorator: ``@processor.register_handler('x')``
+        """
+        if handler is None:
+            def decorator(func):
+                self.handlers[event_type] = func
+                return func
+            return decorator
         self.handlers[event_type] = handler
-        
+        return handler
+
+    def add_stage(self, stage):
+        """
+        Run ``stage(aggregate_id, payload, event)`` for every event
+
+        Stages run after the event's handler, in the order they were added,
+        on the same claimed batch, so adding one does not need another
+        processor competing for the outbox table.
+        """
+        self.stages.append(stage)
+        return stage
+
+    @property
+    def outbox_model(self):
+        return self._outbox_model
+
+    @outbox_model.setter
+    def outbox_model(self, model):
+        # Also checked when the model is found after construction
+        self._outbox_model = check_outbox_model(model) if model is not None else None
+
+    def _claimable_filter(self, now):
+        """
+        Events that may be claimed now
+
+        An event is held back while an earlier event of its aggregate is
+        still unfinished and not claimable itself (leased to a worker or
+        waiting out a retry delay), so a failure delays the rest of its
+        aggregate instead of letting it overtake. Dead-lettered events no
+        longer hold their aggregate back.
+        """
+        model = self.outbox_model
+        earlier = aliased(model)
+        blocked_by = select(earlier.id).where(
+            earlier.aggregate_type == model.aggregate_type,
+            earlier.aggregate_id == model.aggregate_id,
+            or_(earlier.created_at < model.created_at,
+                and_(earlier.created_at == model.created_at, earlier.id < model.id)),
+            self._unfinished(earlier),
+            ~self._due(earlier, now),
+        )
+        return and_(self._due(model, now), ~blocked_by.exists())
+
+    def _unfinished(self, model):
+        return model.status.in_([EventStatus.PENDING.value, EventStatus.PROCESSING.value,
+                                 EventStatus.FAILED.value])
+
+    def _due(self, model, now):
+        # Exhausted events are dead-lettered, so FAILED means "retry later"
+        return or_(
+            and_(model.status.in_([EventStatus.PENDING.value, EventStatus.FAILED.value]),
+                 model.next_attempt_at <= now),
+            and_(model.status == EventStatus.PROCESSING.value, model.locked_until < now),
+        )
+
+    def retry_delay(self, retry_count):
+        """Backoff in seconds before attempt ``retry_count + 1``, with jitter"""
+        delay = min(self.retry_backoff_max, self.retry_backoff_base * (2 ** max(0, retry_count - 1)))
+        # Spread retries of events that failed together
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _failure_values(self, event, error, now):
+        retry_count = (event.retry_count or 0) + 1
+        values = {'_id': event.id, '_error': error, '_retry_count': retry_count,
+                  '_status': EventStatus.FAILED.value}
+        if retry_count >= self.max_retries:
+            values['_status'] = EventStatus.DEAD_LETTER.value
+            values['_next_attempt_at'] = None
+            logger.error(f"Outbox event {event.id} dead-lettered after {retry_count} attempts")
+        else:
+            values['_next_attempt_at'] = now + datetime.timedelta(seconds=self.retry_delay(retry_count))
+        return values
+
+    def dead_letters(self, event_type=None, limit=100):
+        """List dead-lettered events, oldest first"""
+        query = self.outbox_model.query.filter_by(status=EventStatus.DEAD_LETTER.value)
+        if event_type:
+            query = query.filter_by(event_type=event_type)
+        return query.order_by(self.outbox_model.created_at).limit(limit).all()
+
+    def replay_dead_letters(self, event_ids=None, event_type=None):
+        """
+        Put dead-lettered events back in the queue with a fresh retry budget
+
+        Args:
+            event_ids: Only replay these events
+            event_type: Only replay events of this type
+
+        Returns:
+            Number of events requeued
+        """
+        table = self.outbox_model.__table__
+        stmt = update(table).where(table.c.status == EventStatus.DEAD_LETTER.value)
+        if event_ids is not None:
+            stmt = stmt.where(table.c.id.in_(list(event_ids)))
+        if event_type:
+            stmt = stmt.where(table.c.event_type == event_type)
+        values = {'status': EventStatus.PENDING.value, 'retry_count': 0, 'error': None,
+                  'next_attempt_at': datetime.datetime.utcnow()}
+        session = self.db.session
+        try:
+            count = session.execute(stmt.values(**values)).rowcount
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        logger.info(f"Replaying {count} dead-lettered outbox events")
+        return count
+
+    def claim_batch(self, limit=100):
+        """
+        Claim up to ``limit`` due events for this processor
+
+        Claiming is a single ``UPDATE ... WHERE id IN (SELECT ... FOR UPDATE
+        SKIP LOCKED) RETURNING`` statement: rows locked by another
+        processor's claim are skipped rather than waited on. Claimed events
+        are returned as instances that are not attached to any session.
+
+        Returns:
+            List of claimed OutboxEvent instances, oldest first
+        """
+        model = self.outbox_model
+        session = self.db.session
+        now = datetime.datetime.utcnow()
+        values = {
+            'status': EventStatus.PROCESSING.value,
+            'locked_by': self.worker_id,
+            'locked_until': now + datetime.timedelta(seconds=self.lease_seconds),
+        }
+
+        due = select(model.id).where(
+            self._claimable_filter(now)
+        ).order_by(
+            model.created_at
+        ).limit(limit).with_for_update(skip_locked=True)
+        columns = model.__table__.columns
+        try:
+            rows = session.execute(
+                update(model.__table__).where(
+                    model.__table__.c.id.in_(due.scalar_subquery())
+                ).values(**values).returning(*columns)
+            ).all()
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+
+        events = [model(**{c.key: row._mapping[c] for c in columns}) for row in rows]
+        # RETURNING does not preserve the subquery's ordering
+        events.sort(key=lambda e: (e.created_at or now, e.id))
+        return events
+
+    def _partition(self, events):
+        """Split events into per-worker lists keyed by aggregate, keeping order"""
+        partitions = [[] for _ in range(self.workers)]
+        for event in events:
+            key = f"{event.aggregate_type}:{event.aggregate_id}"
+            partitions[zlib.crc32(key.encode('utf-8')) % self.workers].append(event)
+        return [p for p in partitions if p]
+
+    def _process_partition(self, app, events):
+        """
+        Run handlers for one partition sequentially
+
+        Returns:
+            (completed_ids, failures, released_ids) where failures is a list
+            of (event, error message)
+        """
+        completed, failures, released = [], [], []
+        blocked = set()
+        with app.app_context():
+            for event in events:
+                aggregate = (event.aggregate_type, event.aggregate_id)
+                if aggregate in blocked:
+                    # An earlier event of this aggregate failed; hand the
+                    # rest back so they are not applied out of order.
+                    released.append(event.id)
+                    continue
+                try:
+                    self._process_event(event)
+                    # Handlers write through the worker's own session
+                    self.db.session.commit()
+                    completed.append(event.id)
+                except Exception as e:
+                    self.db.session.rollback()
+                    logger.error(f"Error processing outbox event {event.id}: {str(e)}")
+                    blocked.add(aggregate)
+                    failures.append((event, str(e)))
+        return completed, failures, released
+
+    def _complete(self, session, event_ids, now):
+        """Apply the configured completion action to processed events"""
+        table = self.outbox_model.__table__
+        if self.on_complete == 'update':
+            values = {'status': EventStatus.COMPLETED.value, 'processed_at': now,
+                      'locked_by': None, 'locked_until': None}
+            session.execute(update(table).where(table.c.id.in_(event_ids)).values(**values))
+            return
+        if self.on_complete == 'move':
+            archive = self.archive_model.__table__
+            names = [c.name for c in archive.columns if c.name in table.c]
+            source = select(*[
+                literal(EventStatus.COMPLETED.value).label('status') if n == 'status'
+                else literal(now).label('processed_at') if n == 'processed_at'
+                else table.c[n]
+                for n in names
+            ]).where(table.c.id.in_(event_ids))
+            session.execute(insert(archive).from_select(names, source))
+        session.execute(delete(table).where(table.c.id.in_(event_ids)))
+
+    def renew_leases(self, event_ids):
+        """
+        Extend this processor's lease on ``event_ids``
+
+        Returns:
+            Number of events still leased to this processor
+        """
+        table = self.outbox_model.__table__
+        session = self.db.session
+        try:
+            count = session.execute(update(table).where(
+                table.c.id.in_(event_ids),
+                table.c.locked_by == self.worker_id,
+                table.c.status == EventStatus.PROCESSING.value,
+            ).values(
+                locked_until=datetime.datetime.utcnow() + datetime.timedelta(seconds=self.lease_seconds)
+            )).rowcount
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        return count
+
+    @contextmanager
+    def _renewing_leases(self, app, event_ids):
+        """Keep the batch leased while its handlers run, however long they take"""
+        done = threading.Event()
+        interval = self.lease_seconds / 3.0
+
+        def renew():
+            with app.app_context():
+                while not done.wait(interval):
+                    try:
+                        self.renew_leases(event_ids)
+                    except Exception as e:
+                        logger.warning(f"Could not renew outbox leases: {str(e)}")
+
+        thread = threading.Thread(target=renew, name='outbox-lease-renewal', daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            done.set()
+            thread.join()
+
+    def _write_back(self, completed, failures, released):
+        """Record the outcome of a batch in a single transaction"""
+        table = self.outbox_model.__table__
+        session = self.db.session
+        now = datetime.datetime.utcnow()
+        lease = {'locked_by': None, 'locked_until': None}
+        try:
+            if completed:
+                self._complete(session, completed, now)
+            if failures:
+                # One executemany: status, error and schedule differ per row
+                values = dict(
+                    status=bindparam('_status'),
+                    error=bindparam('_error'),
+                    retry_count=bindparam('_retry_count'),
+                    next_attempt_at=bindparam('_next_attempt_at'),
+                    **lease
+                )
+                session.execute(
+                    update(table).where(table.c.id == bindparam('_id')).values(**values),
+                    [self._failure_values(event, error, now) for event, error in failures]
+                )
+            if released:
+                session.execute(update(table).where(table.c.id.in_(released)).values(
+                    status=EventStatus.PENDING.value, **lease
+                ))
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+
     def process_pending_events(self, limit=100):
         """
         Process pending outbox events
@@ -187,65 +1041,28 @@ class OutboxProcessor:
         Returns:
             Number of successfully processed events
         """
-        processed_count = 0
-        
-        # Get pending events
-        events = self.outbox_model.query.filter_by(
-            status=EventStatus.PENDING.value
-        ).order_by(
-            self.outbox_model.created_at
-        ).limit(limit).all()
-        
-        for event in events:
-            try:
-                # Mark as processing
-                event.mark_as_processing(self.db.session)
-                self.db.session.commit()
-                
-                # Process the event
-                self._process_event(event)
-                
-                # Mark as completed
-                event.mark_as_completed(self.db.session)
-                self.db.session.commit()
-                processed_count += 1
-                
-            except Exception as e:
-                self.db.session.rollback()
-                logger.error(f"Error processing outbox event {event.id}: {str(e)}")
-                
-                event.mark_as_failed(self.db.session, str(e))
-                self.db.session.commit()
-        
-        # Also retry failed events with retry_count < max_retries
-        failed_events = self.outbox_model.query.filter_by(
-            status=EventStatus.FAILED.value
-        ).filter(
-            self.outbox_model.retry_count < self.max_retries
-        ).limit(limit).all()
-        
-        for event in failed_events:
-            try:
-                # Mark as processing again
-                event.mark_as_processing(self.db.session)
-                self.db.session.commit()
-                
-                # Process the event
-                self._process_event(event)
-                
-                # Mark as completed
-                event.mark_as_completed(self.db.session)
-                self.db.session.commit()
-                processed_count += 1
-                
-            except Exception as e:
-                self.db.session.rollback()
-                logger.error(f"Error retrying outbox event {event.id}: {str(e)}")
-                
-                event.mark_as_failed(self.db.session, str(e))
-                self.db.session.commit()
-        
-        return processed_count
+        events = self.claim_batch(limit)
+        if not events:
+            return 0
+
+        app = current_app._get_current_object()
+        partitions = self._partition(events)
+        with self._renewing_leases(app, [e.id for e in events]):
+            if len(partitions) == 1:
+                results = [self._process_partition(app, partitions[0])]
+            else:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.workers, thread_name_prefix='outbox-worker'
+                    )
+                futures = [self._executor.submit(self._process_partition, app, p) for p in partitions]
+                results = [f.result() for f in futures]
+
+        completed = [i for r in results for i in r[0]]
+        failures = [f for r in results for f in r[1]]
+        released = [i for r in results for i in r[2]]
+        self._write_back(completed, failures, released)
+        return len(completed)
     
     def _process_event(self, event):
         """
@@ -255,15 +1072,291 @@ class OutboxProcessor:
             event: OutboxEvent instance to process
             
         Raises:
-            ValueError: If no handler is registered for the event type
+            ValueError: If no handler is registered for the event type and
+                there are no stages
         """
         # Get handler for this event type
         handler = self.handlers.get(event.event_type)
-        if not handler:
+        if not handler and not self.stages:
             raise ValueError(f"No handler registered for event type: {event.event_type}")
         
         # Parse payload
         payload = json.loads(event.payload)
         
         # Call handler
-        handler(event.aggregate_id, payload, event)
+        created_at = event.created_at
+        enqueued_at = created_at.replace(tzinfo=datetime.timezone.utc).timestamp() if created_at else None
+        with handling_event(event.event_type, parse_event_headers(event.headers), 'outbox', enqueued_at):
+            if handler:
+                handler(event.aggregate_id, payload, event)
+            for stage in self.stages:
+                stage(event.aggregate_id, payload, event)
+
+    def run(self, app, batch_size=100, interval=5, listener=None):
+        """
+        Process events until ``stop()`` is called
+
+        Between batches the processor sleeps on ``listener`` so it wakes as
+        soon as new events are committed; ``interval`` is the fallback poll.
+        """
+        listener = listener or OutboxListener()
+        with app.app_context():
+            try:
+                while not self._stop.is_set():
+                    try:
+                        processed = self.process_pending_events(limit=batch_size)
+                        if processed:
+                            logger.info(f"Processed {processed} outbox events")
+                            # More events may be waiting; claim again right away
+                            if processed >= batch_size:
+                                continue
+                    except Exception as e:
+                        logger.error(f"Error in outbox processor: {str(e)}")
+                    listener.wait(interval, self._stop)
+            finally:
+                listener.close()
+
+    def start(self, app, batch_size=100, interval=5, listener=None):
+        """Run the processor in a background daemon thread"""
+        if self._thread is not None and self._thread.is_alive():
+            return self._thread
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self.run, args=(app, batch_size, interval, listener),
+            name='outbox-processor', daemon=True
+        )
+        self._thread.start()
+        return self._thread
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        # Wake a processor sleeping on in-process commit signals
+        _local_wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+class OutboxRetention:
+    """
+    Moves completed outbox events out of the hot table
+
+    Completed events older than ``retention_days`` are copied to the
+    archive table (an ``OutboxArchive`` model, tagged with the YYYYMM
+    period they were processed in), appended to daily gzipped NDJSON files,
+    or just deleted, in chunks of ``chunk_size`` rows with one transaction
+    per chunk so the table is never locked for long.
+    """
+
+    def __init__(self, db, outbox_model, retention_days=7, mode='table',
+                 archive_dir=None, chunk_size=1000, archive_model=None):
+        """
+        Initialize the retention job
+
+        Args:
+            db: SQLAlchemy database instance
+            outbox_model: OutboxEvent model class
+            retention_days: Age in days after which completed events are archived
+            mode: 'table', 'ndjson' or 'delete'
+            archive_dir: Directory for NDJSON archives (mode 'ndjson')
+            chunk_size: Rows moved per transaction
+            archive_model: OutboxArchive model class (mode 'table')
+        """
+        if mode not in ('table', 'ndjson', 'delete'):
+            raise ValueError(f"Unknown outbox archive mode: {mode}")
+        if mode == 'ndjson' and not archive_dir:
+            raise ValueError("archive_dir is required for NDJSON archiving")
+        if mode == 'table' and archive_model is None:
+            raise ValueError("archive_model is required for table archiving")
+        self.db = db
+        self.outbox_model = outbox_model
+        self.retention_days = retention_days
+        self.mode = mode
+        self.archive_dir = archive_dir
+        self.chunk_size = chunk_size
+        self.archive_model = archive_model
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _write_ndjson(self, rows):
+        table = self.outbox_model.__table__
+        by_day = {}
+        for row in rows:
+            by_day.setdefault(row['_archived_at'].strftime('%Y-%m-%d'), []).append(row)
+        os.makedirs(self.archive_dir, exist_ok=True)
+        for day, day_rows in by_day.items():
+            path = os.path.join(self.archive_dir, f"{table.name}-{day}.ndjson.gz")
+            # Appending adds a gzip member; readers see one continuous stream
+            with gzip.open(path, 'at', encoding='utf-8') as fh:
+                for row in day_rows:
+                    record = {k: v for k, v in row.items() if k != '_archived_at'}
+                    fh.write(json.dumps(record, default=str) + '\n')
+
+    def archive_chunk(self, cutoff):
+        """
+        Archive one chunk of completed events processed before ``cutoff``
+
+        Returns:
+            Number of events removed from the outbox table
+        """
+        table = self.outbox_model.__table__
+        session = self.db.session
+        archived_at = func.coalesce(table.c.processed_at, table.c.created_at)
+        try:
+            rows = session.execute(
+                select(table, archived_at.label('_archived_at'))
+                .where(table.c.status == EventStatus.COMPLETED.value, archived_at < cutoff)
+                .order_by(archived_at)
+                .limit(self.chunk_size)
+            ).mappings().all()
+            if not rows:
+                session.rollback()
+                return 0
+            if self.mode == 'table':
+                archive = self.archive_model.__table__
+                names = [c.name for c in table.columns if c.name in archive.c]
+                session.execute(insert(archive), [
+                    dict({n: row[n] for n in names}, period=row['_archived_at'].strftime('%Y%m'))
+                    for row in rows
+                ])
+            elif self.mode == 'ndjson':
+                # Written before the delete commits: a crash here can only
+                # duplicate archived rows, never lose them
+                self._write_ndjson(rows)
+            session.execute(delete(table).where(table.c.id.in_([row['id'] for row in rows])))
+            session.commit()
+            return len(rows)
+        except Exception:
+            session.rollback()
+            raise
+
+    def run_once(self):
+        """Archive everything past the retention period; returns events archived"""
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=self.retention_days)
+        total = 0
+        while not self._stop.is_set():
+            count = self.archive_chunk(cutoff)
+            total += count
+            if count < self.chunk_size:
+                break
+        if total:
+            logger.info(f"Archived {total} completed outbox events older than {cutoff} ({self.mode})")
+        return total
+
+    def start(self, app, interval=3600):
+        """Run the retention job every ``interval`` seconds in a daemon thread"""
+        if self._thread is not None and self._thread.is_alive():
+            return self._thread
+        self._stop.clear()
+
+        def target():
+            with app.app_context():
+                while True:
+                    try:
+                        self.run_once()
+                    except Exception as e:
+                        logger.error(f"Error archiving outbox events: {str(e)}")
+                    if self._stop.wait(interval):
+                        break
+
+        self._thread = threading.Thread(target=target, name='outbox-retention', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+def _find_outbox_model(db, name='OutboxEvent'):
+    """Find the service's mapped OutboxEvent (or other outbox) class"""
+    for mapper in db.Model.registry.mappers:
+        if mapper.class_.__name__ == name:
+            return mapper.class_
+    return None
+
+def init_outbox_processor(app, db, outbox_model=None, handlers=None):
+    """
+    Create the app's OutboxProcessor from configuration
+
+    Configuration:
+        OUTBOX_WORKERS: Concurrent worker threads (default 4)
+        OUTBOX_BATCH_SIZE: Events claimed per batch (default 100)
+        OUTBOX_LEASE_SECONDS: Lease length for claimed events (default 60)
+        OUTBOX_MAX_RETRIES: Attempts before an event is dead-lettered (default 3)
+        OUTBOX_RETRY_BACKOFF_BASE: First retry delay in seconds (default 5)
+        OUTBOX_RETRY_BACKOFF_MAX: Maximum retry delay in seconds (default 600)
+        OUTBOX_ON_COMPLETE: 'update' (default) or 'delete' processed events
+        OUTBOX_PROCESSING_INTERVAL: Seconds between polls without push
+            notifications (default 5)
+        OUTBOX_FALLBACK_POLL_INTERVAL: Safety poll with LISTEN/NOTIFY (default 60)
+        OUTBOX_NOTIFY_CHANNEL: Postgres channel (default 'outbox_events')
+        OUTBOX_RETENTION_DAYS: Archive completed events older than this
+            (default 7; None disables retention)
+        OUTBOX_ARCHIVE: 'table' (default; needs an ``OutboxArchive``
+            model), 'ndjson' or 'delete'
+        OUTBOX_ARCHIVE_DIR: Directory for NDJSON archives
+        OUTBOX_RETENTION_INTERVAL: Seconds between retention runs (default 3600)
+        OUTBOX_AUTOSTART: Start the background threads on first request
+
+    Returns:
+        OutboxProcessor, also stored in ``app.extensions['outbox_processor']``
+    """
+    # Raises right away if the service's model lacks the processor's columns
+    processor = OutboxProcessor(
+        db,
+        outbox_model or _find_outbox_model(db),
+        handlers=handlers,
+        max_retries=app.config.get('OUTBOX_MAX_RETRIES', 3),
+        workers=app.config.get('OUTBOX_WORKERS', 4),
+        lease_seconds=app.config.get('OUTBOX_LEASE_SECONDS', 60),
+        on_complete=app.config.get('OUTBOX_ON_COMPLETE', 'update'),
+        retry_backoff_base=app.config.get('OUTBOX_RETRY_BACKOFF_BASE', 5),
+        retry_backoff_max=app.config.get('OUTBOX_RETRY_BACKOFF_MAX', 600),
+    )
+    app.extensions['outbox_processor'] = processor
+
+    if app.config.get('OUTBOX_AUTOSTART', False):
+        started = threading.Event()
+
+        @app.before_request
+        def start_outbox_processor():
+            if started.is_set():
+                return
+            # Models are imported by now, so the outbox table is mapped
+            if processor.outbox_model is None:
+                processor.outbox_model = _find_outbox_model(db)
+            started.set()
+            if processor.outbox_model is None:
+                logger.warning("No OutboxEvent model found, outbox processor not started")
+                return
+            listener = OutboxListener(db.engine, app.config.get('OUTBOX_NOTIFY_CHANNEL', OUTBOX_NOTIFY_CHANNEL))
+            if listener.push_enabled:
+                # NOTIFY wakes the processor; polling is only a safety net
+                interval = app.config.get('OUTBOX_FALLBACK_POLL_INTERVAL', 60)
+            else:
+                interval = app.config.get('OUTBOX_PROCESSING_INTERVAL', 5)
+            processor.start(
+                app,
+                batch_size=app.config.get('OUTBOX_BATCH_SIZE', 100),
+                interval=interval,
+                listener=listener,
+            )
+            retention_days = app.config.get('OUTBOX_RETENTION_DAYS', 7)
+            mode = app.config.get('OUTBOX_ARCHIVE', 'table')
+            archive_model = _find_outbox_model(db, 'OutboxArchive')
+            if retention_days is not None and mode == 'table' and archive_model is None:
+                logger.warning("No OutboxArchive model found, outbox retention not started")
+            elif retention_days is not None:
+                retention = OutboxRetention(
+                    db,
+                    processor.outbox_model,
+                    retention_days=retention_days,
+                    mode=mode,
+                    archive_dir=app.config.get('OUTBOX_ARCHIVE_DIR'),
+                    archive_model=archive_model,
+                )
+                app.extensions['outbox_retention'] = retention
+                retention.start(app, interval=app.config.get('OUTBOX_RETENTION_INTERVAL', 3600))
+    return processor
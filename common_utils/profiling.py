@@ -0,0 +1,149 @@
+"""
+On-demand CPU and memory profiling endpoints.
+
+``/debug/profile?seconds=N`` samples the stacks of every thread for ``N``
+seconds with ``sys._current_frames`` and returns them collapsed, one
+``frame;frame;frame count`` line per distinct stack, ready for
+flamegraph.pl or speedscope. Nothing is instrumented, so the overhead is
+one stack walk per thread per interval, and only while profiling.
+
+``/debug/heap?seconds=N`` diffs two ``tracemalloc`` snapshots taken ``N``
+seconds apart and returns the allocation sites that grew the most.
+Tracing is started for the window only unless it was already running.
+"""
+import os
+import sys
+import time
+import threading
+import tracemalloc
+import logging
+from collections import Counter
+from flask import Blueprint, Response, jsonify, request, current_app
+
+logger = logging.getLogger(__name__)
+
+# Leaf frames in these modules mean the thread is waiting, not working
+_IDLE_MODULES = ('threading.py', 'selectors.py', 'socket.py', 'queue.py', 'socketserver.py', 'ssl.py')
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}"
+
+def sample_stacks(seconds, interval=0.005, include_idle=False):
+    """
+    Sample the stacks of all other threads
+
+    Args:
+        seconds: How long to sample
+        interval: Seconds between samples
+        include_idle: Keep stacks of threads blocked in waits and I/O
+
+    Returns:
+        Counter mapping collapsed stacks (root first, ``;`` separated,
+        prefixed with the thread name) to sample counts
+    """
+    stacks = Counter()
+    me = threading.get_ident()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            if not include_idle and os.path.basename(frame.f_code.co_filename) in _IDLE_MODULES:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            labels.append(names.get(ident, f"thread-{ident}"))
+            stacks[';'.join(reversed(labels))] += 1
+        time.sleep(interval)
+    return stacks
+
+def collapsed(stacks):
+    """Render sampled stacks in the collapsed format of flamegraph.pl"""
+    return ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+def heap_diff(seconds, limit=25, group_by='lineno', frames=10):
+    """
+    Allocation growth over ``seconds``
+
+    Returns:
+        List of dicts for the ``limit`` allocation sites that grew the most
+    """
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start(frames)
+    try:
+        before = tracemalloc.take_snapshot()
+        time.sleep(seconds)
+        after = tracemalloc.take_snapshot()
+    finally:
+        if started:
+            tracemalloc.stop()
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    stats = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), group_by)
+    return [{
+        'traceback': [str(frame) for frame in stat.traceback],
+        'size_kb': round(stat.size / 1024, 1),
+        'size_diff_kb': round(stat.size_diff / 1024, 1),
+        'count': stat.count,
+        'count_diff': stat.count_diff,
+    } for stat in stats[:limit]]
+
+def init_debug_endpoints(app, protect=None):
+    """
+    Register ``/debug/profile`` and ``/debug/heap``
+
+    Configuration:
+        DEBUG_ENDPOINTS_ENABLED: Register the endpoints (default: only
+            when ``protect`` is given)
+        DEBUG_PROFILE_MAX_SECONDS: Longest profile or heap window (default 60)
+
+    Args:
+        app: Flask application
+        protect: Decorator restricting access to the endpoints
+    """
+    if not app.config.get('DEBUG_ENDPOINTS_ENABLED', protect is not None):
+        return
+    bp = Blueprint('debug', __name__, url_prefix='/debug')
+    busy = threading.Lock()
+
+    def _seconds(default):
+        seconds = request.args.get('seconds', default, type=float)
+        return min(max(seconds, 0.1), current_app.config.get('DEBUG_PROFILE_MAX_SECONDS', 60))
+
+    def profile():
+        seconds = _seconds(10)
+        interval = request.args.get('interval_ms', 5, type=float) / 1000.0
+        include_idle = request.args.get('idle', '0') in ('1', 'true')
+        if not busy.acquire(blocking=False):
+            return jsonify({'error': 'A profile is already running'}), 409
+        try:
+            logger.info(f"Profiling all threads for {seconds}s")
+            stacks = sample_stacks(seconds, max(interval, 0.001), include_idle)
+        finally:
+            busy.release()
+        if request.args.get('format') == 'json':
+            return jsonify({'seconds': seconds, 'samples': sum(stacks.values()),
+                            'stacks': dict(stacks.most_common())})
+        return Response(collapsed(stacks), mimetype='text/plain')
+
+    def heap():
+        seconds = _seconds(10)
+        group_by = request.args.get('group_by', 'lineno')
+        if group_by not in ('lineno', 'filename', 'traceback'):
+            return jsonify({'error': 'group_by must be lineno, filename or traceback'}), 400
+        if not busy.acquire(blocking=False):
+            return jsonify({'error': 'A profile is already running'}), 409
+        try:
+            logger.info(f"Tracing allocations for {seconds}s")
+            top = heap_diff(seconds, request.args.get('limit', 25, type=int), group_by)
+        finally:
+            busy.release()
+        return jsonify({'seconds': seconds, 'group_by': group_by, 'top': top})
+
+    bp.add_url_rule('/profile', 'profile', protect(profile) if protect else profile)
+    bp.add_url_rule('/heap', 'heap', protect(heap) if protect else heap)
+    app.register_blueprint(bp)
@@ -0,0 +1,190 @@
+"""
+Per-request SQL query budgets and N+1 detection.
+
+Every statement executed while a request (or a ``track_queries`` block) is
+active is counted and grouped by its normalized shape, i.e. the SQL with
+literals and bound values replaced by ``?``. A shape repeated many times in
+one request is the signature of an N+1: a query per row of a list.
+
+Routes declare how many statements they may issue::
+
+    @bp.route('/components')
+    @query_budget(3)
+    def list_components():
+        ...
+
+Exceeding the budget, or repeating a shape ``QUERY_REPEAT_THRESHOLD``
+times, logs a warning in production and raises ``QueryBudgetExceeded`` when
+``QUERY_BUDGET_RAISE`` is set (the default under ``TESTING``), so N+1
+regressions fail CI.
+"""
+import re
+import logging
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import g, request, current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+try:
+    from prometheus_client import Counter as PromCounter, Histogram
+    REQUEST_QUERIES = Histogram(
+        'http_request_queries',
+        'SQL statements issued per request',
+        ['route'], buckets=(1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+    )
+    REQUEST_QUERY_VIOLATIONS = PromCounter(
+        'http_request_query_violations_total',
+        'Requests over their query budget or with repeated statements',
+        ['route', 'kind']
+    )
+except ImportError:
+    REQUEST_QUERIES = REQUEST_QUERY_VIOLATIONS = None
+
+_current = ContextVar('query_stats', default=None)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAM = re.compile(r"%\(\w+\)s|%s|:\w+|\$\d+|\?")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_SPACE = re.compile(r"\s+")
+
+def normalize_statement(statement):
+    """SQL with literals and parameters replaced by ``?`` and IN lists collapsed"""
+    sql = _STRING.sub('?', statement)
+    sql = _PARAM.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('(?)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+class QueryBudgetExceeded(Exception):
+    """Raised in test mode when a request issues too many statements"""
+    pass
+
+class QueryStats:
+    """
+    Statements issued within one request
+
+    Raw statements are counted as issued; they are only normalized into
+    shapes when reported, once per distinct statement.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.statements = Counter()
+
+    def record(self, statement):
+        self.count += 1
+        self.statements[statement] += 1
+
+    @property
+    def shapes(self):
+        """Counter of normalized statement shapes"""
+        shapes = Counter()
+        for statement, n in self.statements.items():
+            shapes[normalize_statement(statement)] += n
+        return shapes
+
+    def repeated(self, threshold):
+        """Shapes issued at least ``threshold`` times, most frequent first"""
+        if self.count < threshold:
+            return []
+        return [(shape, n) for shape, n in self.shapes.most_common() if n >= threshold]
+
+@contextmanager
+def track_queries():
+    """Count the statements issued in the block; yields the ``QueryStats``"""
+    _instrument_engines()
+    stats = QueryStats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+def query_budget(max_queries):
+    """Declare the maximum number of statements a view may issue"""
+    def decorator(func):
+        func._query_budget = max_queries
+        return func
+    return decorator
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    if stats is not None:
+        stats.record(statement)
+
+def _instrument_engines():
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+
+def check_query_budget(stats, route, budget, repeat_threshold):
+    """
+    Describe the ways ``stats`` violates the budget
+
+    Returns:
+        List of (kind, message) tuples; empty if within budget
+    """
+    violations = []
+    if budget is not None and stats.count > budget:
+        violations.append(('budget', f"{route} issued {stats.count} queries, budget is {budget}"))
+    for shape, n in stats.repeated(repeat_threshold):
+        violations.append(('repeated', f"{route} issued the same query {n} times (possible N+1): {shape[:300]}"))
+    return violations
+
+def init_query_budget(app):
+    """
+    Count queries per request and enforce route budgets
+
+    Configuration:
+        QUERY_BUDGET_ENABLED: Track queries per request (default True)
+        QUERY_BUDGET_DEFAULT: Budget of routes without ``query_budget``
+            (default None, i.e. unlimited)
+        QUERY_REPEAT_THRESHOLD: Repetitions of one statement shape reported
+            as a possible N+1 (default 10)
+        QUERY_BUDGET_RAISE: Raise ``QueryBudgetExceeded`` instead of
+            logging (default: ``TESTING``)
+    """
+    if not app.config.get('QUERY_BUDGET_ENABLED', True):
+        return
+    _instrument_engines()
+
+    @app.before_request
+    def start_query_tracking():
+        g._query_stats_token = _current.set(QueryStats())
+
+    @app.teardown_request
+    def stop_query_tracking(exc=None):
+        token = g.pop('_query_stats_token', None)
+        if token is not None:
+            _current.reset(token)
+
+    @app.after_request
+    def check_query_tracking(response):
+        token = g.pop('_query_stats_token', None)
+        if token is None:
+            return response
+        stats = _current.get()
+        _current.reset(token)
+
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        if REQUEST_QUERIES is not None:
+            REQUEST_QUERIES.labels(route=route).observe(stats.count)
+        view = current_app.view_functions.get(request.endpoint)
+        budget = getattr(view, '_query_budget', current_app.config.get('QUERY_BUDGET_DEFAULT'))
+        violations = check_query_budget(
+            stats, f"{request.method} {route}", budget,
+            current_app.config.get('QUERY_REPEAT_THRESHOLD', 10),
+        )
+        if not violations:
+            return response
+        for kind, message in violations:
+            if REQUEST_QUERY_VIOLATIONS is not None:
+                REQUEST_QUERY_VIOLATIONS.labels(route=route, kind=kind).inc()
+            logger.warning(message)
+        if current_app.config.get('QUERY_BUDGET_RAISE', current_app.testing):
+            raise QueryBudgetExceeded('; '.join(message for _, message in violations))
+        return response
@@ -0,0 +1,289 @@
+"""
+Replay of historical outbox events, e.g. to rebuild a read model or to
+backfill a new consumer.
+
+``OutboxReplay`` streams events from the NDJSON and table archives written
+by ``OutboxRetention`` and then from the live outbox table, runs them
+through the chosen outbox handlers on parallel workers partitioned by
+aggregate, checkpoints after every page so an interrupted replay resumes
+where it stopped, and throttles to a target rate.
+
+Handlers must be idempotent: a page interrupted half-way is replayed in
+full on resume.
+
+Usage::
+
+    python -m common_utils.replay --app strategy_service.main:app \\
+        --handlers my_service.projections:HANDLERS --name rebuild-capabilities --rate 500
+"""
+import os
+import re
+import gzip
+import json
+import time
+import zlib
+import argparse
+import datetime
+import importlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask
+from sqlalchemy import MetaData, Table, inspect as sa_inspect, select, tuple_
+
+logger = logging.getLogger(__name__)
+
+class FileCheckpointStore:
+    """Keeps replay positions in a JSON file per replay name"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, name):
+        return os.path.join(self.directory, f"{name}.json")
+
+    def load(self, name):
+        try:
+            with open(self._path(name)) as fh:
+                return json.load(fh)
+        except FileNotFoundError:
+            return {}
+
+    def save(self, name, state):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = f"{self._path(name)}.tmp"
+        with open(tmp, 'w') as fh:
+            json.dump(state, fh)
+        # Atomic, so a crash never leaves a truncated checkpoint
+        os.replace(tmp, self._path(name))
+
+    def reset(self, name):
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            pass
+
+def _position(row):
+    created_at = row['created_at']
+    if isinstance(created_at, datetime.datetime):
+        created_at = created_at.isoformat()
+    return [created_at, row['id']]
+
+class OutboxReplay:
+    """Replays archived and live outbox events through outbox handlers"""
+
+    def __init__(self, db, outbox_model, handlers, name, checkpoints=None, workers=4,
+                 page_size=500, rate=None, since=None, event_types=None, archive_dir=None):
+        """
+        Initialize the replay
+
+        Args:
+            db: SQLAlchemy database instance
+            outbox_model: OutboxEvent model class
+            handlers: Dict mapping event_type to outbox handler functions
+                ``handler(aggregate_id, payload, event)``
+            name: Replay name; checkpoints are kept per name
+            checkpoints: Checkpoint store (default: ``FileCheckpointStore``
+                in ``.replay_checkpoints``)
+            workers: Number of parallel workers
+            page_size: Events read, handled and checkpointed together
+            rate: Target events per second, or None for unthrottled
+            since: Only replay events created at or after this datetime
+            event_types: Only replay these event types (default: those
+                with a handler); each must have a handler
+
+        Raises:
+            ValueError: If an event type has no handler
+            archive_dir: Directory of NDJSON archives to replay first
+        """
+        self.db = db
+        self.outbox_model = outbox_model
+        self.handlers = handlers
+        self.name = name
+        self.checkpoints = checkpoints or FileCheckpointStore('.replay_checkpoints')
+        self.workers = workers
+        # Pages of at most a second's worth keep throttling smooth; at rates
+        # below one event per second _throttle spaces single-event pages
+        self.page_size = max(1, min(page_size, int(rate))) if rate else page_size
+        self.rate = rate
+        self.since = since
+        self.event_types = set(event_types or handlers)
+        unhandled = self.event_types - set(handlers)
+        if unhandled:
+            # Checked up front rather than failing half-way through a replay
+            raise ValueError(f"No handler registered for event types: {', '.join(sorted(unhandled))}")
+        self.archive_dir = archive_dir
+        self._started = None
+        self._replayed = 0
+
+    def sources(self):
+        """Names of the sources to replay, oldest first"""
+        table = self.outbox_model.__table__
+        sources = []
+        if self.archive_dir and os.path.isdir(self.archive_dir):
+            pattern = re.compile(rf"^{re.escape(table.name)}-\d{{4}}-\d{{2}}-\d{{2}}\.ndjson\.gz$")
+            sources.extend(f"ndjson:{f}" for f in sorted(os.listdir(self.archive_dir)) if pattern.match(f))
+        if f"{table.name}_archive" in sa_inspect(self.db.engine).get_table_names():
+            sources.append(f"table:{table.name}_archive")
+        sources.append(f"table:{table.name}")
+        return sources
+
+    def _wanted(self, row):
+        if row['event_type'] not in self.event_types:
+            return False
+        return self.since is None or _position(row)[0] >= self.since.isoformat()
+
+    def _read_table(self, name, after):
+        """
+        Pages of rows from a table in (created_at, id) order after ``after``,
+        each with the position of its last row
+        """
+        table = Table(name, MetaData(), autoload_with=self.db.engine)
+        columns = set(self.outbox_model.__table__.c.keys())
+        key = tuple_(table.c.created_at, table.c.id)
+        query = select(table).where(table.c.event_type.in_(self.event_types))
+        if self.since is not None:
+            query = query.where(table.c.created_at >= self.since)
+        while True:
+            page_query = query
+            if after is not None:
+                created_at = datetime.datetime.fromisoformat(after[0]) if after[0] else None
+                page_query = page_query.where(key > tuple_(created_at, after[1]))
+            rows = self.db.session.execute(
+                page_query.order_by(table.c.created_at, table.c.id).limit(self.page_size)
+            ).mappings().all()
+            self.db.session.rollback()
+            if not rows:
+                return
+            after = _position(rows[-1])
+            yield [{k: v for k, v in row.items() if k in columns} for row in rows], after
+
+    def _read_ndjson(self, filename, after):
+        """
+        Pages of rows from an NDJSON archive after its first ``after``
+        lines, each with the number of lines read so far
+
+        Archives are written in processing order, not (created_at, id)
+        order, so they are resumed by line rather than by position.
+        """
+        columns = self.outbox_model.__table__.columns
+        skip = after or 0
+        page = []
+        read = 0
+        with gzip.open(os.path.join(self.archive_dir, filename), 'rt', encoding='utf-8') as fh:
+            for read, line in enumerate(fh, start=1):
+                if read <= skip:
+                    continue
+                row = json.loads(line)
+                for column in columns:
+                    # Timestamps were written with str(); restore datetimes
+                    value = row.get(column.name)
+                    if isinstance(value, str) and column.type.python_type is datetime.datetime:
+                        row[column.name] = datetime.datetime.fromisoformat(value)
+                if not self._wanted(row):
+                    continue
+                page.append(row)
+                if len(page) >= self.page_size:
+                    yield page, read
+                    page = []
+        if page:
+            yield page, read
+
+    def _partition(self, events):
+        partitions = [[] for _ in range(self.workers)]
+        for event in events:
+            key = f"{event.aggregate_type}:{event.aggregate_id}"
+            partitions[zlib.crc32(key.encode('utf-8')) % self.workers].append(event)
+        return [p for p in partitions if p]
+
+    def _handle_partition(self, app, events):
+        with app.app_context():
+            for event in events:
+                self.handlers[event.event_type](event.aggregate_id, json.loads(event.payload), event)
+
+    def _throttle(self):
+        if not self.rate:
+            return
+        ahead = self._replayed / self.rate - (time.monotonic() - self._started)
+        if ahead > 0:
+            time.sleep(ahead)
+
+    def run(self, app, limit=None):
+        """
+        Replay until all sources are exhausted or ``limit`` events were handled
+
+        Returns:
+            Number of events replayed by this call
+        """
+        state = self.checkpoints.load(self.name)
+        done = set(state.get('done', []))
+        positions = state.get('positions', {})
+        self._started = time.monotonic()
+        self._replayed = 0
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f'replay-{self.name}') as pool:
+            for source in self.sources():
+                if source in done:
+                    continue
+                kind, name = source.split(':', 1)
+                reader = self._read_ndjson if kind == 'ndjson' else self._read_table
+                for rows, position in reader(name, positions.get(source)):
+                    if limit is not None and self._replayed >= limit:
+                        return self._replayed
+                    self._throttle()
+                    events = [self.outbox_model(**row) for row in rows]
+                    # Pages are barriers: the checkpoint only moves once every
+                    # partition of the page has been handled
+                    for future in [pool.submit(self._handle_partition, app, p)
+                                   for p in self._partition(events)]:
+                        future.result()
+                    self._replayed += len(events)
+                    positions[source] = position
+                    self.checkpoints.save(self.name, {'done': sorted(done), 'positions': positions})
+                    logger.info(f"Replay {self.name}: {self._replayed} events, at {source} {positions[source]}")
+                done.add(source)
+                self.checkpoints.save(self.name, {'done': sorted(done), 'positions': positions})
+        logger.info(f"Replay {self.name} finished: {self._replayed} events")
+        return self._replayed
+
+def _load(path, kind):
+    """Import ``module:attr``, calling it if it is a factory rather than a ``kind``"""
+    module, _, attr = path.partition(':')
+    obj = getattr(importlib.import_module(module), attr)
+    return obj if isinstance(obj, kind) else obj()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay outbox events through handlers")
+    parser.add_argument('--app', required=True, help="module:attr of the Flask app or app factory")
+    parser.add_argument('--handlers', required=True,
+                        help="module:attr of a dict of handlers, or of a function returning one")
+    parser.add_argument('--name', required=True, help="Replay name used for checkpoints")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--page-size', type=int, default=500)
+    parser.add_argument('--rate', type=float, help="Target events per second")
+    parser.add_argument('--since', type=datetime.datetime.fromisoformat)
+    parser.add_argument('--event-type', action='append', dest='event_types')
+    parser.add_argument('--archive-dir', help="Directory of NDJSON outbox archives")
+    parser.add_argument('--checkpoint-dir', default='.replay_checkpoints')
+    parser.add_argument('--reset', action='store_true', help="Discard the checkpoint and start over")
+    args = parser.parse_args(argv)
+
+    from .outbox import _find_outbox_model
+
+    app = _load(args.app, Flask)
+    with app.app_context():
+        db = app.extensions['sqlalchemy']
+        checkpoints = FileCheckpointStore(args.checkpoint_dir)
+        if args.reset:
+            checkpoints.reset(args.name)
+        try:
+            replay = OutboxReplay(
+                db, _find_outbox_model(db), _load(args.handlers, dict), args.name,
+                checkpoints=checkpoints, workers=args.workers, page_size=args.page_size,
+                rate=args.rate, since=args.since, event_types=args.event_types,
+                archive_dir=args.archive_dir or app.config.get('OUTBOX_ARCHIVE_DIR'),
+            )
+        except ValueError as e:
+            parser.error(str(e))
+        replay.run(app)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""
+Per-request latency breakdown.
+
+``init_server_timing`` accumulates, for every request, the time spent in SQL,
+outbound HTTP, cache calls, JSON serialization and the remaining handler
+code, returns it in a ``Server-Timing`` header (visible in browser dev
+tools) and records it in per-route Prometheus histograms.
+
+Components are timed exclusively: time spent in SQL issued while
+serializing counts as ``db``, not ``serialize``, so components add up to
+the request total. Other code can report its own components with
+``timed``::
+
+    with timed('render'):
+        ...
+"""
+import time
+import logging
+from contextlib import contextmanager
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+COMPONENTS = ('db', 'http', 'cache', 'serialize')
+
+try:
+    from prometheus_client import Histogram
+    REQUEST_COMPONENT_SECONDS = Histogram(
+        'http_request_component_seconds',
+        'Time spent per request in each component',
+        ['route', 'component'],
+        buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+    )
+except ImportError:
+    REQUEST_COMPONENT_SECONDS = None
+
+class _Timings:
+    """Component timings of the current request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.durations = {}
+        self.counts = {}
+        self.stack = []
+
+def _current():
+    if not has_request_context():
+        return None
+    return g.get('_server_timings')
+
+def start_timing(component):
+    """
+    Start timing ``component`` in the current request
+
+    Returns:
+        Token for ``stop_timing``, or None outside of a timed request
+    """
+    timings = _current()
+    if timings is None:
+        return None
+    # [component, start, time spent in nested components]
+    token = [component, time.perf_counter(), 0.0]
+    timings.stack.append(token)
+    return token
+
+def stop_timing(token):
+    """Stop a timing started with ``start_timing``"""
+    if token is None:
+        return
+    timings = _current()
+    if timings is None or token not in timings.stack:
+        return
+    component, started, nested = token
+    elapsed = time.perf_counter() - started
+    timings.stack.remove(token)
+    timings.durations[component] = timings.durations.get(component, 0.0) + elapsed - nested
+    timings.counts[component] = timings.counts.get(component, 0) + 1
+    if timings.stack:
+        timings.stack[-1][2] += elapsed
+
+@contextmanager
+def timed(component):
+    """Attribute the time spent in the block to ``component``"""
+    token = start_timing(component)
+    try:
+        yield
+    finally:
+        stop_timing(token)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._server_timing = start_timing('db')
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stop_timing(getattr(context, '_server_timing', None))
+
+def _handle_error(exception_context):
+    stop_timing(getattr(exception_context.execution_context, '_server_timing', None))
+
+def _instrument_engines():
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+
+def _instrument_json(app):
+    dumps = app.json.dumps
+
+    def timed_dumps(obj, **kwargs):
+        with timed('serialize'):
+            return dumps(obj, **kwargs)
+
+    app.json.dumps = timed_dumps
+
+def server_timing_header(durations, counts, total):
+    """Format timings (in seconds) as a ``Server-Timing`` header value"""
+    metrics = []
+    for component, seconds in durations.items():
+        metric = f"{component};dur={seconds * 1000:.1f}"
+        if component in COMPONENTS and counts.get(component, 0) > 1:
+            metric += f';desc="{counts[component]} calls"'
+        metrics.append(metric)
+    metrics.append(f"total;dur={total * 1000:.1f}")
+    return ', '.join(metrics)
+
+def init_server_timing(app):
+    """
+    Record a latency breakdown of every request
+
+    Configuration:
+        SERVER_TIMING_ENABLED: Collect timings (default True)
+        SERVER_TIMING_HEADER: Send the ``Server-Timing`` header (default
+            True); set to False to keep the breakdown internal to metrics
+    """
+    if not app.config.get('SERVER_TIMING_ENABLED', True):
+        return
+    send_header = app.config.get('SERVER_TIMING_HEADER', True)
+    _instrument_engines()
+    _instrument_json(app)
+
+    @app.before_request
+    def start_request_timing():
+        g._server_timings = _Timings()
+
+    @app.after_request
+    def finish_request_timing(response):
+        timings = g.pop('_server_timings', None)
+        if timings is None:
+            return response
+        total = time.perf_counter() - timings.started
+        durations = dict(timings.durations)
+        durations['app'] = max(0.0, total - sum(durations.values()))
+        if send_header:
+            header = server_timing_header(durations, timings.counts, total)
+            existing = response.headers.get('Server-Timing')
+            response.headers['Server-Timing'] = f"{existing}, {header}" if existing else header
+        if REQUEST_COMPONENT_SECONDS is not None:
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            for component, seconds in durations.items():
+                REQUEST_COMPONENT_SECONDS.labels(route=route, component=component).observe(seconds)
+        return response
+
+    logger.info("Server-Timing breakdown enabled")
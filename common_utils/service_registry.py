@@ -7,11 +7,297 @@ import socket
 from flask import Flask, current_app
 import logging
 import json
-from threading import Timer
-from typing import Dict, List, Optional, Any
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Any
+from .http import get_http_client
+from .load_balancer import LoadBalancer, NoHealthyInstances, get_load_balancer
 
 logger = logging.getLogger(__name__)
 
+# All watched configuration lives under this prefix, so one blocking query covers it
+KV_PREFIX = 'reqarchitect/'
+
+def _instance(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Shape a Consul health.service entry as returned by ServiceRegistry.get_service"""
+    service = entry['Service']
+    return {
+        'id': service['ID'],
+        'name': service['Service'],
+        # Services registered without an address use their node's
+        'address': service['Address'] or entry.get('Node', {}).get('Address'),
+        'port': service['Port'],
+        'tags': service['Tags'],
+        'meta': service.get('Meta', {}),
+        'health': [
+            {
+                'id': check['CheckID'],
+                'name': check['Name'],
+                'status': check['Status'],
+                'output': check['Output']
+            }
+            for check in entry['Checks']
+        ]
+    }
+
+def diff_snapshots(previous: Dict[str, List[Dict[str, Any]]],
+                   current: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Any]:
+    """
+    Membership changes between two catalog snapshots
+
+    Returns:
+        Dict with 'added' and 'removed' service names and 'changed'
+        mapping service names to the instance ids that joined or left
+    """
+    changed = {}
+    for name in previous.keys() & current.keys():
+        before = {i['id'] for i in previous[name]}
+        after = {i['id'] for i in current[name]}
+        if before != after:
+            changed[name] = {'added': sorted(after - before), 'removed': sorted(before - after)}
+    return {
+        'added': sorted(current.keys() - previous.keys()),
+        'removed': sorted(previous.keys() - current.keys()),
+        'changed': changed,
+    }
+
+def _check_states(checks: Optional[List[Dict[str, Any]]]) -> Dict[str, frozenset]:
+    """Health checks of a health.state result per service name ('' for node checks)"""
+    states: Dict[str, set] = {}
+    for check in checks or []:
+        states.setdefault(check.get('ServiceName') or '', set()).add(
+            (check.get('Node'), check.get('CheckID'), check.get('ServiceID'), check.get('Status')))
+    return {name: frozenset(checks) for name, checks in states.items()}
+
+def _changed_services(previous: Optional[Dict[str, frozenset]],
+                      current: Dict[str, frozenset]) -> Optional[set]:
+    """Services whose checks differ, or None when any service may be affected"""
+    if previous is None:
+        return None
+    changed = {name for name in previous.keys() | current.keys() if previous.get(name) != current.get(name)}
+    # A failing node check takes down every service on the node
+    return None if '' in changed else changed
+
+class ServiceDiscoveryCache:
+    """
+    Healthy instances per service, kept fresh in the background
+
+    The first lookup of a service asks Consul directly; afterwards a single
+    thread long-polls Consul's health state with a blocking query and
+    re-reads only the services whose checks changed (every known service
+    when a node check changed), so lookups are served from memory. If
+    Consul is unreachable the last known instances keep being served.
+    """
+
+    def __init__(self, consul_client, wait: str = '55s', retry_interval: float = 5,
+                 snapshot_ttl: float = 5, max_workers: int = 16):
+        """
+        Initialize the cache
+
+        Args:
+            consul_client: consul.Consul client
+            wait: Maximum duration of a blocking query
+            retry_interval: Seconds to wait after Consul errors
+            snapshot_ttl: Seconds a full catalog snapshot is reused
+            max_workers: Concurrent Consul queries when building a snapshot
+        """
+        self.consul_client = consul_client
+        self.wait = wait
+        self.retry_interval = retry_interval
+        self.snapshot_ttl = snapshot_ttl
+        self.max_workers = max_workers
+        self._snapshot: Optional[Dict[str, List[Dict[str, Any]]]] = None
+        self._snapshot_at = 0.0
+        self._snapshot_lock = threading.Lock()
+        self._check_states: Optional[Dict[str, frozenset]] = None
+        self._listeners: List[Callable[[Dict[str, Any]], None]] = []
+        self._instances: Dict[str, List[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.last_refresh = None
+        self.consul_available = True
+
+    def _fetch(self, service_name: str) -> List[Dict[str, Any]]:
+        _, entries = self.consul_client.health.service(service_name, passing=True)
+        return [_instance(entry) for entry in entries or []]
+
+    def get_instances(self, service_name: str) -> List[Dict[str, Any]]:
+        """Get the healthy instances of a service"""
+        instances = self._instances.get(service_name)
+        if instances is not None:
+            return instances
+        try:
+            instances = self._fetch(service_name)
+        except Exception as e:
+            logger.error(f"Error getting service details: {str(e)}")
+            return []
+        with self._lock:
+            self._instances[service_name] = instances
+        self._ensure_watcher()
+        return instances
+
+    def refresh(self, service_names=None):
+        """
+        Re-read known services, keeping the previous instances on error
+
+        Args:
+            service_names: Services to re-read (default: every known one);
+                names that were never looked up are ignored
+        """
+        known = list(self._instances)
+        if service_names is not None:
+            known = [name for name in known if name in service_names]
+        for service_name in known:
+            try:
+                instances = self._fetch(service_name)
+            except Exception as e:
+                logger.warning(f"Keeping cached instances of {service_name}: {str(e)}")
+                self.consul_available = False
+                continue
+            with self._lock:
+                self._instances[service_name] = instances
+        self.last_refresh = time.time()
+
+    def _watch(self):
+        index = None
+        while not self._stop.is_set():
+            try:
+                # Returns when any health check changes, or after ``wait``
+                new_index, checks = self.consul_client.health.state('any', index=index, wait=self.wait)
+                if not self.consul_available:
+                    logger.info("Consul reachable again, refreshing discovery cache")
+                self.consul_available = True
+                if new_index != index:
+                    index = new_index
+                    states = _check_states(checks)
+                    changed = _changed_services(self._check_states, states)
+                    self._check_states = states
+                    if changed is None:
+                        if self._listeners:
+                            # Rebuilding the snapshot refreshes every service too
+                            self.snapshot(max_age=0)
+                        else:
+                            self.refresh()
+                    elif changed:
+                        if self._listeners:
+                            self._update_snapshot(changed, states)
+                        else:
+                            self.refresh(changed)
+                    if not self.consul_available:
+                        # Some services kept stale instances; re-read all next time
+                        self._check_states = None
+            except Exception as e:
+                if self.consul_available:
+                    logger.warning(f"Consul unavailable, serving cached instances: {str(e)}")
+                self.consul_available = False
+                index = None
+                self._stop.wait(self.retry_interval)
+
+    def _ensure_watcher(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._watch, name='consul-discovery', daemon=True)
+                self._thread.start()
+
+    def snapshot(self, max_age: Optional[float] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Healthy instances of every service in the catalog
+
+        Reuses the last snapshot while younger than ``max_age`` seconds
+        (default ``snapshot_ttl``); otherwise queries all services
+        concurrently. Serves the previous snapshot if Consul fails.
+        """
+        max_age = self.snapshot_ttl if max_age is None else max_age
+        if self._snapshot is not None and time.time() - self._snapshot_at < max_age:
+            return self._snapshot
+        with self._snapshot_lock:
+            # Another caller may have rebuilt it while we waited
+            if self._snapshot is not None and time.time() - self._snapshot_at < max_age:
+                return self._snapshot
+            try:
+                _, names = self.consul_client.catalog.services()
+                names = list(names or {})
+                with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(names)))) as pool:
+                    current = dict(zip(names, pool.map(self._fetch, names)))
+            except Exception as e:
+                logger.error(f"Error getting all services: {str(e)}")
+                return self._snapshot or {}
+            with self._lock:
+                self._instances.update(current)
+            previous = self._snapshot
+            self._snapshot, self._snapshot_at = current, time.time()
+        self._notify(previous, current)
+        return current
+
+    def _update_snapshot(self, service_names, states):
+        """Re-read only ``service_names`` into the snapshot and notify listeners"""
+        if self._snapshot is None:
+            self.snapshot(max_age=0)
+            return
+        with self._snapshot_lock:
+            previous = self._snapshot
+            current = dict(previous)
+            for name in service_names:
+                if name not in states:
+                    # No checks left: the service was deregistered
+                    current.pop(name, None)
+                    with self._lock:
+                        if name in self._instances:
+                            self._instances[name] = []
+                    continue
+                try:
+                    current[name] = self._fetch(name)
+                except Exception as e:
+                    logger.warning(f"Keeping cached instances of {name}: {str(e)}")
+                    self.consul_available = False
+                    continue
+                with self._lock:
+                    self._instances[name] = current[name]
+            self._snapshot, self._snapshot_at = current, time.time()
+        self.last_refresh = time.time()
+        self._notify(previous, current)
+
+    def _notify(self, previous, current):
+        if previous is not None and self._listeners:
+            diff = diff_snapshots(previous, current)
+            if diff['added'] or diff['removed'] or diff['changed']:
+                for listener in list(self._listeners):
+                    try:
+                        listener(diff)
+                    except Exception as e:
+                        logger.error(f"Error in service membership listener: {str(e)}")
+
+    def add_listener(self, callback: Callable[[Dict[str, Any]], None]):
+        """
+        Call ``callback(diff)`` (see ``diff_snapshots``) whenever service
+        membership changes
+        """
+        self._listeners.append(callback)
+        # Baseline to diff against, and a watcher to notice changes
+        self.snapshot()
+        self._ensure_watcher()
+
+    def invalidate(self, service_name: Optional[str] = None):
+        with self._lock:
+            if service_name is None:
+                self._instances.clear()
+            else:
+                self._instances.pop(service_name, None)
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'services': {name: len(instances) for name, instances in self._instances.items()},
+            'last_refresh': self.last_refresh,
+            'consul_available': self.consul_available,
+        }
+
 class ServiceRegistry:
     """Enhanced service registry client for Consul integration"""
     
@@ -21,12 +307,14 @@ class ServiceRegistry:
         self.service_id = service_id
         self.service_port = service_port
         self.consul_client = None
-        self.cache_refresh_timer = None
-        self.watching_keys = set()
+        self.discovery = None
+        self.watching_keys: Dict[str, Callable[[str], None]] = {}
+        self._kv_thread = None
         
         if app is not None:
             self.init_app(app)
-      def init_app(self, app):
+
+    def init_app(self, app):
         """Initialize the registry with the Flask app"""
         self.app = app
         
@@ -40,6 +328,11 @@ class ServiceRegistry:
         
         # Initialize Consul client
         self.consul_client = consul.Consul(host=consul_host, port=consul_port)
+        self.discovery = ServiceDiscoveryCache(
+            self.consul_client,
+            wait=app.config.get('CONSUL_BLOCKING_WAIT', '55s'),
+            snapshot_ttl=app.config.get('CONSUL_SNAPSHOT_TTL', 5),
+        )
         
         # Register service on startup if enabled
         if app.config.get('AUTO_REGISTER_SERVICE', True):
@@ -63,7 +356,8 @@ class ServiceRegistry:
             def cache_refresh():
                 self._refresh_cache_config(app)
                 return {'status': 'cache refreshed'}, 200
-      def register(self):
+
+    def register(self):
         """Register the service with Consul"""
         if not self.consul_client:
             logger.warning("Consul client not initialized, skipping registration")
@@ -139,55 +433,76 @@ class ServiceRegistry:
     def deregister_on_shutdown(self, exception=None):
         """Callback for Flask app context teardown"""
         self.deregister()
-      def get_service(self, service_name: str) -> Optional[Dict[str, Any]]:
-        """Get service details from Consul with enhanced metadata"""
-        if not self.consul_client:
+
+    def get_service(self, service_name: str) -> Optional[Dict[str, Any]]:
+        """
+        Get details of a healthy instance of a service from the discovery cache
+
+        The instance is chosen by the service's balancer, but calls made to
+        it are not reported back: their latency, errors and concurrency do
+        not steer later picks and cannot get the instance ejected. Use
+        ``request`` for calls that should be balanced on those signals.
+        """
+        if not self.discovery:
             return None
-            
-        try:
-            _, services = self.consul_client.health.service(service_name, passing=True)
-            if not services:
-                return None
-                
-            service = services[0]['Service']
-            return {
-                'id': service['ID'],
-                'name': service['Service'],
-                'address': service['Address'],
-                'port': service['Port'],
-                'tags': service['Tags'],
-                'meta': service.get('Meta', {}),
-                'health': [
-                    {
-                        'id': check['CheckID'],
-                        'name': check['Name'],
-                        'status': check['Status'],
-                        'output': check['Output']
-                    }
-                    for check in services[0]['Checks']
-                ]
-            }
-        except Exception as e:
-            logger.error(f"Error getting service details: {str(e)}")
+        instances = self.discovery.get_instances(service_name)
+        if not instances:
             return None
-    
+        return self.load_balancer(service_name).pick(instances)
+
+    def load_balancer(self, service_name: str) -> LoadBalancer:
+        """Get the balancer spreading this process's calls over a service's instances"""
+        strategy = self.app.config.get('LOAD_BALANCER_STRATEGY', 'p2c') if self.app else 'p2c'
+        return get_load_balancer(service_name, strategy=strategy)
+
+    def request(self, service_name: str, method: str, path: str, **kwargs: Any):
+        """
+        Call a service through the load balancer
+
+        The chosen instance's latency and outcome (connection errors and 5xx
+        responses count as failures) feed the balancer, which ejects
+        misbehaving instances for a while. Only calls made here are
+        tracked; instances handed out by ``get_service`` and
+        ``get_service_url`` are picked from the same statistics but do not
+        add to them.
+
+        Args:
+            service_name: Registered service name
+            method: HTTP method
+            path: Path on the service, starting with '/'
+            **kwargs: Passed to ``ServiceHTTPClient.request``
+
+        Returns:
+            requests.Response
+        """
+        instances = self.discovery.get_instances(service_name) if self.discovery else []
+        if not instances:
+            base_url = self.get_service_url(service_name)
+            if not base_url:
+                raise NoHealthyInstances(f"No instances of {service_name}")
+            return get_http_client().request(method, f"{base_url}{path}", **kwargs)
+        with self.load_balancer(service_name).call(instances) as outcome:
+            instance = outcome['instance']
+            response = get_http_client().request(
+                method, f"http://{instance['address']}:{instance['port']}{path}", **kwargs)
+            outcome['success'] = response.status_code < 500
+            return response
+
     def get_all_services(self) -> List[Dict[str, Any]]:
-        """Get all registered services"""
-        if not self.consul_client:
-            return []
-            
-        try:
-            services = []
-            index, service_names = self.consul_client.catalog.services()
-            
-            for name in service_names:
-                if service := self.get_service(name):
-                    services.append(service)
-            return services
-        except Exception as e:
-            logger.error(f"Error getting all services: {str(e)}")
-            return []
-    
+        """Get one healthy instance of every registered service"""
+        return [instances[0] for instances in self.get_services_snapshot().values() if instances]
+
+    def get_services_snapshot(self, max_age: Optional[float] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """Get the healthy instances of every registered service"""
+        if not self.discovery:
+            return {}
+        return self.discovery.snapshot(max_age)
+
+    def watch_services(self, callback: Callable[[Dict[str, Any]], None]):
+        """Call ``callback(diff)`` whenever services or their instances change"""
+        if self.discovery:
+            self.discovery.add_listener(callback)
+
     def get_service_config(self, service_name: str) -> Optional[Dict[str, Any]]:
         """Get service configuration from Consul KV store"""
         try:
@@ -216,24 +531,14 @@ class ServiceRegistry:
         except Exception as e:
             logger.error(f"Error getting cache endpoints: {str(e)}")
         return None
-            
-        try:
-            _, services = self.consul_client.health.service(service_name, passing=True)
-            if services:
-                service = services[0]['Service']
-                return {
-                    'id': service['ID'],
-                    'name': service['Service'],
-                    'address': service['Address'],
-                    'port': service['Port']
-                }
-            return None
-        except Exception as e:
-            logger.error(f"Failed to get service details from Consul: {e}")
-            return None
-    
+
     def get_service_url(self, service_name):
-        """Get a service URL from the registry"""
+        """
+        Get a service URL from the registry
+
+        Like ``get_service``, the URL is chosen without feedback from the
+        calls made to it; prefer ``request``.
+        """
         service = self.get_service(service_name)
         if service:
             return f"http://{service['address']}:{service['port']}"
@@ -252,31 +557,40 @@ class ServiceRegistry:
         self._watch_key(service_config_key, lambda v: self._update_service_config(app, v))
     
     def _watch_key(self, key: str, callback):
-        """Setup a watch for a specific key"""
+        """
+        Call ``callback`` with the value of ``key`` now and whenever it
+        changes; all keys share one blocking query on ``KV_PREFIX``
+        """
         if key in self.watching_keys:
             return
-            
-        self.watching_keys.add(key)
+        self.watching_keys[key] = callback
+        if self._kv_thread is None:
+            self._kv_thread = threading.Thread(target=self._watch_keys, name='consul-kv-watch', daemon=True)
+            self._kv_thread.start()
+
+    def _watch_keys(self):
         index = None
-        
-        def watch_key():
-            nonlocal index
+        seen: Dict[str, int] = {}
+        wait = self.app.config.get('CONSUL_BLOCKING_WAIT', '55s') if self.app else '55s'
+        while True:
             try:
-                index, data = self.consul_client.kv.get(
-                    key,
-                    index=index
-                )
-                if data and data['Value']:
-                    callback(data['Value'].decode('utf-8'))
+                index, entries = self.consul_client.kv.get(KV_PREFIX, recurse=True, index=index, wait=wait)
             except Exception as e:
-                logger.error(f"Error watching key {key}: {str(e)}")
-            finally:
-                # Schedule next check
-                Timer(10.0, watch_key).start()
-        
-        # Start initial watch
-        watch_key()
-    
+                logger.error(f"Error watching keys under {KV_PREFIX}: {str(e)}")
+                index = None
+                time.sleep(10)
+                continue
+            for entry in entries or []:
+                callback = self.watching_keys.get(entry['Key'])
+                if callback is None or seen.get(entry['Key']) == entry['ModifyIndex']:
+                    continue
+                seen[entry['Key']] = entry['ModifyIndex']
+                if entry['Value']:
+                    try:
+                        callback(entry['Value'].decode('utf-8'))
+                    except Exception as e:
+                        logger.error(f"Error handling change of key {entry['Key']}: {str(e)}")
+
     def _refresh_cache_config(self, app, redis_endpoints: str = None):
         """Refresh cache configuration"""
         try:
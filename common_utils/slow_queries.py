@@ -0,0 +1,262 @@
+"""
+Slow-query log with automatic EXPLAIN capture.
+
+When enabled (``SLOW_QUERY_LOG_ENABLED``), every SQL statement slower than
+``SLOW_QUERY_THRESHOLD_MS`` is aggregated by normalized shape with its
+count, total and maximum duration, parameter shape and calling routes.
+The first time a shape turns up, a background thread runs ``EXPLAIN`` for
+it on its own connection; a sampled fraction of slow read-only SELECTs on
+PostgreSQL get ``EXPLAIN (ANALYZE, BUFFERS)`` instead, inside a rolled
+back read-only transaction. Statements that lock rows (``FOR UPDATE``,
+``FOR SHARE``, ...), write (``SELECT ... INTO``) or call known
+side-effecting functions are only ever planned, never run again. The top
+statements by total time are served on ``/admin/slow-queries``.
+"""
+import re
+import time
+import queue
+import random
+import threading
+import logging
+from collections import Counter
+from flask import Blueprint, jsonify, request, has_request_context, current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from .query_budget import normalize_statement
+
+logger = logging.getLogger(__name__)
+
+# Clauses and functions making a SELECT lock, write or otherwise act when run
+_NOT_READ_ONLY = re.compile(
+    r"\bFOR\s+(?:NO\s+KEY\s+)?(?:UPDATE|SHARE|KEY\s+SHARE)\b|\bINTO\b"
+    r"|\b(?:nextval|setval|pg_advisory\w*|pg_notify|pg_terminate_backend|pg_cancel_backend|dblink\w*)\s*\(",
+    re.IGNORECASE,
+)
+
+def is_read_only_select(statement):
+    """Whether ``statement`` is a plain SELECT that is safe to run again"""
+    return statement.lstrip().upper().startswith('SELECT') and not _NOT_READ_ONLY.search(statement)
+
+def parameters_shape(parameters, executemany=False):
+    """Types of the bound parameters, without their values"""
+    if executemany:
+        rows = list(parameters or [])
+        return {'rows': len(rows), 'row': parameters_shape(rows[0]) if rows else None}
+    if isinstance(parameters, dict):
+        return {k: type(v).__name__ for k, v in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(v).__name__ for v in parameters]
+    return None
+
+def _explain_prefix(dialect, analyze):
+    if dialect == 'postgresql':
+        return 'EXPLAIN (ANALYZE, BUFFERS) ' if analyze else 'EXPLAIN '
+    if dialect == 'sqlite':
+        return 'EXPLAIN QUERY PLAN '
+    return 'EXPLAIN '
+
+class SlowQuery:
+    """Aggregated slow executions of one statement shape"""
+
+    def __init__(self, shape, statement):
+        self.shape = shape
+        self.statement = statement
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.parameters = None
+        self.routes = Counter()
+        self.plan = None
+        self.plan_analyzed = False
+        self.plan_pending = False
+        self.last_seen = None
+
+    def as_dict(self):
+        return {
+            'statement': self.shape,
+            'count': self.count,
+            'total_ms': round(self.total * 1000, 1),
+            'mean_ms': round(self.total / self.count * 1000, 1) if self.count else 0.0,
+            'max_ms': round(self.max * 1000, 1),
+            'parameters': self.parameters,
+            'routes': dict(self.routes.most_common(5)),
+            'plan': self.plan,
+            'plan_analyzed': self.plan_analyzed,
+            'last_seen': self.last_seen,
+        }
+
+class SlowQueryLog:
+    """Collects slow statements of all engines in the process"""
+
+    def __init__(self, threshold=0.2, max_entries=500, explain=True, analyze_sample_rate=0.0):
+        """
+        Initialize the log
+
+        Args:
+            threshold: Duration in seconds above which a statement is slow
+            max_entries: Statement shapes kept; the shape with the least
+                total time is evicted when full
+            explain: Capture plans of slow statements
+            analyze_sample_rate: Fraction of slow read-only SELECTs
+                explained with ANALYZE (PostgreSQL only; runs the query again)
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.explain = explain
+        self.analyze_sample_rate = analyze_sample_rate
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._explain_queue = queue.Queue(maxsize=100)
+        self._thread = None
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._slow_query_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_slow_query_started', None)
+        if started is None or context.execution_options.get('_slow_query_explain'):
+            return
+        duration = time.perf_counter() - started
+        if duration >= self.threshold:
+            self.record(conn.engine, statement, parameters, duration, executemany)
+
+    def install(self):
+        """Listen to statements of every engine"""
+        if not event.contains(Engine, 'before_cursor_execute', self._before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def uninstall(self):
+        if event.contains(Engine, 'before_cursor_execute', self._before_cursor_execute):
+            event.remove(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.remove(Engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def record(self, engine, statement, parameters, duration, executemany=False):
+        """Add one slow execution"""
+        shape = normalize_statement(statement)
+        route = 'background'
+        if has_request_context():
+            route = f"{request.method} {request.url_rule.rule if request.url_rule else request.path}"
+        with self._lock:
+            entry = self._entries.get(shape)
+            if entry is None:
+                if len(self._entries) >= self.max_entries:
+                    del self._entries[min(self._entries, key=lambda k: self._entries[k].total)]
+                entry = self._entries[shape] = SlowQuery(shape, statement)
+            entry.count += 1
+            entry.total += duration
+            entry.max = max(entry.max, duration)
+            entry.parameters = parameters_shape(parameters, executemany)
+            entry.routes[route] += 1
+            entry.last_seen = time.time()
+            needs_plan = entry.plan is None and not entry.plan_pending
+            if needs_plan and self.explain:
+                entry.plan_pending = True
+        logger.warning(f"Slow query ({duration * 1000:.0f}ms) in {route}: {shape[:300]}")
+        if not self.explain:
+            return
+        analyze = (engine.dialect.name == 'postgresql' and not executemany
+                   and random.random() < self.analyze_sample_rate
+                   and is_read_only_select(statement))
+        if needs_plan or analyze:
+            if executemany:
+                parameters = parameters[0] if parameters else None
+            try:
+                self._explain_queue.put_nowait((engine, shape, statement, parameters, analyze))
+            except queue.Full:
+                pass
+            self._start()
+
+    def _start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._explain_loop, name='slow-query-explain', daemon=True)
+                    self._thread.start()
+
+    def _explain_loop(self):
+        while True:
+            engine, shape, statement, parameters, analyze = self._explain_queue.get()
+            try:
+                plan = self.explain_statement(engine, statement, parameters, analyze)
+            except Exception as e:
+                logger.debug(f"Could not explain slow query {shape[:100]}: {str(e)}")
+                plan, analyze = [f"EXPLAIN failed: {str(e)}"], False
+            with self._lock:
+                entry = self._entries.get(shape)
+                if entry is not None:
+                    entry.plan = plan
+                    entry.plan_analyzed = analyze
+                    entry.plan_pending = False
+
+    def explain_statement(self, engine, statement, parameters, analyze=False):
+        """Plan of ``statement`` as a list of lines"""
+        # Our own EXPLAIN must not be recorded as a slow query in turn
+        with engine.connect() as conn:
+            conn = conn.execution_options(_slow_query_explain=True)
+            transaction = conn.begin()
+            try:
+                if analyze:
+                    # Anything we failed to recognize as writing errors out
+                    conn.exec_driver_sql('SET TRANSACTION READ ONLY')
+                sql = _explain_prefix(engine.dialect.name, analyze) + statement
+                rows = conn.exec_driver_sql(sql, parameters) if parameters else conn.exec_driver_sql(sql)
+                return [' | '.join(str(v) for v in row) for row in rows]
+            finally:
+                transaction.rollback()
+
+    def top(self, limit=20):
+        """Slowest statement shapes by total time"""
+        with self._lock:
+            entries = sorted(self._entries.values(), key=lambda e: e.total, reverse=True)[:limit]
+            return [e.as_dict() for e in entries]
+
+    def reset(self):
+        with self._lock:
+            self._entries.clear()
+
+def init_slow_query_log(app, protect=None):
+    """
+    Record slow statements and serve them on ``/admin/slow-queries``
+
+    Configuration:
+        SLOW_QUERY_LOG_ENABLED: Turn the log on (default False)
+        SLOW_QUERY_THRESHOLD_MS: Slow statement threshold (default 200)
+        SLOW_QUERY_MAX_ENTRIES: Statement shapes kept (default 500)
+        SLOW_QUERY_EXPLAIN: Capture plans (default True)
+        SLOW_QUERY_ANALYZE_SAMPLE_RATE: Fraction of slow read-only SELECTs
+            explained with ANALYZE (default 0.0)
+
+    Args:
+        app: Flask application
+        protect: Decorator restricting access to the admin endpoint
+
+    Returns:
+        The ``SlowQueryLog``, or None when disabled
+    """
+    if not app.config.get('SLOW_QUERY_LOG_ENABLED', False):
+        return None
+    slow_queries = SlowQueryLog(
+        threshold=app.config.get('SLOW_QUERY_THRESHOLD_MS', 200) / 1000.0,
+        max_entries=app.config.get('SLOW_QUERY_MAX_ENTRIES', 500),
+        explain=app.config.get('SLOW_QUERY_EXPLAIN', True),
+        analyze_sample_rate=app.config.get('SLOW_QUERY_ANALYZE_SAMPLE_RATE', 0.0),
+    )
+    slow_queries.install()
+    app.extensions['slow_queries'] = slow_queries
+
+    bp = Blueprint('slow_queries', __name__)
+
+    def slow_query_report():
+        log = current_app.extensions['slow_queries']
+        if request.method == 'DELETE':
+            log.reset()
+            return jsonify({'status': 'reset'})
+        limit = request.args.get('limit', 20, type=int)
+        return jsonify({'threshold_ms': log.threshold * 1000, 'queries': log.top(limit)})
+
+    view = protect(slow_query_report) if protect else slow_query_report
+    bp.add_url_rule('/admin/slow-queries', 'report', view, methods=['GET', 'DELETE'])
+    app.register_blueprint(bp)
+    return slow_queries
@@ -1,18 +1,246 @@
 # Distributed tracing utilities using OpenTelemetry
 import os
+import queue
+import threading
+from collections import OrderedDict
 from flask import Flask, request, current_app
 import logging
 from opentelemetry import trace
+from opentelemetry.trace import StatusCode
 from opentelemetry.exporter.jaeger.thrift import JaegerExporter
 from opentelemetry.sdk.resources import SERVICE_NAME, Resource
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor
+from opentelemetry.sdk.trace import TracerProvider, SpanProcessor
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter
+from opentelemetry.sdk.trace.sampling import (
+    Sampler, SamplingResult, Decision, ParentBased, TraceIdRatioBased
+)
 from opentelemetry.instrumentation.flask import FlaskInstrumentor
 from opentelemetry.instrumentation.requests import RequestsInstrumentor
 from opentelemetry.instrumentation.sqlalchemy import SQLAlchemyInstrumentor
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_EXCLUDED_ROUTES = ('/health', '/metrics')
+
+class RouteSampler(Sampler):
+    """
+    Parent-based ratio sampler with per-route ratios
+
+    Root spans are sampled with the ratio of the longest route prefix in
+    ``route_ratios`` matching the request path, or ``ratio`` otherwise;
+    child spans follow their parent. With ``tail=True``, a ``tail_ratio``
+    share of the traces the head decision drops are still recorded (but
+    not sampled) so ``TailSamplingSpanProcessor`` can keep the slow and
+    failing ones. The share is chosen by trace id, so every service
+    records the same traces.
+    """
+
+    def __init__(self, ratio=1.0, route_ratios=None, tail=False, tail_ratio=1.0):
+        self.ratio = ratio
+        self.tail = tail
+        self.tail_ratio = tail_ratio
+        self._tail_bound = TraceIdRatioBased.get_bound_for_rate(tail_ratio)
+        self._default = ParentBased(TraceIdRatioBased(ratio))
+        self._routes = [
+            (prefix, rate, ParentBased(TraceIdRatioBased(rate)))
+            for prefix, rate in sorted((route_ratios or {}).items(), key=lambda r: -len(r[0]))
+        ]
+
+    def _route(self, attributes):
+        if not attributes or not self._routes:
+            return None
+        path = attributes.get('url.path') or attributes.get('http.target') or ''
+        for prefix, rate, sampler in self._routes:
+            if path.startswith(prefix):
+                return rate, sampler
+        return None
+
+    def should_sample(self, parent_context, trace_id, name, kind=None,
+                      attributes=None, links=None, trace_state=None):
+        route = self._route(attributes)
+        sampler = route[1] if route else self._default
+        result = sampler.should_sample(parent_context, trace_id, name, kind, attributes, links, trace_state)
+        # A route configured with ratio 0 is never traced, not even by the tail
+        if self.tail and result.decision == Decision.DROP and not (route and route[0] <= 0) \
+                and trace_id & TraceIdRatioBased.TRACE_ID_LIMIT < self._tail_bound:
+            return SamplingResult(Decision.RECORD_ONLY, attributes, result.trace_state)
+        return result
+
+    def get_description(self):
+        tail = f"{self.tail_ratio}" if self.tail else "off"
+        return f"RouteSampler{{ratio={self.ratio},routes={len(self._routes)},tail={tail}}}"
+
+class SerializedSpanExporter(SpanExporter):
+    """
+    Lets several span processors share one exporter
+
+    Each processor exports from its own thread, and exporters such as the
+    Jaeger thrift one are not safe to call concurrently, so calls are
+    serialized. Shutdown is passed on once, by the last user.
+    """
+
+    def __init__(self, exporter, users=1):
+        self.exporter = exporter
+        self._users = users
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        with self._lock:
+            return self.exporter.export(spans)
+
+    def force_flush(self, timeout_millis=30000):
+        with self._lock:
+            return self.exporter.force_flush(timeout_millis)
+
+    def shutdown(self):
+        with self._lock:
+            self._users -= 1
+            if self._users == 0:
+                self.exporter.shutdown()
+
+class TailSamplingSpanProcessor(SpanProcessor):
+    """
+    Keeps slow or failed traces that the head sampler dropped
+
+    Recorded but unsampled spans are buffered per trace until the local
+    root span ends; the trace is then exported if it took at least
+    ``latency_threshold`` seconds or any of its spans failed, and dropped
+    otherwise. Spans ending after their root follow the decision already
+    made for their trace. Memory is bounded by ``max_traces`` and
+    ``max_spans_per_trace``; the oldest open trace is evicted when the
+    buffer is full. Kept spans are exported in batches by a background
+    thread through a bounded queue, so request threads never block on
+    the exporter. Wrap an exporter shared with another processor in
+    ``SerializedSpanExporter``.
+    """
+
+    def __init__(self, exporter, latency_threshold=1.0, max_traces=1000, max_spans_per_trace=256,
+                 max_queue_size=2048, max_export_batch_size=512, schedule_delay=5.0):
+        """
+        Initialize the processor
+
+        Args:
+            exporter: Span exporter for kept traces
+            latency_threshold: Seconds after which a trace counts as slow
+            max_traces: Open traces buffered at most
+            max_spans_per_trace: Spans buffered per trace at most
+            max_queue_size: Kept spans waiting for export at most
+            max_export_batch_size: Spans per export call
+            schedule_delay: Seconds between exports of partial batches
+        """
+        self.exporter = exporter
+        self.latency_threshold_ns = int(latency_threshold * 1e9)
+        self.max_traces = max_traces
+        self.max_spans_per_trace = max_spans_per_trace
+        self.max_export_batch_size = max_export_batch_size
+        self.schedule_delay = schedule_delay
+        self._traces = OrderedDict()
+        # trace id -> kept, for spans ending after their local root
+        self._decided = OrderedDict()
+        self._lock = threading.Lock()
+        # force_flush exports from the caller's thread
+        self._export_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._stop = threading.Event()
+        self.kept = 0
+        self.discarded = 0
+        self.dropped = 0
+        self.late = 0
+        self._thread = threading.Thread(target=self._export_loop, name='tail-sampler', daemon=True)
+        self._thread.start()
+
+    def on_start(self, span, parent_context=None):
+        pass
+
+    def on_end(self, span):
+        context = span.context
+        if context is None or context.trace_flags.sampled:
+            # Head sampled spans are exported by the batch processor
+            return
+        is_root = span.parent is None or span.parent.is_remote
+        with self._lock:
+            spans = self._traces.get(context.trace_id)
+            if spans is None and not is_root and context.trace_id in self._decided:
+                self.late += 1
+                if self._decided[context.trace_id]:
+                    self._enqueue([span])
+                return
+            if spans is None:
+                if len(self._traces) >= self.max_traces:
+                    self._traces.popitem(last=False)
+                    self.dropped += 1
+                spans = self._traces[context.trace_id] = []
+            if len(spans) < self.max_spans_per_trace:
+                spans.append(span)
+            if not is_root:
+                return
+            spans = self._traces.pop(context.trace_id)
+            keep = self._interesting(span, spans)
+            self._decided[context.trace_id] = keep
+            if len(self._decided) > self.max_traces:
+                self._decided.popitem(last=False)
+            if keep:
+                self.kept += 1
+            else:
+                self.discarded += 1
+        if keep:
+            self._enqueue(spans)
+
+    def _enqueue(self, spans):
+        for span in spans:
+            try:
+                self._queue.put_nowait(span)
+            except queue.Full:
+                self.dropped += 1
+                break
+
+    def _interesting(self, root, spans):
+        if root.end_time is not None and root.end_time - root.start_time >= self.latency_threshold_ns:
+            return True
+        return any(s.status.status_code == StatusCode.ERROR for s in spans)
+
+    def _drain(self, wait):
+        batch = []
+        try:
+            batch.append(self._queue.get(timeout=wait) if wait else self._queue.get_nowait())
+            while len(batch) < self.max_export_batch_size:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        if batch:
+            try:
+                with self._export_lock:
+                    self.exporter.export(batch)
+            except Exception as e:
+                logger.error(f"Error exporting tail sampled spans: {str(e)}")
+        return len(batch)
+
+    def _export_loop(self):
+        while not self._stop.is_set():
+            self._drain(self.schedule_delay)
+
+    def force_flush(self, timeout_millis=30000):
+        while self._drain(0):
+            pass
+        return True
+
+    def shutdown(self):
+        self._stop.set()
+        self._thread.join(self.schedule_delay + 1)
+        self.force_flush()
+        self.exporter.shutdown()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'open_traces': len(self._traces),
+                'queued': self._queue.qsize(),
+                'kept': self.kept,
+                'discarded': self.discarded,
+                'dropped': self.dropped,
+                'late': self.late,
+            }
+
 class Tracer:
     """Distributed tracing utility for Flask microservices"""
     
@@ -37,26 +265,63 @@ class Tracer:
             logger.info("Tracing is disabled, skipping setup")
             return
         
+        excluded_routes = app.config.get('TRACING_EXCLUDED_ROUTES', DEFAULT_EXCLUDED_ROUTES)
+        # Tail sampling records every span of the traces it may keep, so it
+        # is opt-in and bounded by TRACING_TAIL_RECORD_RATIO
+        tail_sampling = app.config.get('TRACING_TAIL_SAMPLING', False)
+        self.sampler = RouteSampler(
+            ratio=app.config.get('TRACING_SAMPLE_RATIO', 0.1),
+            route_ratios=app.config.get('TRACING_ROUTE_SAMPLE_RATIOS'),
+            tail=tail_sampling,
+            tail_ratio=app.config.get('TRACING_TAIL_RECORD_RATIO', 1.0),
+        )
+
         # Initialize tracer provider with the service name
         resource = Resource(attributes={
             SERVICE_NAME: self.service_name
         })
-        provider = TracerProvider(resource=resource)
+        provider = TracerProvider(resource=resource, sampler=self.sampler)
         
         # Create Jaeger exporter
         jaeger_exporter = JaegerExporter(
             agent_host_name=jaeger_host,
             agent_port=jaeger_port,
         )
+        if tail_sampling:
+            # Both processors export from their own thread
+            jaeger_exporter = SerializedSpanExporter(jaeger_exporter, users=2)
         
         # Add the exporter to the provider
-        provider.add_span_processor(BatchSpanProcessor(jaeger_exporter))
+        max_queue_size = app.config.get('TRACING_MAX_QUEUE_SIZE', 2048)
+        max_export_batch_size = app.config.get('TRACING_MAX_EXPORT_BATCH_SIZE', 512)
+        schedule_delay_ms = app.config.get('TRACING_SCHEDULE_DELAY_MS', 5000)
+        provider.add_span_processor(BatchSpanProcessor(
+            jaeger_exporter,
+            max_queue_size=max_queue_size,
+            max_export_batch_size=max_export_batch_size,
+            schedule_delay_millis=schedule_delay_ms,
+            export_timeout_millis=app.config.get('TRACING_EXPORT_TIMEOUT_MS', 30000),
+        ))
+        self.tail_processor = None
+        if tail_sampling:
+            self.tail_processor = TailSamplingSpanProcessor(
+                jaeger_exporter,
+                latency_threshold=app.config.get('TRACING_TAIL_LATENCY_MS', 1000) / 1000.0,
+                max_traces=app.config.get('TRACING_TAIL_MAX_TRACES', 1000),
+                max_spans_per_trace=app.config.get('TRACING_TAIL_MAX_SPANS_PER_TRACE', 256),
+                max_queue_size=max_queue_size,
+                max_export_batch_size=max_export_batch_size,
+                schedule_delay=schedule_delay_ms / 1000.0,
+            )
+            provider.add_span_processor(self.tail_processor)
         
         # Set the provider as the global default
         trace.set_tracer_provider(provider)
         
-        # Instrument Flask
-        FlaskInstrumentor().instrument_app(app)
+        # Instrument Flask; excluded routes get no span at all
+        FlaskInstrumentor().instrument_app(
+            app, excluded_urls=','.join(excluded_routes) if excluded_routes else None
+        )
         
         # Instrument requests library for outgoing calls
         RequestsInstrumentor().instrument()
@@ -67,7 +332,8 @@ class Tracer:
                 engine=app.extensions['sqlalchemy'].db.engine
             )
         
-        logger.info(f"Distributed tracing initialized for {self.service_name}")
+        logger.info(f"Distributed tracing initialized for {self.service_name} "
+                    f"with sampler {self.sampler.get_description()}")
         
         # Add request ID middleware
         @app.before_request
@@ -1,15 +1,241 @@
+"""
+Payload validation for ReqArchitect services.
+
+Rule bundles are pulled per ``model_type`` from validation_service, compiled
+into plain Python checks and evaluated in-process, so a write does not pay a
+network round-trip. Bundles are versioned and refreshed in the background;
+the remote ``/validate`` endpoint is used when no bundle is available or the
+bundle requires OPA.
+"""
 import os
-import requests
+import re
+import time
+import threading
+import logging
+from flask import has_request_context, request
+from .http import get_http_client
 
-def validate_payload(payload, model_type):
-    validation_url = os.environ.get('VALIDATION_SERVICE_URL', 'http://localhost:5100/api/validate')
-    try:
-        resp = requests.post(validation_url, json={
-            'model_type': model_type,
-            'payload': payload
-        }, timeout=5)
+logger = logging.getLogger(__name__)
+
+_TYPES = {
+    'string': str,
+    'integer': int,
+    'number': (int, float),
+    'boolean': bool,
+    'object': dict,
+    'array': list,
+}
+
+def _compile_rule(rule):
+    """
+    Compile one declarative rule into a check returning a list of errors.
+
+    Supported keys: field, required, type, min_length, max_length, pattern,
+    enum, min, max.
+    """
+    field = rule['field']
+    required = rule.get('required', False)
+    expected_type = _TYPES.get(rule.get('type'))
+    pattern = re.compile(rule['pattern']) if rule.get('pattern') else None
+    enum = set(rule['enum']) if rule.get('enum') is not None else None
+    min_length, max_length = rule.get('min_length'), rule.get('max_length')
+    minimum, maximum = rule.get('min'), rule.get('max')
+
+    def check(payload):
+        value = payload.get(field)
+        if value is None:
+            return [f"{field} is required"] if required else []
+        if expected_type is not None:
+            # bool is an int subclass; do not accept it for numeric fields
+            if not isinstance(value, expected_type) or (
+                isinstance(value, bool) and rule.get('type') != 'boolean'
+            ):
+                return [f"{field} must be of type {rule['type']}"]
+        errors = []
+        if min_length is not None or max_length is not None:
+            # Rules without a type still only measure sized values
+            if not isinstance(value, (str, list, dict)):
+                return [f"{field} must be a string, array or object"]
+            if min_length is not None and len(value) < min_length:
+                errors.append(f"{field} must have at least {min_length} characters")
+            if max_length is not None and len(value) > max_length:
+                errors.append(f"{field} must have at most {max_length} characters")
+        if pattern is not None and not pattern.fullmatch(str(value)):
+            errors.append(f"{field} has an invalid format")
+        if enum is not None:
+            try:
+                allowed = value in enum
+            except TypeError:
+                # Unhashable values (lists, dicts) are never enum members
+                allowed = False
+            if not allowed:
+                errors.append(f"{field} must be one of {sorted(enum, key=str)}")
+        if minimum is not None or maximum is not None:
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                return errors + [f"{field} must be a number"]
+            if minimum is not None and value < minimum:
+                errors.append(f"{field} must be at least {minimum}")
+            if maximum is not None and value > maximum:
+                errors.append(f"{field} must be at most {maximum}")
+        return errors
+
+    return check
+
+class RuleBundle:
+    """A compiled, versioned set of rules for one model type"""
+
+    def __init__(self, model_type, version, rules, remote_required=False):
+        self.model_type = model_type
+        self.version = version
+        self.remote_required = remote_required
+        self.checks = [_compile_rule(rule) for rule in rules]
+        self.fetched_at = time.time()
+
+    def evaluate(self, payload):
+        errors = []
+        for check in self.checks:
+            errors.extend(check(payload))
+        return not errors, errors
+
+class LocalValidator:
+    """In-process validator backed by rule bundles from validation_service"""
+
+    def __init__(self, rules_url=None, validation_url=None, refresh_interval=60, timeout=2, token=None):
+        """
+        Initialize the validator
+
+        Args:
+            rules_url: Base URL serving bundles at ``<rules_url>/<model_type>``
+            validation_url: Remote validation endpoint used as fallback
+            refresh_interval: Seconds between background bundle refreshes
+            timeout: Timeout in seconds for bundle fetches
+            token: Service token sent to validation_service; without one the
+                caller's own Authorization header is forwarded, which the
+                background refresh does not have
+        """
+        self.token = token or os.environ.get('VALIDATION_SERVICE_TOKEN')
+        self.rules_url = rules_url or os.environ.get(
+            'VALIDATION_RULES_URL', 'http://localhost:5100/api/rules')
+        self.validation_url = validation_url or os.environ.get(
+            'VALIDATION_SERVICE_URL', 'http://localhost:5100/api/validate')
+        self.refresh_interval = refresh_interval
+        self.timeout = timeout
+        self._bundles = {}
+        self._failed_at = {}
+        self._lock = threading.Lock()
+        self._refresher = None
+        self._stop = threading.Event()
+
+    def _headers(self):
+        if self.token:
+            return {'Authorization': f"Bearer {self.token}"}
+        if has_request_context() and request.headers.get('Authorization'):
+            return {'Authorization': request.headers['Authorization']}
+        return {}
+
+    def _fetch_bundle(self, model_type, current=None):
+        """Fetch a bundle; returns ``current`` when it is still up to date."""
+        headers = self._headers()
+        if current is not None:
+            headers['If-None-Match'] = f'"{current.version}"'
+        resp = get_http_client().get(f"{self.rules_url}/{model_type}",
+                                     headers=headers, timeout=self.timeout)
+        if resp.status_code == 304 and current is not None:
+            current.fetched_at = time.time()
+            return current
         resp.raise_for_status()
         data = resp.json()
-        return data.get('valid', False), data.get('errors', [])
-    except Exception as e:
-        return False, [str(e)] 
\ No newline at end of file
+        return RuleBundle(model_type, data['version'], data.get('rules', []),
+                          data.get('remote_required', False))
+
+    def get_bundle(self, model_type):
+        """Get the cached bundle for a model type, fetching it on first use."""
+        bundle = self._bundles.get(model_type)
+        if bundle is not None:
+            return bundle
+        # Do not retry a failed fetch on every write
+        if time.time() - self._failed_at.get(model_type, 0) < self.refresh_interval:
+            return None
+        try:
+            bundle = self._fetch_bundle(model_type)
+        except Exception as e:
+            logger.warning(f"Could not load validation rules for {model_type}: {e}")
+            self._failed_at[model_type] = time.time()
+            return None
+        with self._lock:
+            self._bundles[model_type] = bundle
+            self._failed_at.pop(model_type, None)
+        self._ensure_refresher()
+        return bundle
+
+    def refresh(self):
+        """Re-fetch every known bundle, keeping the old one on failure."""
+        for model_type, bundle in list(self._bundles.items()):
+            try:
+                fresh = self._fetch_bundle(model_type, bundle)
+            except Exception as e:
+                logger.warning(f"Keeping validation rules {model_type}@{bundle.version}: {e}")
+                continue
+            if fresh is not bundle:
+                logger.info(f"Validation rules for {model_type} updated to {fresh.version}")
+                with self._lock:
+                    self._bundles[model_type] = fresh
+
+    def _ensure_refresher(self):
+        if self._refresher is not None:
+            return
+        with self._lock:
+            if self._refresher is not None:
+                return
+
+            def run():
+                while not self._stop.wait(self.refresh_interval):
+                    self.refresh()
+
+            self._refresher = threading.Thread(target=run, name='validation-rules-refresh', daemon=True)
+            self._refresher.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def validate_remote(self, payload, model_type):
+        try:
+            # Validation has no side effects, so it is safe to retry
+            resp = get_http_client().post(self.validation_url, json={
+                'model_type': model_type,
+                'payload': payload
+            }, headers=self._headers(), timeout=5, idempotent=True)
+            resp.raise_for_status()
+            data = resp.json()
+            return data.get('valid', False), data.get('errors', [])
+        except Exception as e:
+            return False, [str(e)]
+
+    def validate(self, payload, model_type):
+        bundle = self.get_bundle(model_type)
+        if bundle is None:
+            return self.validate_remote(payload, model_type)
+        valid, errors = bundle.evaluate(payload)
+        # A bundle without checks (e.g. an unknown model type) proves nothing
+        if valid and (bundle.remote_required or not bundle.checks):
+            return self.validate_remote(payload, model_type)
+        return valid, errors
+
+_validator = None
+_validator_lock = threading.Lock()
+
+def get_validator():
+    """Get the process-wide LocalValidator"""
+    global _validator
+    if _validator is None:
+        with _validator_lock:
+            if _validator is None:
+                _validator = LocalValidator(
+                    refresh_interval=float(os.environ.get('VALIDATION_RULES_REFRESH_INTERVAL', 60))
+                )
+    return _validator
+
+def validate_payload(payload, model_type):
+    if os.environ.get('VALIDATION_LOCAL_RULES', 'true').lower() != 'true':
+        return get_validator().validate_remote(payload, model_type)
+    return get_validator().validate(payload, model_type)
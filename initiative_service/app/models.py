@@ -1,5 +1,5 @@
 import uuid
-from common_utils.outbox import OutboxMixin
+from common_utils.outbox import OutboxMixin, OutboxEvent as OutboxEventBase
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 from sqlalchemy import Index
@@ -143,27 +143,6 @@ class InitiativeMember(db.Model):
 
 
 # Outbox Event model for cross-service data consistency
-class OutboxEvent(db.Model):
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    event_type = db.Column(db.String(100), nullable=False, index=True)
-    aggregate_type = db.Column(db.String(100), nullable=False)
-    aggregate_id = db.Column(db.String(36), nullable=False)
-    payload = db.Column(db.Text, nullable=False)
-    status = db.Column(db.String(20), default="pending", index=True)
-    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
-    processed_at = db.Column(db.DateTime, nullable=True)
-    error = db.Column(db.Text, nullable=True)
-    retry_count = db.Column(db.Integer, default=0)
-
-    @classmethod
-    def create_event(cls, session, event_type, aggregate_type, aggregate_id, payload):
-        """Create a new outbox event"""
-        import json
-        event = cls(
-            event_type=event_type,
-            aggregate_type=aggregate_type,
-            aggregate_id=str(aggregate_id),
-            payload=json.dumps(payload)
-        )
-        session.add(event)
-        return event
+class OutboxEvent(OutboxEventBase, db.Model):
+    # Keeps the table name the service's outbox was created with
+    __tablename__ = 'outbox_event'
@@ -1,39 +1,18 @@
 from . import db
-from common_utils.outbox import OutboxMixin
+from common_utils.outbox import OutboxMixin, OutboxEvent as OutboxEventBase
 import uuid
 import datetime
 from sqlalchemy import Column, String, Integer, Text, DateTime, Boolean, ForeignKey
 
 # Outbox Event model for data consistency
-class OutboxEvent(db.Model):
-    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    event_type = Column(String(100), nullable=False, index=True)
-    aggregate_type = Column(String(100), nullable=False)
-    aggregate_id = Column(String(36), nullable=False)
-    payload = Column(Text, nullable=False)
-    status = Column(String(20), default="pending", index=True)
-    created_at = Column(DateTime, default=datetime.datetime.utcnow)
-    processed_at = Column(DateTime, nullable=True)
-    error = Column(Text, nullable=True)
-    retry_count = Column(Integer, default=0)
-
-    @classmethod
-    def create_event(cls, session, event_type, aggregate_type, aggregate_id, payload):
-        """
-        Create a new outbox event
-        """
-        import json
-        event = cls(
-            event_type=event_type,
-            aggregate_type=aggregate_type,
-            aggregate_id=str(aggregate_id),
-            payload=json.dumps(payload)
-        )
-        session.add(event)
-        return event
+class OutboxEvent(OutboxEventBase, db.Model):
+    # Keeps the table name the service's outbox was created with
+    __tablename__ = 'outbox_event'
 
 class Capability(db.Model, OutboxMixin):
     __outbox_enabled__ = True
+    # capability_updated consumers route on the initiative context
+    __outbox_snapshot__ = ('initiative_context_id',)
     
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(128), nullable=False)
@@ -0,0 +1,145 @@
+import json
+import time
+import fakeredis
+import pytest
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+from common_utils.outbox import OutboxEvent as OutboxEventMixin, EventStatus
+from common_utils.event_stream import (
+    OutboxRelay, StreamConsumer, RedisStreamBroker, init_outbox_relay, stream_name,
+)
+from common_utils.consumer import Event
+
+db = SQLAlchemy()
+
+class OutboxEvent(OutboxEventMixin, db.Model):
+    pass
+
+@pytest.fixture
+def redis_client():
+    return fakeredis.FakeRedis(decode_responses=True)
+
+@pytest.fixture
+def relay_app(tmp_path):
+    """Create a minimal app with an outbox table on SQLite."""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'outbox.db'}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+def add_event(aggregate_id, seq, event_type='thing_updated'):
+    event = OutboxEvent.create_event(db.session, event_type, 'thing', aggregate_id, {'seq': seq})
+    db.session.commit()
+    return event
+
+def stream_events(redis_client):
+    return [(fields['event_type'], fields['aggregate_id'], json.loads(fields['payload']))
+            for _, fields in redis_client.xrange(stream_name('thing'))]
+
+def test_relay_publishes_each_event_once(relay_app, redis_client):
+    """Test an event relayed twice (e.g. after a crash) is added to the stream once."""
+    event = add_event('a', 1)
+    relay = OutboxRelay(redis_client)
+    assert relay.publish(event) is not None
+    assert relay.publish(event) is None
+    assert stream_events(redis_client) == [('thing_updated', 'a', {'seq': 1})]
+
+def test_relay_is_a_stage_of_the_single_processor(relay_app, redis_client):
+    """Test the relay shares the app's processor and runs after handlers."""
+    handled = []
+    relay = init_outbox_relay(relay_app, db, OutboxEvent, redis_client=redis_client)
+    processor = relay_app.extensions['outbox_processor']
+    processor.register_handler('thing_updated', lambda aggregate_id, payload, event: handled.append(payload['seq']))
+    assert relay_app.extensions['outbox_relay'] is relay
+    assert processor.stages == [relay.handle]
+
+    add_event('a', 1)
+    add_event('a', 2, event_type='thing_renamed')
+    assert processor.process_pending_events() == 2
+    assert handled == [1]
+    assert stream_events(redis_client) == [
+        ('thing_updated', 'a', {'seq': 1}),
+        ('thing_renamed', 'a', {'seq': 2}),
+    ]
+    assert OutboxEvent.query.filter_by(status=EventStatus.COMPLETED.value).count() == 2
+
+def test_relay_failure_fails_the_event(relay_app, redis_client):
+    """Test an event is retried when it could not be relayed."""
+    relay = init_outbox_relay(relay_app, db, OutboxEvent, redis_client=redis_client)
+    processor = relay_app.extensions['outbox_processor']
+
+    def unavailable(*args, **kwargs):
+        raise ConnectionError('redis down')
+
+    relay._publish = unavailable
+    add_event('a', 1)
+    assert processor.process_pending_events() == 0
+    event = OutboxEvent.query.one()
+    assert event.status == EventStatus.FAILED.value
+    assert event.error == 'redis down'
+    assert stream_events(redis_client) == []
+
+def test_consumer_acks_handled_messages(redis_client):
+    """Test handled and uninteresting messages are acked, failures stay pending."""
+    seen = []
+
+    def handler(aggregate_id, payload, message):
+        if payload['seq'] == 2:
+            raise RuntimeError('boom')
+        seen.append((aggregate_id, payload['seq']))
+
+    consumer = StreamConsumer('search', ['thing'], {'thing_updated': handler},
+                              redis_client=redis_client, block_ms=10, start_id='0')
+    consumer.ensure_groups()
+    stream = stream_name('thing')
+    for seq, event_type in ((1, 'thing_updated'), (2, 'thing_updated'), (3, 'thing_deleted')):
+        redis_client.xadd(stream, {'event_type': event_type, 'aggregate_id': 'a',
+                                   'payload': json.dumps({'seq': seq})})
+
+    assert consumer.poll() == 2
+    assert seen == [('a', 1)]
+    pending = redis_client.xpending(stream, 'search')
+    assert pending['pending'] == 1
+
+def test_consumer_retries_then_dead_letters(redis_client):
+    """Test pending messages are reclaimed and dead-lettered after max deliveries."""
+    attempts = []
+
+    def handler(aggregate_id, payload, message):
+        attempts.append(payload['seq'])
+        raise RuntimeError('boom')
+
+    consumer = StreamConsumer('search', ['thing'], {'thing_updated': handler},
+                              redis_client=redis_client, block_ms=10, claim_idle_ms=1,
+                              max_deliveries=2, start_id='0')
+    consumer.ensure_groups()
+    stream = stream_name('thing')
+    redis_client.xadd(stream, {'event_type': 'thing_updated', 'aggregate_id': 'a',
+                               'payload': json.dumps({'seq': 1})})
+
+    assert consumer.poll() == 0
+    time.sleep(0.01)
+    assert consumer.reclaim() == 0
+    assert attempts == [1, 1]
+    time.sleep(0.01)
+    consumer.reclaim()
+    assert redis_client.xpending(stream, 'search')['pending'] == 0
+    dead = redis_client.xrange(f"{stream}:dead")
+    assert len(dead) == 1
+    assert dead[0][1]['group'] == 'search'
+
+def test_broker_round_trip(redis_client):
+    """Test the EventConsumer broker publishes, fetches and acks stream messages."""
+    broker = RedisStreamBroker(redis_client, start_id='0')
+    broker.subscribe('billing', ['thing'])
+    broker.publish(Event('thing_updated', 'thing', 'a', {'seq': 1}, event_id='e1'))
+
+    events = broker.fetch('billing', timeout=0.01)
+    assert [(e.event_id, e.aggregate_id, e.payload) for e in events] == [('e1', 'a', {'seq': 1})]
+    broker.ack('billing', events)
+    assert redis_client.xpending(stream_name('thing'), 'billing')['pending'] == 0
+    assert broker.fetch('billing', timeout=0.01) == []
@@ -0,0 +1,452 @@
+import json
+import datetime
+import threading
+import pytest
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import Column, String
+from sqlalchemy.orm import declarative_base
+from common_utils.outbox import (
+    OutboxEvent as OutboxEventMixin, OutboxMixin, OutboxProcessor, EventStatus, configure_outbox_hooks,
+    ProcessedEvent as ProcessedEventBase, bulk_event_handler, OutboxRetention,
+    OutboxArchive as OutboxArchiveBase, check_outbox_model,
+)
+
+db = SQLAlchemy()
+
+class OutboxEvent(OutboxEventMixin, db.Model):
+    pass
+
+class OutboxArchive(OutboxArchiveBase, db.Model):
+    pass
+
+@pytest.fixture
+def outbox_app(tmp_path):
+    """Create a minimal app with an outbox table on SQLite."""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'outbox.db'}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+def add_events(*specs):
+    for aggregate_id, seq in specs:
+        OutboxEvent.create_event(db.session, 'thing_updated', 'thing', aggregate_id, {'seq': seq})
+        db.session.flush()
+    db.session.commit()
+
+def test_claim_batch_leases_events(outbox_app):
+    """Test claimed events are leased and not claimed twice."""
+    add_events(('a', 1), ('b', 1))
+    processor = OutboxProcessor(db, OutboxEvent, worker_id='worker-1')
+
+    claimed = processor.claim_batch(limit=10)
+    assert len(claimed) == 2
+    assert processor.claim_batch(limit=10) == []
+
+    row = OutboxEvent.query.first()
+    assert row.status == EventStatus.PROCESSING.value
+    assert row.locked_by == 'worker-1'
+    assert row.locked_until is not None
+
+def test_parallel_workers_preserve_aggregate_order(outbox_app):
+    """Test events of one aggregate are handled in order by one worker."""
+    add_events(*[(agg, seq) for seq in range(5) for agg in ('a', 'b', 'c')])
+    seen = {}
+    lock = threading.Lock()
+
+    def handler(aggregate_id, payload, event):
+        with lock:
+            seen.setdefault(aggregate_id, []).append(payload['seq'])
+
+    processor = OutboxProcessor(db, OutboxEvent, {'thing_updated': handler}, workers=3)
+    try:
+        assert processor.process_pending_events(limit=100) == 15
+    finally:
+        processor.stop()
+
+    assert seen == {agg: list(range(5)) for agg in ('a', 'b', 'c')}
+    assert OutboxEvent.query.filter_by(status=EventStatus.COMPLETED.value).count() == 15
+
+def test_failure_holds_back_later_events_of_aggregate(outbox_app):
+    """Test a failed event stops later events of its aggregate in the batch."""
+    add_events(('a', 1), ('a', 2), ('b', 1))
+
+    def handler(aggregate_id, payload, event):
+        if aggregate_id == 'a' and payload['seq'] == 1:
+            raise RuntimeError('boom')
+
+    processor = OutboxProcessor(db, OutboxEvent, {'thing_updated': handler})
+    assert processor.process_pending_events() == 1
+
+    statuses = sorted(
+        (e.aggregate_id, json.loads(e.payload)['seq'], e.status) for e in OutboxEvent.query.all()
+    )
+    assert statuses == [
+        ('a', 1, EventStatus.FAILED.value),
+        ('a', 2, EventStatus.PENDING.value),
+        ('b', 1, EventStatus.COMPLETED.value),
+    ]
+
+def test_released_events_wait_for_failed_predecessor(outbox_app):
+    """Test events held back by a failure are not claimed before it is retried."""
+    add_events(('a', 1), ('a', 2), ('b', 1))
+    handled = []
+
+    def handler(aggregate_id, payload, event):
+        if aggregate_id == 'a' and payload['seq'] == 1 and not handled:
+            handled.append('fail')
+            raise RuntimeError('boom')
+        handled.append((aggregate_id, payload['seq']))
+
+    processor = OutboxProcessor(db, OutboxEvent, {'thing_updated': handler}, retry_backoff_base=60)
+    assert processor.process_pending_events() == 1
+    add_events(('a', 3), ('b', 2))
+    # a/2 and a/3 stay behind a/1 while it waits out its retry delay
+    assert processor.process_pending_events() == 1
+    assert handled == ['fail', ('b', 1), ('b', 2)]
+
+    failed = OutboxEvent.query.filter_by(status=EventStatus.FAILED.value).one()
+    failed.next_attempt_at = datetime.datetime.utcnow()
+    db.session.commit()
+    assert processor.process_pending_events() == 3
+    assert handled[3:] == [('a', 1), ('a', 2), ('a', 3)]
+
+def test_batch_uses_constant_number_of_transactions(outbox_app):
+    """Test a batch costs one claim and one write-back, not two commits per event."""
+    from sqlalchemy import event as sa_event
+
+    add_events(*[(str(i % 7), i) for i in range(50)])
+
+    def handler(aggregate_id, payload, event):
+        if payload['seq'] == 3:
+            raise RuntimeError('boom')
+
+    processor = OutboxProcessor(db, OutboxEvent, {'thing_updated': handler})
+    commits = []
+    engine = db.engine
+    listener = lambda conn: commits.append(1)
+    sa_event.listen(engine, 'commit', listener)
+    try:
+        assert processor.process_pending_events(limit=100) == 49 - 6
+    finally:
+        sa_event.remove(engine, 'commit', listener)
+
+    assert len(commits) == 2
+    failed = OutboxEvent.query.filter_by(status=EventStatus.FAILED.value).one()
+    assert failed.retry_count == 1
+    assert failed.error == 'boom'
+
+def test_completed_events_can_be_deleted(outbox_app):
+    """Test on_complete='delete' removes processed rows."""
+    add_events(('a', 1), ('b', 1))
+    processor = OutboxProcessor(
+        db, OutboxEvent, {'thing_updated': lambda *args: None}, on_complete='delete'
+    )
+    assert processor.process_pending_events() == 2
+    assert OutboxEvent.query.count() == 0
+
+def test_commit_wakes_idle_processor(outbox_app):
+    """Test a processor sleeping between polls wakes up on commit."""
+    import time
+
+    configure_outbox_hooks(OutboxEvent)
+    handled = threading.Event()
+    processor = OutboxProcessor(db, OutboxEvent, {'thing_updated': lambda *args: handled.set()})
+    processor.start(outbox_app, interval=30)
+    try:
+        time.sleep(0.2)
+        add_events(('a', 1))
+        assert handled.wait(5)
+    finally:
+        processor.stop(timeout=5)
+
+def test_failed_events_back_off_then_dead_letter(outbox_app):
+    """Test failures are scheduled with backoff and dead-lettered when exhausted."""
+    import datetime
+
+    add_events(('a', 1))
+    attempts = []
+
+    def handler(aggregate_id, payload, event):
+        attempts.append(event.retry_count)
+        raise RuntimeError('downstream unavailable')
+
+    processor = OutboxProcessor(db, OutboxEvent, {'thing_updated': handler},
+                                max_retries=2, retry_backoff_base=60)
+    processor.process_pending_events()
+    event = OutboxEvent.query.one()
+    assert event.status == EventStatus.FAILED.value
+    assert event.next_attempt_at > datetime.datetime.utcnow() + datetime.timedelta(seconds=25)
+
+    # Not due yet, so the next round does not retry it
+    assert processor.process_pending_events() == 0
+    assert attempts == [0]
+
+    event.next_attempt_at = datetime.datetime.utcnow()
+    db.session.commit()
+    processor.process_pending_events()
+    db.session.expire_all()
+    assert OutboxEvent.query.one().status == EventStatus.DEAD_LETTER.value
+    assert [e.id for e in processor.dead_letters()] == [event.id]
+
+    processor.handlers['thing_updated'] = lambda *args: None
+    assert processor.replay_dead_letters(event_type='thing_updated') == 1
+    assert processor.process_pending_events() == 1
+    db.session.expire_all()
+    assert OutboxEvent.query.one().status == EventStatus.COMPLETED.value
+
+class Thing(OutboxMixin, db.Model):
+    __tablename__ = 'thing'
+    __outbox_snapshot__ = ('owner',)
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50))
+    owner = db.Column(db.String(50))
+    note = db.Column(db.Text)
+
+def captured_events():
+    return [(e.event_type, e.aggregate_id, json.loads(e.payload))
+            for e in OutboxEvent.query.order_by(OutboxEvent.created_at)]
+
+def test_outbox_model_without_processor_columns_is_rejected():
+    """Test an outbox table predating the lease and retry columns fails at startup."""
+    class LegacyOutboxEvent(declarative_base()):
+        __tablename__ = 'outbox_event'
+        id = Column(String(36), primary_key=True)
+        status = Column(String(20))
+        headers = Column(String)
+
+    with pytest.raises(ValueError, match='locked_by, locked_until, next_attempt_at'):
+        check_outbox_model(LegacyOutboxEvent)
+    with pytest.raises(ValueError):
+        OutboxProcessor(db, LegacyOutboxEvent)
+    assert check_outbox_model(OutboxEvent) is OutboxEvent
+
+def test_hooks_capture_only_changed_columns(outbox_app):
+    """Test updates carry changed columns plus the opted-in snapshot columns."""
+    configure_outbox_hooks(OutboxEvent)
+    thing = Thing(name='a', owner='x', note='long text ' * 100)
+    db.session.add(thing)
+    db.session.commit()
+    OutboxEvent.query.delete()
+    db.session.commit()
+
+    thing.name = 'b'
+    db.session.flush()
+    thing.name = 'c'
+    db.session.flush()
+    db.session.commit()
+
+    assert captured_events() == [
+        ('thing_updated', str(thing.id),
+         {'id': thing.id, 'changes': {'name': 'c'}, 'full_object': {'owner': 'x'}}),
+    ]
+
+def test_hooks_coalesce_create_update_and_delete(outbox_app):
+    """Test flushes of one object in a transaction produce one event."""
+    configure_outbox_hooks(OutboxEvent)
+    kept = Thing(name='a', owner='x')
+    dropped = Thing(name='tmp')
+    db.session.add_all([kept, dropped])
+    db.session.flush()
+    kept.note = 'n'
+    db.session.delete(dropped)
+    db.session.commit()
+
+    assert captured_events() == [
+        ('thing_created', str(kept.id), {'id': kept.id, 'name': 'a', 'owner': 'x', 'note': 'n'}),
+    ]
+
+class ProcessedEvent(ProcessedEventBase, db.Model):
+    pass
+
+def test_handler_writes_are_committed(outbox_app):
+    """Test writes a handler leaves in the session survive the batch."""
+    add_events(('a', 1))
+
+    def handler(aggregate_id, payload, event):
+        db.session.add(ProcessedEvent(consumer='projection', event_id=event.id))
+
+    processor = OutboxProcessor(db, OutboxEvent, {'thing_updated': handler})
+    assert processor.process_pending_events(limit=10) == 1
+    db.session.remove()
+    assert ProcessedEvent.query.filter_by(consumer='projection').count() == 1
+
+def test_bulk_event_handler_fans_out_once(outbox_app):
+    """Test a bulk handler emits all events in one go and skips redeliveries."""
+    add_events(('source', 1))
+    source = OutboxEvent.query.one()
+
+    @bulk_event_handler(db, OutboxEvent, ProcessedEvent, consumer='test', chunk_size=40)
+    def fan_out(event, payload):
+        for i in range(100):
+            yield {'event_type': 'child_updated', 'aggregate_type': 'child',
+                   'aggregate_id': i, 'payload': {'seq': payload['seq']}}
+
+    assert fan_out(source) == 100
+    assert fan_out('source', {'seq': 1}, source) == 0
+    assert OutboxEvent.query.filter_by(event_type='child_updated').count() == 100
+    assert ProcessedEvent.query.filter_by(consumer='test', event_id=source.id).count() == 1
+
+def test_bulk_event_handler_rolls_back_on_error(outbox_app):
+    """Test a failing bulk handler emits nothing and can be retried."""
+    add_events(('source', 1))
+    source = OutboxEvent.query.one()
+
+    @bulk_event_handler(db, OutboxEvent, ProcessedEvent, consumer='test', chunk_size=2)
+    def fan_out(event, payload):
+        for i in range(5):
+            yield {'event_type': 'child_updated', 'aggregate_type': 'child',
+                   'aggregate_id': i, 'payload': {}}
+        raise RuntimeError('boom')
+
+    with pytest.raises(RuntimeError):
+        fan_out(source)
+    assert OutboxEvent.query.filter_by(event_type='child_updated').count() == 0
+    assert ProcessedEvent.query.count() == 0
+
+def age_events(days, **filters):
+    old = datetime.datetime.utcnow() - datetime.timedelta(days=days)
+    OutboxEvent.query.filter_by(**filters).update(
+        {'status': EventStatus.COMPLETED.value, 'processed_at': old})
+    db.session.commit()
+
+def test_retention_archives_old_completed_events(outbox_app):
+    """Test old completed events move to the archive table in chunks, tagged by month."""
+    add_events(*[(str(i), i) for i in range(5)], ('pending', 0))
+    for i in range(5):
+        age_events(30, aggregate_id=str(i))
+
+    retention = OutboxRetention(db, OutboxEvent, retention_days=7, chunk_size=2,
+                                archive_model=OutboxArchive)
+    assert retention.run_once() == 5
+    assert [e.aggregate_id for e in OutboxEvent.query] == ['pending']
+
+    period = (datetime.datetime.utcnow() - datetime.timedelta(days=30)).strftime('%Y%m')
+    archived = OutboxArchive.query.order_by(OutboxArchive.aggregate_id).all()
+    assert [(e.aggregate_id, e.period) for e in archived] == [(str(i), period) for i in range(5)]
+    assert json.loads(archived[0].payload) == {'seq': 0}
+
+def test_retention_writes_ndjson(outbox_app, tmp_path):
+    """Test NDJSON archiving writes gzipped event lines and keeps recent events."""
+    import gzip
+
+    add_events(('old', 1), ('recent', 2))
+    age_events(30, aggregate_id='old')
+    age_events(1, aggregate_id='recent')
+
+    archive_dir = tmp_path / 'archive'
+    assert OutboxRetention(db, OutboxEvent, mode='ndjson', archive_dir=str(archive_dir)).run_once() == 1
+    (path,) = archive_dir.iterdir()
+    with gzip.open(path, 'rt') as fh:
+        records = [json.loads(line) for line in fh]
+    assert [r['aggregate_id'] for r in records] == ['old']
+    assert [e.aggregate_id for e in OutboxEvent.query] == ['recent']
+
+def test_derived_events_inherit_origin(outbox_app):
+    """Test events emitted while handling an event keep the original origin timestamp."""
+    add_events(('source', 1))
+    source = OutboxEvent.query.one()
+    origin = json.loads(source.headers)['origin_ts']
+
+    @bulk_event_handler(db, OutboxEvent, consumer='test')
+    def fan_out(event, payload):
+        yield {'event_type': 'child_updated', 'aggregate_type': 'child',
+               'aggregate_id': 'c', 'payload': {}}
+
+    processor = OutboxProcessor(db, OutboxEvent, {'thing_updated': fan_out})
+    assert processor.process_pending_events() == 1
+    child = OutboxEvent.query.filter_by(event_type='child_updated').one()
+    assert json.loads(child.headers)['origin_ts'] == origin
+
+def test_replay_streams_archives_then_live_and_resumes(outbox_app, tmp_path):
+    """Test replay covers archived and live events in order and resumes from its checkpoint."""
+    from common_utils.replay import OutboxReplay, FileCheckpointStore
+
+    add_events(*[(agg, seq) for seq in range(3) for agg in ('a', 'b')])
+    age_events(30)
+    OutboxRetention(db, OutboxEvent, archive_model=OutboxArchive).run_once()
+    add_events(('a', 3), ('b', 3))
+
+    seen = {}
+    lock = threading.Lock()
+
+    def handler(aggregate_id, payload, event):
+        with lock:
+            seen.setdefault(aggregate_id, []).append(payload['seq'])
+
+    def replay():
+        return OutboxReplay(db, OutboxEvent, {'thing_updated': handler}, 'rebuild', workers=2,
+                            page_size=2, checkpoints=FileCheckpointStore(str(tmp_path / 'cp')))
+
+    assert replay().run(outbox_app, limit=4) == 4
+    assert replay().run(outbox_app) == 4
+    assert seen == {'a': [0, 1, 2, 3], 'b': [0, 1, 2, 3]}
+    assert replay().run(outbox_app) == 0
+
+def test_replay_resumes_ndjson_archive_by_line(outbox_app, tmp_path):
+    """Test an archive written out of creation order resumes without skipping events."""
+    from common_utils.replay import OutboxReplay, FileCheckpointStore
+
+    add_events(('a', 1), ('b', 1))
+    # b was created after a but processed, and so archived, first on the same day
+    for aggregate_id, hour in (('b', 9), ('a', 10)):
+        OutboxEvent.query.filter_by(aggregate_id=aggregate_id).update(
+            {'status': EventStatus.COMPLETED.value, 'processed_at': datetime.datetime(2020, 1, 1, hour)})
+    db.session.commit()
+    archive_dir = str(tmp_path / 'archive')
+    OutboxRetention(db, OutboxEvent, mode='ndjson', archive_dir=archive_dir).run_once()
+
+    seen = []
+
+    def replay():
+        return OutboxReplay(db, OutboxEvent, {'thing_updated': lambda *args: seen.append(args[0])},
+                            'rebuild', workers=1, page_size=1, archive_dir=archive_dir,
+                            checkpoints=FileCheckpointStore(str(tmp_path / 'cp')))
+
+    assert replay().run(outbox_app, limit=1) == 1
+    assert replay().run(outbox_app) == 1
+    assert seen == ['b', 'a']
+
+def test_replay_rejects_event_types_without_handler(outbox_app):
+    """Test an unknown event type fails before anything is replayed."""
+    from common_utils.replay import OutboxReplay
+
+    with pytest.raises(ValueError, match='thing_deleted'):
+        OutboxReplay(db, OutboxEvent, {'thing_updated': print}, 'rebuild',
+                     event_types=['thing_updated', 'thing_deleted'])
+
+def test_lease_is_renewed_while_batch_runs(outbox_app):
+    """Test a batch outliving its lease is not reclaimed by another processor."""
+    add_events(('a', 1), ('b', 1))
+    other = OutboxProcessor(db, OutboxEvent, worker_id='worker-2')
+    stolen = []
+
+    def slow_handler(aggregate_id, payload, event):
+        if aggregate_id == 'a':
+            # Outlive the original lease, then try to claim the batch again
+            threading.Event().wait(1.5)
+            with outbox_app.app_context():
+                stolen.extend(other.claim_batch(limit=10))
+
+    processor = OutboxProcessor(db, OutboxEvent, {'thing_updated': slow_handler},
+                                lease_seconds=1, worker_id='worker-1')
+    assert processor.process_pending_events() == 2
+    assert stolen == []
+    assert OutboxEvent.query.filter_by(status=EventStatus.COMPLETED.value).count() == 2
+
+def test_replay_below_one_event_per_second(outbox_app, tmp_path):
+    """Test a fractional rate still replays, one event per page."""
+    from common_utils.replay import OutboxReplay, FileCheckpointStore
+
+    add_events(('a', 1))
+    seen = []
+    replay = OutboxReplay(db, OutboxEvent, {'thing_updated': lambda *args: seen.append(args[1])},
+                          'slow', workers=1, rate=0.5, checkpoints=FileCheckpointStore(str(tmp_path / 'cp')))
+    assert replay.page_size == 1
+    assert replay.run(outbox_app) == 1
+    assert seen == [{'seq': 1}]
@@ -34,6 +34,9 @@ def create_app(config_name="development"):
         enable_metrics=True
     )
     db.init_app(app)
+    # Start consuming domain events
+    from .events import init_events
+    init_events(app)
     # Register blueprints
     app.register_blueprint(technology_bp)
     # Register error handlers
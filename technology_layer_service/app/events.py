@@ -1,42 +1,62 @@
 """
-Event publishing and consuming stubs for technology_layer_service.
-Adapt these to your event broker (e.g., Kafka, Redis, RabbitMQ) as needed.
+Event publishing and consuming for technology_layer_service.
+
+Events go through the app's event broker (``EVENT_BROKER`` config, see
+``common_utils.consumer``); handlers registered with ``handle_event`` are
+run by the service's ``EventConsumer``.
 """
 
 import logging
+from common_utils.consumer import Event, EventConsumer, get_event_broker
 
 logger = logging.getLogger(__name__)
 
-def emit_event(event_type, payload):
+AGGREGATE_TYPE = 'technology'
+
+consumer = EventConsumer('technology_layer_service')
+
+def emit_event(event_type, payload, aggregate_type=AGGREGATE_TYPE, aggregate_id=None):
     """
     Publish an event to the event bus.
     Args:
         event_type (str): The type of event (e.g., 'node_created')
         payload (dict): The event payload
+        aggregate_type (str): Topic the event is published on
+        aggregate_id: Aggregate the event belongs to; events of one
+            aggregate are consumed in order (defaults to payload['id'])
     """
-    logger.info(f"Emitting event: {event_type} | Payload: {payload}")
-    # TODO: Integrate with your event broker here
-    pass
+    if aggregate_id is None:
+        aggregate_id = payload.get('id')
+    logger.info(f"Emitting event: {event_type} | {aggregate_type}:{aggregate_id}")
+    get_event_broker().publish(Event(event_type, aggregate_type, aggregate_id, payload))
 
-def handle_event(event_type, handler_func):
+def handle_event(event_type, handler_func, aggregate_type=AGGREGATE_TYPE, batch=False):
     """
     Register a handler for a specific event type.
     Args:
         event_type (str): The type of event to handle
-        handler_func (callable): The function to call when the event is received
+        handler_func (callable): Called with the Event (or a list of
+            events when ``batch`` is True)
+        aggregate_type (str): Topic the event is published on
+        batch (bool): Deliver events in batches
     """
     logger.info(f"Registering handler for event: {event_type}")
-    # TODO: Integrate with your event broker's subscription mechanism
-    pass
+    return consumer.subscribe(aggregate_type, [event_type], batch=batch)(handler_func)
+
+def init_events(app):
+    """Start consuming if any handlers were registered"""
+    if consumer.subscriptions:
+        consumer.start(app)
+    return consumer
 
 # Example usage for CRUD events (extend as needed)
 def emit_node_created(node):
-    emit_event('node_created', node.to_dict())
+    emit_event('node_created', node.to_dict(), 'node', node.id)
 
 def emit_node_updated(node):
-    emit_event('node_updated', node.to_dict())
+    emit_event('node_updated', node.to_dict(), 'node', node.id)
 
 def emit_node_deleted(node_id):
-    emit_event('node_deleted', {'id': node_id})
+    emit_event('node_deleted', {'id': node_id}, 'node', node_id)
 
-# Repeat for other models as needed... 
\ No newline at end of file
+# Repeat for other models as needed...
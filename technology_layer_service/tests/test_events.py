@@ -0,0 +1,75 @@
+import threading
+import time
+import pytest
+from flask import Flask
+from common_utils.consumer import Event, EventConsumer, InMemoryBroker
+
+@pytest.fixture
+def app():
+    return Flask(__name__)
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+def test_consumer_keeps_order_per_aggregate(app):
+    """Test events of one aggregate are handled in order across parallel workers."""
+    broker = InMemoryBroker()
+    consumer = EventConsumer('test', broker, workers=4, poll_timeout=0.05)
+    seen = {}
+    threads = {}
+    lock = threading.Lock()
+
+    @consumer.subscribe('node', ['node_updated'])
+    def on_update(event):
+        with lock:
+            seen.setdefault(event.aggregate_id, []).append(event.payload['seq'])
+            threads.setdefault(event.aggregate_id, set()).add(threading.current_thread().name)
+
+    consumer.start(app)
+    try:
+        for seq in range(20):
+            for node_id in range(8):
+                broker.publish(Event('node_updated', 'node', node_id, {'seq': seq}))
+        wait_for(lambda: consumer.stats()['processed'] == 160)
+    finally:
+        consumer.stop(timeout=5)
+
+    assert all(seqs == list(range(20)) for seqs in seen.values())
+    assert all(len(names) == 1 for names in threads.values())
+    assert len(set().union(*threads.values())) > 1
+    assert broker.acked['test'] == 160
+
+def test_batch_subscription_and_dead_letters(app):
+    """Test batch handlers get lists and failing events are dead-lettered after retries."""
+    broker = InMemoryBroker()
+    consumer = EventConsumer('test', broker, workers=1, max_retries=1,
+                             retry_backoff=0, poll_timeout=0.05)
+    batches = []
+    attempts = []
+
+    @consumer.subscribe('node', batch=True)
+    def on_batch(events):
+        batches.append([e.event_type for e in events])
+
+    @consumer.subscribe('node', ['node_deleted'])
+    def on_delete(event):
+        attempts.append(event.aggregate_id)
+        raise RuntimeError('boom')
+
+    broker.subscribe('test', consumer.topics)
+    broker.publish(Event('node_created', 'node', 1, {}))
+    broker.publish(Event('node_deleted', 'node', 1, {}))
+    broker.publish(Event('node_created', 'device', 2, {}))
+    consumer.start(app)
+    try:
+        wait_for(lambda: consumer.stats()['processed'] == 2)
+    finally:
+        consumer.stop(timeout=5)
+
+    assert batches == [['node_created', 'node_deleted']]
+    assert attempts == ['1', '1']
+    assert [(group, e.event_type) for group, e, _ in broker.dead_letters] == [('test', 'node_deleted')]
+    assert consumer.stats()['failed'] == 1
@@ -7,7 +7,7 @@ from common_utils.monitoring import init_metrics
 from common_utils.errors import register_error_handlers
 from common_utils.config import load_config
 from common_utils.traceability import log_audit_event
-from .routes import bp
+from .routes import bp, validation_bp
 import logging
 import os
 
@@ -18,6 +18,8 @@ def create_app(config_name="development"):
     metrics = init_metrics(app)
     register_error_handlers(app)
     app.config['OPA_URL'] = os.environ.get('OPA_URL', 'http://localhost:8181/v1/data/validation/allow')
+    app.config['OPA_BUNDLE_REVISION'] = os.environ.get('OPA_BUNDLE_REVISION')
+    app.register_blueprint(validation_bp)
     app.register_blueprint(bp)
     if not os.path.exists('logs'):
         os.makedirs('logs')
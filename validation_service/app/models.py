@@ -8,6 +8,11 @@ class Policy(db.Model):
     description = db.Column(db.Text)
     policy_text = db.Column(db.Text, nullable=False)
     is_active = db.Column(db.Boolean, default=True)
+    # Declarative field rules clients can evaluate in-process; policies
+    # without them are only enforced by OPA through /validate.
+    model_type = db.Column(db.String(64), index=True)
+    rules = db.Column(db.JSON)
+    updated_at = db.Column(db.DateTime, server_default=db.func.now(), onupdate=db.func.now())
 
 class ValidationLog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
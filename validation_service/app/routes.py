@@ -1,29 +1,24 @@
 from flask import Blueprint, request, jsonify, current_app
-import requests
 import logging
 from flask_jwt_extended import jwt_required
 from .models import db
-from .services import PolicyService
+from .services import PolicyService, RuleBundleService, DecisionService
 from .schemas import PolicySchema
 from flasgger import swag_from
 from common_utils.auth import rbac_required
 from common_utils.traceability import log_audit_event
 
-bp = Blueprint('validation', __name__)
+validation_bp = Blueprint('validation', __name__)
 
-@bp.route('/validate', methods=['POST'])
+@validation_bp.route('/validate', methods=['POST'])
 @rbac_required(roles=['admin', 'validator'])
 @swag_from({})
 def validate():
     payload = request.json
-    opa_url = current_app.config['OPA_URL']
     # Call OPA for policy validation
-    opa_input = {'input': payload}
     try:
-        opa_response = requests.post(opa_url, json=opa_input)
-        opa_result = opa_response.json()
-        allowed = opa_result.get('result', False)
-        log_msg = f"OPA validation: allowed={allowed}, input={payload}"
+        allowed, cached = DecisionService.evaluate(payload)
+        log_msg = f"OPA validation: allowed={allowed}, cached={cached}, input={payload}"
         logging.info(log_msg)
         if not allowed:
             return jsonify({'allowed': False, 'reason': 'OPA policy denied'}), 403
@@ -35,6 +30,37 @@ def validate():
     log_audit_event(current_app.logger, 'validate', {'details': 'Validation performed'})
     return jsonify({'allowed': True, 'reason': 'OPA policy allowed'}), 200
 
+@validation_bp.route('/validate/batch', methods=['POST'])
+@rbac_required(roles=['admin', 'validator'])
+@swag_from({})
+def validate_batch():
+    """Validate many inputs in one call"""
+    inputs = (request.get_json() or {}).get('inputs')
+    if not isinstance(inputs, list):
+        return jsonify({'error': 'inputs must be a list'}), 400
+    max_size = current_app.config.get('VALIDATION_BATCH_MAX', 500)
+    if len(inputs) > max_size:
+        return jsonify({'error': f'At most {max_size} inputs per batch'}), 400
+    results = []
+    for allowed, error in DecisionService.evaluate_batch(inputs):
+        if error:
+            results.append({'allowed': False, 'reason': 'OPA error'})
+        else:
+            results.append({'allowed': allowed, 'reason': 'OPA policy allowed' if allowed else 'OPA policy denied'})
+    log_audit_event(current_app.logger, 'validate_batch', {'details': f'Batch validation of {len(inputs)} inputs'})
+    return jsonify({'results': results}), 200
+
+@validation_bp.route('/rules/<model_type>', methods=['GET'])
+@rbac_required(roles=['admin', 'validator'])
+@swag_from({})
+def get_rule_bundle(model_type):
+    """Serve the versioned rule bundle for client-side validation"""
+    bundle = RuleBundleService.get_bundle(model_type)
+    etag = f'"{bundle["version"]}"'
+    if request.headers.get('If-None-Match') == etag:
+        return '', 304, {'ETag': etag}
+    return jsonify(bundle), 200, {'ETag': etag, 'Cache-Control': 'no-cache'}
+
 bp = Blueprint('policy', __name__, url_prefix='/policies')
 
 @swag_from({})
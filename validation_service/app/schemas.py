@@ -6,6 +6,8 @@ class PolicySchema(Schema):
     description = fields.Str()
     policy_text = fields.Str(required=True)
     is_active = fields.Bool()
+    model_type = fields.Str(allow_none=True)
+    rules = fields.List(fields.Dict(), allow_none=True)
 
 class ValidationLogSchema(Schema):
     id = fields.Int(dump_only=True)
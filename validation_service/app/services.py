@@ -1,11 +1,36 @@
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from sqlalchemy import func
+from common_utils.cache import LocalTTLCache
+from common_utils.http import get_http_client
 from .models import db, Policy, ValidationLog
 
+# OPA decisions keyed by (policy version, canonical input hash). Policy
+# writes bump the version; the TTL bounds staleness for writes made
+# through other replicas.
+_decision_cache = LocalTTLCache(maxsize=50000, ttl=60)
+_policy_version = 0
+_policy_version_lock = threading.Lock()
+# (local version, expires at, digest) of the last policy table check
+_stored_version = (None, 0.0, None)
+
+def _bump_policy_version():
+    global _policy_version
+    with _policy_version_lock:
+        _policy_version += 1
+    _decision_cache.clear()
+
 class PolicyService:
     @staticmethod
     def create(data):
         policy = Policy(**data)
         db.session.add(policy)
         db.session.commit()
+        _bump_policy_version()
         return policy
 
     @staticmethod
@@ -20,6 +45,7 @@ class PolicyService:
         for k, v in data.items():
             setattr(policy, k, v)
         db.session.commit()
+        _bump_policy_version()
         return policy
 
     @staticmethod
@@ -29,8 +55,145 @@ class PolicyService:
             return False
         db.session.delete(policy)
         db.session.commit()
+        _bump_policy_version()
         return True
 
     @staticmethod
     def list():
-        return Policy.query.all() 
\ No newline at end of file
+        return Policy.query.all() 
+
+    @staticmethod
+    def bundle_version():
+        """
+        Version of the policies OPA decides with, part of every decision
+        cache key.
+
+        ``OPA_BUNDLE_REVISION`` names the revision of an externally built
+        OPA bundle. Without it the version is a digest of the policy table
+        (row count, newest id and newest ``updated_at``), so writes made
+        through other replicas are picked up once ``POLICY_VERSION_TTL``
+        seconds have passed; writes through this replica apply at once.
+        """
+        revision = current_app.config.get('OPA_BUNDLE_REVISION')
+        if revision:
+            return f"opa:{revision}"
+        global _stored_version
+        local_version = _policy_version
+        cached_for, expires_at, digest = _stored_version
+        if cached_for == local_version and time.monotonic() < expires_at:
+            return digest
+        count, max_id, max_updated = db.session.query(
+            func.count(Policy.id), func.max(Policy.id), func.max(Policy.updated_at)
+        ).one()
+        digest = hashlib.sha256(f"{count}:{max_id}:{max_updated}".encode('utf-8')).hexdigest()[:16]
+        _stored_version = (local_version, time.monotonic() + current_app.config.get('POLICY_VERSION_TTL', 5), digest)
+        return digest
+
+class RuleBundleService:
+    @staticmethod
+    def get_bundle(model_type):
+        """Build the rule bundle clients evaluate locally for a model type."""
+        policies = Policy.query.filter_by(model_type=model_type, is_active=True).order_by(Policy.id).all()
+        rules = []
+        for policy in policies:
+            rules.extend(policy.rules or [])
+        bundle = {
+            'model_type': model_type,
+            'rules': rules,
+            # Policies expressed only in Rego still need OPA, and a model
+            # type without policies must not be accepted unchecked
+            'remote_required': not policies or any(not p.rules for p in policies),
+        }
+        canonical = json.dumps(bundle, sort_keys=True, separators=(',', ':'))
+        bundle['version'] = hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:16]
+        return bundle
+
+
+class DecisionService:
+    @staticmethod
+    def cache_key(payload, version=None):
+        canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str)
+        digest = hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+        return (version or PolicyService.bundle_version(), digest)
+
+    @staticmethod
+    def query_opa(payload):
+        """Ask OPA for a decision over the pooled HTTP client"""
+        response = get_http_client().post(
+            current_app.config['OPA_URL'],
+            json={'input': payload},
+            timeout=current_app.config.get('OPA_TIMEOUT', 2),
+            idempotent=True
+        )
+        response.raise_for_status()
+        return bool(response.json().get('result', False))
+
+    @staticmethod
+    def evaluate(payload):
+        """
+        Evaluate one input, using the decision cache.
+
+        Returns:
+            (allowed, cached) tuple
+        """
+        key = DecisionService.cache_key(payload)
+        allowed = _decision_cache.get(key)
+        if allowed is not None:
+            return allowed, True
+        allowed = DecisionService.query_opa(payload)
+        _decision_cache.set(key, allowed, ttl=current_app.config.get('DECISION_CACHE_TTL', 60))
+        return allowed, False
+
+    @staticmethod
+    def evaluate_batch(payloads):
+        """
+        Evaluate many inputs at once. Identical inputs are evaluated once,
+        cached decisions are reused and the remaining OPA queries run
+        concurrently over pooled connections.
+
+        Returns:
+            List of (allowed, error) tuples in input order; error is None
+            on success.
+        """
+        try:
+            version = PolicyService.bundle_version()
+        except Exception as e:
+            return [(False, str(e))] * len(payloads)
+        decisions = {}
+        pending = {}
+        keys = []
+        for index, payload in enumerate(payloads):
+            try:
+                key = DecisionService.cache_key(payload, version)
+            except Exception as e:
+                # Fail this input only, not the whole batch
+                key = ('error', index)
+                decisions[key] = (False, str(e))
+            keys.append(key)
+            if key in decisions or key in pending:
+                continue
+            cached = _decision_cache.get(key)
+            if cached is not None:
+                decisions[key] = (cached, None)
+            else:
+                pending[key] = payload
+
+        if pending:
+            app = current_app._get_current_object()
+            ttl = app.config.get('DECISION_CACHE_TTL', 60)
+
+            def run(item):
+                key, payload = item
+                with app.app_context():
+                    try:
+                        allowed = DecisionService.query_opa(payload)
+                    except Exception as e:
+                        return key, (False, str(e))
+                _decision_cache.set(key, allowed, ttl=ttl)
+                return key, (allowed, None)
+
+            workers = min(len(pending), app.config.get('OPA_BATCH_CONCURRENCY', 8))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                decisions.update(executor.map(run, pending.items()))
+
+        return [decisions[key] for key in keys]
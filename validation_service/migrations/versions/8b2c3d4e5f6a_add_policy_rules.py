@@ -0,0 +1,27 @@
+"""Add model type and declarative rules to policies
+
+Revision ID: 8b2c3d4e5f6a
+Revises: 7a1b2c3d4e5f
+Create Date: 2026-10-19 09:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '8b2c3d4e5f6a'
+down_revision = '7a1b2c3d4e5f'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    with op.batch_alter_table('policy') as batch_op:
+        batch_op.add_column(sa.Column('model_type', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('rules', sa.JSON(), nullable=True))
+        batch_op.create_index('ix_policy_model_type', ['model_type'])
+
+def downgrade():
+    with op.batch_alter_table('policy') as batch_op:
+        batch_op.drop_index('ix_policy_model_type')
+        batch_op.drop_column('rules')
+        batch_op.drop_column('model_type')
@@ -0,0 +1,23 @@
+"""Track when policies change for the decision cache version
+
+Revision ID: 9c3d4e5f6a7b
+Revises: 8b2c3d4e5f6a
+Create Date: 2026-10-19 09:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '9c3d4e5f6a7b'
+down_revision = '8b2c3d4e5f6a'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    with op.batch_alter_table('policy') as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True))
+
+def downgrade():
+    with op.batch_alter_table('policy') as batch_op:
+        batch_op.drop_column('updated_at')
@@ -5,19 +5,42 @@ from app import create_app
 def client():
     app = create_app()
     app.config['TESTING'] = True
+    # Pin the decision cache version; these tests run without a database
+    app.config['OPA_BUNDLE_REVISION'] = 'test'
     with app.test_client() as client:
         yield client
 
+class DummyResponse:
+    status_code = 200
+    def __init__(self, result=True):
+        self.result = result
+    def json(self):
+        return {'result': self.result}
+    def raise_for_status(self):
+        pass
+
 def test_validate_allows_by_default(client, monkeypatch):
-    # Patch requests.post to simulate OPA allow
-    class DummyResponse:
-        def json(self):
-            return {'result': True}
-    monkeypatch.setattr('requests.post', lambda *a, **kw: DummyResponse())
+    # Patch the pooled session to simulate OPA allow
+    monkeypatch.setattr('requests.Session.request', lambda *a, **kw: DummyResponse())
     resp = client.post('/validate', json={"foo": "bar"})
     assert resp.status_code == 200
     assert resp.json['allowed'] is True
 
+def test_validate_batch_dedupes_and_caches(client, monkeypatch):
+    calls = []
+    def fake_request(self, method, url, json=None, **kw):
+        calls.append(json['input'])
+        return DummyResponse(json['input'].get('foo') == 'bar')
+    monkeypatch.setattr('requests.Session.request', fake_request)
+    inputs = [{"foo": "bar"}, {"foo": "baz"}, {"foo": "bar"}]
+    resp = client.post('/validate/batch', json={'inputs': inputs})
+    assert resp.status_code == 200
+    assert [r['allowed'] for r in resp.json['results']] == [True, False, True]
+    assert len(calls) == 2
+    # Identical inputs are served from the decision cache
+    client.post('/validate/batch', json={'inputs': inputs})
+    assert len(calls) == 2
+
 def test_create_policy(client, auth_header):
     resp = client.post('/policies', json={'name': 'Test Policy', 'policy_text': 'allow = true'}, headers=auth_header)
     assert resp.status_code == 201